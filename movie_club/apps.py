@@ -0,0 +1,6 @@
+from django.contrib.staticfiles.apps import StaticFilesConfig
+
+
+class TrackerStaticFilesConfig(StaticFilesConfig):
+    # input.css is Tailwind's build input (README), not something to serve
+    ignore_patterns = [*StaticFilesConfig.ignore_patterns, "input.css"]
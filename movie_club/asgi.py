@@ -11,6 +11,9 @@ import os
 
 from django.core.asgi import get_asgi_application
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'movie_club.settings')
+from movie_club.static_assets import AsyncStaticFilesMiddleware
 
-application = get_asgi_application()
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'movie_club.settings_asgi')
+
+# Serves collected static files itself when STATIC_ROOT is set
+application = AsyncStaticFilesMiddleware(get_asgi_application())
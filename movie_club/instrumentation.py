@@ -0,0 +1,278 @@
+"""
+Opt-in per-request performance instrumentation.
+
+With INSTRUMENTATION_ENABLED set, InstrumentationMiddleware times each
+request and splits it into SQL (through connection.execute_wrapper on every
+database alias) and template rendering (through a timing hook on
+Template._render, counting only the outermost render so included templates
+like _movie_card.html aren't counted twice). It then:
+
+- adds a Server-Timing header, which browser dev tools show per request;
+- logs requests slower than INSTRUMENTATION_SLOW_REQUEST_MS, with the SQL
+  statements that took the most time;
+- adds the timings to per-URL-name histograms, served as JSON to staff at
+  /instrumentation/.
+
+The per-query cost is a clock read and a dict update, so it can stay on
+under load. Histograms live in memory in each worker process and reset on
+restart. Queries run while a StreamingHttpResponse is consumed happen after
+the middleware returns and aren't counted.
+"""
+import bisect
+import contextvars
+import logging
+import os
+import threading
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import JsonResponse
+from django.template.base import Template
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the histogram buckets; the last bucket is everything above
+TIME_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+_current = contextvars.ContextVar("instrumentation_request", default=None)
+
+
+class RequestStats:
+    """What one request spent on SQL and templates. Also the execute wrapper."""
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0.0
+        self.duplicates = 0
+        self.template_time = 0.0
+        self.templates = 0
+        self.render_depth = 0
+        # {sql: [count, seconds]} and hashes of the (sql, params) pairs
+        # seen, for spotting statements run more than once with the same
+        # parameters. Only the hashes are kept: the params can be a JSON
+        # list of thousands of ids (see tracker/facet_index.py).
+        self.statements = {}
+        self._seen = set()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.queries += 1
+            self.sql_time += elapsed
+            statement = self.statements.get(sql)
+            if statement is None:
+                self.statements[sql] = [1, elapsed]
+            else:
+                statement[0] += 1
+                statement[1] += elapsed
+            if not many:
+                key = _fingerprint(sql, params)
+                if key in self._seen:
+                    self.duplicates += 1
+                else:
+                    self._seen.add(key)
+
+    def top_statements(self, limit):
+        """The `limit` statements with the most total time: (sql, count, seconds)."""
+        ranked = sorted(self.statements.items(), key=lambda item: item[1][1], reverse=True)
+        return [(sql, count, seconds) for sql, (count, seconds) in ranked[:limit]]
+
+
+def _fingerprint(sql, params):
+    try:
+        return hash((sql, tuple(params) if isinstance(params, list) else params))
+    except TypeError:
+        # e.g. a dict of named parameters
+        return hash((sql, repr(params)))
+
+
+_original_render = Template._render
+_hook_lock = threading.Lock()
+
+
+def _timed_render(self, context):
+    stats = _current.get()
+    if stats is None:
+        return _original_render(self, context)
+    stats.templates += 1
+    stats.render_depth += 1
+    start = time.perf_counter()
+    try:
+        return _original_render(self, context)
+    finally:
+        stats.render_depth -= 1
+        if not stats.render_depth:
+            stats.template_time += time.perf_counter() - start
+
+
+def _install_template_hook():
+    global _original_render
+    with _hook_lock:
+        if Template._render is not _timed_render:
+            # Wrap whatever is there, e.g. the test runner's own hook
+            _original_render = Template._render
+            Template._render = _timed_render
+
+
+# --- Histograms ---
+
+
+class _Histogram:
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0.0
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.total += value
+
+    def percentile(self, fraction):
+        """The upper bound of the bucket holding `fraction` of the samples."""
+        target = fraction * sum(self.counts)
+        running = 0
+        for i, count in enumerate(self.counts):
+            running += count
+            if running >= target and count:
+                return self.bounds[i] if i < len(self.bounds) else None
+        return None
+
+    def as_dict(self):
+        samples = sum(self.counts)
+        return {
+            # {upper bound: samples}, Prometheus style but not cumulative
+            "buckets": {
+                str(bound): count for bound, count in zip((*self.bounds, "+Inf"), self.counts)
+            },
+            "mean": round(self.total / samples, 2) if samples else None,
+            "p50_le": self.percentile(0.5),
+            "p95_le": self.percentile(0.95),
+        }
+
+
+class _ViewTimings:
+    def __init__(self):
+        self.requests = 0
+        self.slow = 0
+        self.duplicates = 0
+        self.total_ms = _Histogram(TIME_BUCKETS_MS)
+        self.sql_ms = _Histogram(TIME_BUCKETS_MS)
+        self.template_ms = _Histogram(TIME_BUCKETS_MS)
+        self.queries = _Histogram(QUERY_BUCKETS)
+
+    def as_dict(self):
+        return {
+            "requests": self.requests,
+            "slow": self.slow,
+            "duplicate_queries": self.duplicates,
+            "total_ms": self.total_ms.as_dict(),
+            "sql_ms": self.sql_ms.as_dict(),
+            "template_ms": self.template_ms.as_dict(),
+            "queries": self.queries.as_dict(),
+        }
+
+
+_timings = {}
+_timings_lock = threading.Lock()
+
+
+def record(view_name, total_ms, stats, slow):
+    with _timings_lock:
+        timings = _timings.get(view_name)
+        if timings is None:
+            timings = _timings[view_name] = _ViewTimings()
+        timings.requests += 1
+        timings.slow += slow
+        timings.duplicates += stats.duplicates
+        timings.total_ms.add(total_ms)
+        timings.sql_ms.add(stats.sql_time * 1000)
+        timings.template_ms.add(stats.template_time * 1000)
+        timings.queries.add(stats.queries)
+
+
+def snapshot():
+    with _timings_lock:
+        return {name: timings.as_dict() for name, timings in sorted(_timings.items())}
+
+
+def reset():
+    with _timings_lock:
+        _timings.clear()
+
+
+# --- Middleware ---
+
+
+class InstrumentationMiddleware:
+    def __init__(self, get_response):
+        if not getattr(settings, "INSTRUMENTATION_ENABLED", False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.slow_ms = getattr(settings, "INSTRUMENTATION_SLOW_REQUEST_MS", 500)
+        self.slow_statements = getattr(settings, "INSTRUMENTATION_SLOW_REQUEST_STATEMENTS", 3)
+        _install_template_hook()
+
+    def __call__(self, request):
+        stats = RequestStats()
+        token = _current.set(stats)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(stats))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        total_ms = (time.perf_counter() - start) * 1000
+        sql_ms = stats.sql_time * 1000
+        template_ms = stats.template_time * 1000
+
+        response["Server-Timing"] = ", ".join([
+            f'sql;dur={sql_ms:.1f};desc="{stats.queries} queries, {stats.duplicates} duplicates"',
+            f'tpl;dur={template_ms:.1f};desc="{stats.templates} templates"',
+            f"app;dur={max(total_ms - sql_ms - template_ms, 0):.1f}",
+            f"total;dur={total_ms:.1f}",
+        ])
+
+        match = request.resolver_match
+        view_name = match.view_name if match else "<unresolved>"
+        slow = total_ms >= self.slow_ms
+        if slow:
+            logger.warning(
+                "Slow request %s %s (%s): %.0f ms, %d queries (%d duplicates) in %.0f ms, templates %.0f ms%s",
+                request.method,
+                request.path,
+                view_name,
+                total_ms,
+                stats.queries,
+                stats.duplicates,
+                sql_ms,
+                template_ms,
+                "".join(
+                    f"\n  {seconds * 1000:.1f} ms over {count}x: {sql}"
+                    for sql, count, seconds in stats.top_statements(self.slow_statements)
+                ),
+            )
+        record(view_name, total_ms, stats, slow)
+        return response
+
+
+@staff_member_required
+def instrumentation_data(request):
+    """The per-URL-name histograms collected by this worker process."""
+    if request.method == "POST" and request.POST.get("reset"):
+        reset()
+    return JsonResponse({
+        "enabled": getattr(settings, "INSTRUMENTATION_ENABLED", False),
+        "pid": os.getpid(),
+        "slow_request_ms": getattr(settings, "INSTRUMENTATION_SLOW_REQUEST_MS", 500),
+        "views": snapshot(),
+    })
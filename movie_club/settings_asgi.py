@@ -0,0 +1,19 @@
+"""
+ASGI deployment profile: the base settings, with the grid, detail and
+suggest pages served by their async views (tracker/async_views.py).
+
+Run under an ASGI server, e.g.
+
+    uvicorn movie_club.asgi:application --workers 4
+
+movie_club/asgi.py uses this profile unless DJANGO_SETTINGS_MODULE says
+otherwise. Compare it against WSGI with `manage.py benchmark_concurrency`.
+"""
+
+from .settings import *  # noqa: F401,F403
+
+TRACKER_ASYNC_VIEWS = True
+
+# The instrumentation middleware is sync-only; left enabled under ASGI it
+# moves every request onto a thread and gives up the async views' gains.
+INSTRUMENTATION_ENABLED = False
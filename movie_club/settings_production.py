@@ -0,0 +1,96 @@
+"""
+Production database profile: the base settings, with SQLite set up for
+several worker processes reading and writing at once.
+
+Every new connection runs the PRAGMAs below (through the backend's
+init_command option):
+
+- journal_mode=WAL: readers don't block the writer or each other, and a
+  commit appends to the write-ahead log rather than rewriting pages.
+- synchronous=NORMAL: in WAL mode a power cut can lose the last commits but
+  can't corrupt the database, and commits stop waiting on an fsync.
+- cache_size and mmap_size: a bigger page cache per connection, and reads
+  straight from the memory-mapped file instead of copies.
+- temp_store=MEMORY: sorts and temporary indexes stay off disk.
+
+Transactions start with BEGIN IMMEDIATE, so a transaction that will write
+takes the write lock up front. Under the default (DEFERRED) two of them can
+each hold a read lock and both fail to upgrade with "database is locked"
+whatever the timeout; this way the second one waits, for up to
+SQLITE_BUSY_TIMEOUT seconds.
+
+Run with DJANGO_SETTINGS_MODULE=movie_club.settings_production, e.g.
+
+    WEB_CONCURRENCY=4 gunicorn movie_club.wsgi --env DJANGO_SETTINGS_MODULE=movie_club.settings_production
+
+gunicorn starts WEB_CONCURRENCY workers, and TRACKER_WORKER_PROCESSES is
+read from it too, so the system checks (run by migrate, or `manage.py
+check`) refuse a per-process facet or card cache. The workers share one
+through files under BASE_DIR/cache, which is also where `manage.py
+card_cache_stats` finds their hit and miss counts.
+
+`manage.py explain_views` shows which indexes the views' queries use.
+
+Static files are collected into STATIC_ROOT with hashed names, a pruned
+Tailwind stylesheet and precompressed copies, and wsgi.py/asgi.py serve them
+from there (see movie_club/static_assets.py). Run collectstatic before
+starting, and again on every deploy:
+
+    DJANGO_SETTINGS_MODULE=movie_club.settings_production python manage.py collectstatic --noinput
+"""
+
+import os
+
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR, CACHES, DATABASES, INSTALLED_APPS
+
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    # Negative means KiB: 64 MiB per connection
+    "cache_size": -64 * 1024,
+    "mmap_size": 256 * 1024 * 1024,
+    "temp_store": "MEMORY",
+}
+SQLITE_BUSY_TIMEOUT = 20
+
+DATABASES['default'] = {
+    **DATABASES['default'],
+    'OPTIONS': {
+        'init_command': ';'.join(f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items()),
+        'transaction_mode': 'IMMEDIATE',
+        'timeout': SQLITE_BUSY_TIMEOUT,
+    },
+}
+
+# Shared by every worker on this machine; use Memcached or Redis once the
+# workers span machines
+CACHES = {
+    **CACHES,
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+TRACKER_FACET_CACHE = 'shared'
+TRACKER_CARD_CACHE = 'shared'
+TRACKER_WORKER_PROCESSES = int(os.environ.get('WEB_CONCURRENCY', 2))
+
+# The hashed static file names are only used with DEBUG off
+DEBUG = False
+# Add the site's host name
+ALLOWED_HOSTS = ['localhost', '127.0.0.1']
+
+INSTALLED_APPS = [
+    'movie_club.apps.TrackerStaticFilesConfig' if app == 'django.contrib.staticfiles' else app
+    for app in INSTALLED_APPS
+]
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'movie_club.static_assets.PrecompressedManifestStorage'},
+}
+# Stylesheets to prune, and the files whose class names they must keep
+STATIC_PRUNE_CSS = ['css/tailwind.css']
+STATIC_PRUNE_SOURCES = [BASE_DIR / 'tracker' / 'templates', BASE_DIR / 'tracker' / 'forms.py']
@@ -0,0 +1,37 @@
+"""
+Read replica profile: the production profile, with the grid, detail,
+suggest and export pages reading from a replica (see tracker/replicas.py).
+
+The replica here is a second SQLite file, a copy of the primary that
+`manage.py refresh_replicas` writes. Make the first copy before starting
+the server, then keep refreshing it, e.g.
+
+    DJANGO_SETTINGS_MODULE=movie_club.settings_replica python manage.py refresh_replicas --interval 5
+
+For more replicas, add aliases to DATABASES and TRACKER_READ_REPLICAS. Keep
+TRACKER_REPLICA_STICKY_SECONDS above the refresh interval, so members keep
+reading the primary until the replicas have their writes.
+"""
+
+from .settings_production import *  # noqa: F401,F403
+from .settings_production import BASE_DIR, DATABASES, MIDDLEWARE, SQLITE_PRAGMAS
+
+DATABASES['replica'] = {
+    'ENGINE': 'django.db.backends.sqlite3',
+    'NAME': BASE_DIR / 'db.replica.sqlite3',
+    'OPTIONS': {
+        # Nothing but the refresher writes here, and not through Django
+        'init_command': ';'.join([
+            'PRAGMA query_only=ON',
+            *(f'PRAGMA {name}={SQLITE_PRAGMAS[name]}' for name in ('cache_size', 'mmap_size', 'temp_store')),
+        ]),
+    },
+    # Tests read the primary through the alias instead of a copy
+    'TEST': {'MIRROR': 'default'},
+}
+
+DATABASE_ROUTERS = ['tracker.replicas.ReplicaRouter']
+MIDDLEWARE = [*MIDDLEWARE, 'tracker.replicas.ReplicaMiddleware']
+
+TRACKER_READ_REPLICAS = ['replica']
+TRACKER_REPLICA_STICKY_SECONDS = 15
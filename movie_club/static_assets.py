@@ -0,0 +1,458 @@
+"""
+Static files for production: collected once with content-hashed names and
+precompressed copies, then served straight from STATIC_ROOT by the WSGI or
+ASGI entry point with far-future cache headers.
+
+PrecompressedManifestStorage (the staticfiles storage in the production
+profile) does three things during `manage.py collectstatic`:
+
+- prunes the stylesheets in STATIC_PRUNE_CSS: rules whose classes appear
+  nowhere in the STATIC_PRUNE_SOURCES files (the templates, and forms.py
+  for its widget classes) are dropped, then the custom properties nothing
+  reads any more, and what's left is written without comments or
+  indentation. Like Tailwind's own source scanning, a class built at
+  runtime from pieces isn't seen; write class names out in full;
+- hashes file names, like ManifestStaticFilesStorage, so
+  {% static 'css/tailwind.css' %} renders e.g. css/tailwind.3f2a1b9c0d4e.css
+  and a changed file gets a new URL;
+- writes a .gz copy of every text file next to it, and a .zst copy too
+  when a zstd module is available (Python 3.14's compression.zstd, or the
+  zstandard package).
+
+StaticFilesMiddleware and AsyncStaticFilesMiddleware wrap the application
+in wsgi.py and asgi.py. For a GET or HEAD under STATIC_URL they send the
+smallest copy the client's Accept-Encoding allows. Hashed names get
+`Cache-Control: public, max-age=31536000, immutable`, so a repeat visit
+doesn't ask for them again; unhashed names are revalidated with
+If-Modified-Since. Anything not found falls through to Django. They do
+nothing without STATIC_ROOT, as in development, where runserver serves
+static files itself.
+"""
+import gzip
+import mimetypes
+import os
+import re
+from pathlib import Path
+from urllib.parse import unquote, urlsplit
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.base import ContentFile
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_http_date_safe
+
+try:
+    from compression import zstd
+except ImportError:
+    try:
+        import zstandard as zstd
+    except ImportError:
+        zstd = None
+
+COMPRESSIBLE_EXTENSIONS = {".css", ".js", ".mjs", ".map", ".json", ".svg", ".txt", ".html", ".xml"}
+SOURCE_EXTENSIONS = {".html", ".txt", ".py", ".js"}
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "public, max-age=0, must-revalidate"
+# Preferred first
+ENCODINGS = (("zstd", ".zst"), ("gzip", ".gz"))
+CHUNK_SIZE = 64 * 1024
+
+
+# --- Pruning ---
+
+
+def _parse_css(css):
+    """
+    CSS as a list of nodes: a statement or declaration is a string, a block
+    is [prelude, nodes]. Comments are dropped except /*! licences */, and
+    runs of whitespace outside strings become one space.
+    """
+    root = []
+    stack = [root]
+    buf = []
+    parens = 0
+
+    def flush():
+        text = "".join(buf).strip()
+        buf.clear()
+        return text
+
+    i = 0
+    while i < len(css):
+        char = css[i]
+        if char in "\"'":
+            end = i + 1
+            while end < len(css) and css[end] != char:
+                end += 2 if css[end] == "\\" else 1
+            buf.append(css[i:end + 1])
+            i = end + 1
+            continue
+        if css.startswith("/*", i):
+            end = css.find("*/", i + 2)
+            end = len(css) if end < 0 else end + 2
+            if css.startswith("/*!", i):
+                stack[-1].append(css[i:end])
+            i = end
+            continue
+        if char == "\\":
+            buf.append(css[i:i + 2])
+            i += 2
+            continue
+        if char == "(":
+            parens += 1
+        elif char == ")":
+            parens -= 1
+        if char == "{":
+            block = [flush(), []]
+            stack[-1].append(block)
+            stack.append(block[1])
+        elif char == "}":
+            if text := flush():
+                stack[-1].append(text)
+            if len(stack) > 1:
+                stack.pop()
+        elif char == ";" and not parens:
+            if text := flush():
+                stack[-1].append(text)
+        elif char.isspace():
+            if buf and buf[-1] != " ":
+                buf.append(" ")
+        else:
+            buf.append(char)
+        i += 1
+    if text := flush():
+        root.append(text)
+    return root
+
+
+def _serialize_css(nodes):
+    parts = []
+    for node in nodes:
+        if isinstance(node, list):
+            parts.append(f"{node[0]}{{{_serialize_css(node[1])}}}")
+        elif node.startswith(("/*", "@")):
+            parts.append(node if node.startswith("/*") else f"{node};")
+        else:
+            name, _, value = node.partition(":")
+            parts.append(f"{name.strip()}:{value.strip()};")
+    return "".join(parts)
+
+
+CLASS_RE = re.compile(r"\.(-?(?:\\[0-9a-fA-F]{1,6} ?|\\.|[\w-])+)")
+CSS_ESCAPE_RE = re.compile(r"\\([0-9a-fA-F]{1,6}) ?|\\(.)")
+CUSTOM_PROPERTY_RE = re.compile(r"--[\w-]+")
+
+
+def _unescape(name):
+    return CSS_ESCAPE_RE.sub(lambda m: chr(int(m[1], 16)) if m[1] else m[2], name)
+
+
+def class_candidates(paths):
+    """
+    Every string in the files under `paths` that could be a class name:
+    the pieces between quotes, whitespace and template tag braces, and
+    those pieces split again at commas and parentheses.
+    """
+    candidates = set()
+    for path in map(Path, paths):
+        files = [path] if path.is_file() else sorted(path.rglob("*"))
+        for file in files:
+            if file.suffix not in SOURCE_EXTENSIONS or not file.is_file():
+                continue
+            for token in re.split(r"[\s\"'`<>={}]+", file.read_text(errors="replace")):
+                candidates.add(token)
+                candidates.update(re.split(r"[,;()]+", token))
+    candidates.discard("")
+    return candidates
+
+
+def _prune_rules(nodes, candidates):
+    """Drop style rules none of whose selectors' classes are used; True if any remain."""
+    kept = []
+    for node in nodes:
+        if isinstance(node, list):
+            prelude, children = node
+            if not prelude.startswith("@"):
+                classes = {_unescape(name) for name in CLASS_RE.findall(prelude)}
+                if classes and not classes & candidates:
+                    continue
+            if children and not _prune_rules(children, candidates):
+                continue
+        kept.append(node)
+    nodes[:] = kept
+    return bool(kept)
+
+
+def _is_definition_site(prelude):
+    return prelude.startswith(("@layer theme", "@layer properties", "@property "))
+
+
+def _prune_custom_properties(nodes, candidates):
+    """
+    Drop the theme variables, @property rules and fallback declarations
+    of custom properties that nothing else in the stylesheet (or the
+    sources) mentions.
+    """
+    definitions = {}
+    used = {token for token in candidates if token.startswith("--")}
+
+    def collect(nodes, defining):
+        for node in nodes:
+            if isinstance(node, list):
+                prelude, children = node
+                if prelude.startswith("@property "):
+                    definitions.setdefault(prelude.split()[1], "")
+                elif _is_definition_site(prelude):
+                    collect(children, True)
+                else:
+                    used.update(CUSTOM_PROPERTY_RE.findall(prelude))
+                    collect(children, defining)
+            elif defining and node.startswith("--"):
+                name, _, value = node.partition(":")
+                definitions[name.strip()] = definitions.get(name.strip(), "") + value
+            else:
+                used.update(CUSTOM_PROPERTY_RE.findall(node))
+
+    collect(nodes, False)
+    # Theme variables refer to each other, e.g. --default-font-family
+    pending = list(used)
+    while pending:
+        for name in CUSTOM_PROPERTY_RE.findall(definitions.get(pending.pop(), "")):
+            if name not in used:
+                used.add(name)
+                pending.append(name)
+    unused = definitions.keys() - used
+
+    def prune(nodes, defining):
+        kept = []
+        for node in nodes:
+            if isinstance(node, list):
+                prelude, children = node
+                if prelude.startswith("@property ") and prelude.split()[1] in unused:
+                    continue
+                inner = defining or _is_definition_site(prelude)
+                prune(children, inner)
+                if inner and not children:
+                    continue
+            elif defining and node.split(":", 1)[0].strip() in unused:
+                continue
+            kept.append(node)
+        nodes[:] = kept
+
+    prune(nodes, False)
+
+
+def prune_css(css, candidates):
+    """`css` minus the rules and custom properties `candidates` don't use, minified."""
+    nodes = _parse_css(css)
+    _prune_rules(nodes, candidates)
+    _prune_custom_properties(nodes, candidates)
+    return _serialize_css(nodes)
+
+
+# --- Collecting ---
+
+
+def _compress(data):
+    yield ".gz", gzip.compress(data, compresslevel=9, mtime=0)
+    if zstd is not None:
+        yield ".zst", zstd.compress(data, 19)
+
+
+class PrecompressedManifestStorage(ManifestStaticFilesStorage):
+    """Hashed names, pruned stylesheets and .gz/.zst copies; see the module docstring."""
+
+    def post_process(self, paths, dry_run=False, **options):
+        if dry_run:
+            return
+        pruned = self._prune(paths)
+        # The hashes are taken over the pruned copies
+        paths = {**paths, **{path: (self, path) for path in pruned}}
+        written = set()
+        for name, hashed_name, processed in super().post_process(paths, dry_run, **options):
+            if not isinstance(processed, Exception):
+                written.update((name, hashed_name))
+            yield name, hashed_name, processed
+        for name in sorted(written):
+            if os.path.splitext(name)[1] in COMPRESSIBLE_EXTENSIONS:
+                self._write_compressed(name)
+
+    def _prune(self, paths):
+        targets = [path for path in getattr(settings, "STATIC_PRUNE_CSS", ()) if path in paths]
+        if not targets:
+            return []
+        candidates = class_candidates(getattr(settings, "STATIC_PRUNE_SOURCES", ()))
+        for path in targets:
+            with self.open(path) as original:
+                css = original.read().decode()
+            self.delete(path)
+            self._save(path, ContentFile(prune_css(css, candidates).encode()))
+        return targets
+
+    def _write_compressed(self, name):
+        with self.open(name) as original:
+            data = original.read()
+        for suffix, compressed in _compress(data):
+            target = name + suffix
+            if self.exists(target):
+                self.delete(target)
+            # Not worth a request header's worth of bytes otherwise
+            if len(compressed) < len(data):
+                self._save(target, ContentFile(compressed))
+
+
+# --- Serving ---
+
+
+class _StaticFiles:
+    """Looks requests under STATIC_URL up in STATIC_ROOT."""
+
+    def __init__(self):
+        self.root = settings.STATIC_ROOT and str(settings.STATIC_ROOT)
+        self.prefix = urlsplit(settings.STATIC_URL or "").path
+        self.immutable = set(getattr(staticfiles_storage, "hashed_files", {}).values())
+        # {name: [(encoding, path, size), ...] or None, mtime}; collectstatic
+        # runs before a restart, so files are looked up once per process
+        self._found = {}
+
+    def enabled(self):
+        return bool(self.root and self.prefix)
+
+    def handles(self, method, path):
+        return method in ("GET", "HEAD") and path.startswith(self.prefix)
+
+    def _variants(self, name):
+        if name not in self._found:
+            try:
+                path = safe_join(self.root, name)
+            except (SuspiciousFileOperation, ValueError):
+                path = None
+            variants, mtime = [], None
+            if path and os.path.isfile(path):
+                mtime = int(os.stat(path).st_mtime)
+                for encoding, suffix in ENCODINGS:
+                    if os.path.isfile(path + suffix):
+                        variants.append((encoding, path + suffix, os.stat(path + suffix).st_size))
+                variants.append((None, path, os.stat(path).st_size))
+            self._found[name] = (variants, mtime)
+        return self._found[name]
+
+    def respond(self, path, accept_encoding, if_modified_since):
+        """(status, headers, file path or None), or None to let Django answer."""
+        name = unquote(path[len(self.prefix):])
+        variants, mtime = self._variants(name)
+        if not variants:
+            return None
+        accepted = _accepted_encodings(accept_encoding)
+        encoding, file_path, size = next(v for v in variants if v[0] is None or v[0] in accepted)
+
+        content_type, _ = mimetypes.guess_type(name)
+        content_type = content_type or "application/octet-stream"
+        if content_type.startswith("text/") or content_type in ("application/javascript", "application/json"):
+            content_type += "; charset=utf-8"
+        headers = [("Content-Type", content_type)]
+        if len(variants) > 1:
+            headers.append(("Vary", "Accept-Encoding"))
+        if name in self.immutable:
+            headers.append(("Cache-Control", IMMUTABLE))
+        else:
+            headers.append(("Cache-Control", REVALIDATE))
+            headers.append(("Last-Modified", http_date(mtime)))
+            since = parse_http_date_safe(if_modified_since) if if_modified_since else None
+            if since is not None and since >= mtime:
+                return 304, headers, None
+        if encoding:
+            headers.append(("Content-Encoding", encoding))
+        headers.append(("Content-Length", str(size)))
+        return 200, headers, file_path
+
+
+def _accepted_encodings(header):
+    accepted = set()
+    for part in (header or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        quality = params.strip()
+        if quality.startswith("q="):
+            try:
+                if float(quality[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        coding = coding.strip().lower()
+        accepted.update(name for name, _ in ENCODINGS if coding in (name, "*"))
+    return accepted
+
+
+def _read_chunks(path):
+    with open(path, "rb") as file:
+        while chunk := file.read(CHUNK_SIZE):
+            yield chunk
+
+
+class StaticFilesMiddleware:
+    """WSGI wrapper serving collected static files; see the module docstring."""
+
+    def __init__(self, application):
+        self.application = application
+        self.files = _StaticFiles()
+
+    def __call__(self, environ, start_response):
+        method, path = environ["REQUEST_METHOD"], environ.get("PATH_INFO", "")
+        if not (self.files.enabled() and self.files.handles(method, path)):
+            return self.application(environ, start_response)
+        found = self.files.respond(
+            path, environ.get("HTTP_ACCEPT_ENCODING"), environ.get("HTTP_IF_MODIFIED_SINCE")
+        )
+        if found is None:
+            return self.application(environ, start_response)
+        status, headers, file_path = found
+        start_response("200 OK" if status == 200 else "304 Not Modified", headers)
+        if file_path is None or method == "HEAD":
+            return []
+        if "wsgi.file_wrapper" in environ:
+            return environ["wsgi.file_wrapper"](open(file_path, "rb"), CHUNK_SIZE)
+        return _read_chunks(file_path)
+
+
+class AsyncStaticFilesMiddleware:
+    """ASGI wrapper serving collected static files; see the module docstring."""
+
+    def __init__(self, application):
+        self.application = application
+        self.files = _StaticFiles()
+
+    async def __call__(self, scope, receive, send):
+        if not (
+            scope["type"] == "http"
+            and self.files.enabled()
+            and self.files.handles(scope["method"], scope["path"])
+        ):
+            return await self.application(scope, receive, send)
+        request_headers = {name.decode("latin-1").lower(): value.decode("latin-1") for name, value in scope["headers"]}
+        found = await sync_to_async(self.files.respond, thread_sensitive=False)(
+            scope["path"],
+            request_headers.get("accept-encoding"),
+            request_headers.get("if-modified-since"),
+        )
+        if found is None:
+            return await self.application(scope, receive, send)
+        status, headers, file_path = found
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers],
+        })
+        if file_path is None or scope["method"] == "HEAD":
+            await send({"type": "http.response.body", "body": b""})
+            return
+        read = sync_to_async(lambda file: file.read(CHUNK_SIZE), thread_sensitive=False)
+        with open(file_path, "rb") as file:
+            chunk = await read(file)
+            while True:
+                following = await read(file)
+                await send({"type": "http.response.body", "body": chunk, "more_body": bool(following)})
+                if not following:
+                    break
+                chunk = following
@@ -5,10 +5,13 @@ from django.urls import path, include
 from django.views.generic import RedirectView
 from django.contrib.auth import views as auth_views
 
+from .instrumentation import instrumentation_data
+
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("accounts/login/", auth_views.LoginView.as_view(template_name="registration/login.html"), name="login"),
     path("accounts/logout/", auth_views.LogoutView.as_view(), name="logout"),
+    path("instrumentation/", instrumentation_data, name="instrumentation_data"),
     path("", RedirectView.as_view(url="/movies/", permanent=True)),
     path("", include("tracker.urls")),
 ]
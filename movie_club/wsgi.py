@@ -11,6 +11,9 @@ import os
 
 from django.core.wsgi import get_wsgi_application
 
+from movie_club.static_assets import StaticFilesMiddleware
+
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'movie_club.settings')
 
-application = get_wsgi_application()
+# Serves collected static files itself when STATIC_ROOT is set
+application = StaticFilesMiddleware(get_wsgi_application())
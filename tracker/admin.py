@@ -1,6 +1,105 @@
-from django.contrib import admin
+from django import forms
+from django.conf import settings
+from django.contrib import admin, messages
+from django.contrib.admin import helpers
+from django.contrib.admin.widgets import AutocompleteSelect
 from django.contrib.auth.models import User
-from .models import Category, StreamingService, Movie, Viewing
+from django.core.paginator import Paginator
+from django.db import connection, transaction
+from django.db.models import Max
+from django.template.response import TemplateResponse
+from django.utils.functional import cached_property
+from .models import Category, StreamingService, Movie, MovieCredit, Person, Viewing
+from .search import fts_query, matching_ids_sql
+
+# Links added or removed per statement by the bulk link action
+LINK_BATCH_SIZE = 500
+
+
+# -----------------------------
+# Changelist scaling helpers
+# -----------------------------
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator for large changelists. An unfiltered changelist's count is
+    estimated from the table (the planner's row estimate on PostgreSQL, the
+    highest id elsewhere) rather than a COUNT(*) over every row. Filtered
+    and small lists still get the exact count. Use with
+    show_full_result_count = False, which drops the second, unfiltered count.
+    """
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, "query", None)
+        if query is None or query.where or query.distinct or query.combinator:
+            return super().count
+        estimate = _estimated_rows(self.object_list.model)
+        exact_below = getattr(settings, "TRACKER_ADMIN_EXACT_COUNT_BELOW", 10000)
+        if estimate is None or estimate < exact_below:
+            return super().count
+        return estimate
+
+
+def _estimated_rows(model):
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT reltuples FROM pg_class WHERE oid = %s::regclass", [model._meta.db_table])
+            row = cursor.fetchone()
+        # -1 until the table has been vacuumed or analyzed
+        return int(row[0]) if row and row[0] >= 0 else None
+    # Ids are never reused, so this over-counts only by the deleted rows
+    return model._default_manager.aggregate(highest=Max("pk"))["highest"] or 0
+
+
+class AutocompleteFilter(admin.FieldListFilter):
+    """
+    A foreign key filter chosen with the admin's autocomplete widget rather
+    than a sidebar link per related object, for relations with too many
+    rows to list. Use as list_filter = [("movie", AutocompleteFilter)]; the
+    related model's admin needs search_fields, and the ModelAdmin needs
+    AutocompleteFilterMixin for the widget's scripts.
+    """
+
+    template = "admin/tracker/autocomplete_filter.html"
+
+    def __init__(self, field, request, params, model, model_admin, field_path):
+        self.lookup_kwarg = f"{field_path}__{field.target_field.attname}__exact"
+        super().__init__(field, request, params, model, model_admin, field_path)
+        values = self.used_parameters.get(self.lookup_kwarg) or []
+        self.value = values[-1] if values else None
+
+        choice_field = forms.ModelChoiceField(
+            field.remote_field.model._default_manager.all(),
+            widget=AutocompleteSelect(field, model_admin.admin_site),
+            required=False,
+        )
+        self.widget_id = f"autocomplete-filter-{field_path}"
+        self.rendered_widget = choice_field.widget.render(
+            self.lookup_kwarg, self.value, attrs={"id": self.widget_id, "style": "width: 100%"}
+        )
+
+    def expected_parameters(self):
+        return [self.lookup_kwarg]
+
+    def get_facet_counts(self, pk_attname, filtered_qs):
+        # Counting per related object is what this filter avoids
+        return {}
+
+    def choices(self, changelist):
+        self.clear_query_string = changelist.get_query_string(remove=[self.lookup_kwarg])
+        yield {
+            "selected": self.value is None,
+            "query_string": self.clear_query_string,
+            "display": "All",
+        }
+
+
+class AutocompleteFilterMixin:
+    """Adds the autocomplete widget's scripts to the changelist."""
+
+    @property
+    def media(self):
+        return super().media + AutocompleteSelect(None, self.admin_site).media
 
 
 # -----------------------------
@@ -16,11 +115,44 @@ class ViewingInline(admin.TabularInline):
     show_change_link = True
 
 
+# -----------------------------
+# Credits Inline for MovieAdmin
+# -----------------------------
+class MovieCreditInline(admin.TabularInline):
+    """
+    Read-only view of the parsed credits; edit the starring/director/writer
+    fields on the movie itself and the credits are rebuilt on save.
+    """
+    model = MovieCredit
+    extra = 0
+    fields = ("role", "person", "order")
+    readonly_fields = ("role", "person", "order")
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
 # -----------------------------
 # Movie Admin
 # -----------------------------
+class EditLinksForm(forms.Form):
+    add_categories = forms.ModelMultipleChoiceField(
+        Category.objects.all(), required=False, widget=forms.CheckboxSelectMultiple
+    )
+    remove_categories = forms.ModelMultipleChoiceField(
+        Category.objects.all(), required=False, widget=forms.CheckboxSelectMultiple
+    )
+    add_streaming_services = forms.ModelMultipleChoiceField(
+        StreamingService.objects.all(), required=False, widget=forms.CheckboxSelectMultiple
+    )
+    remove_streaming_services = forms.ModelMultipleChoiceField(
+        StreamingService.objects.all(), required=False, widget=forms.CheckboxSelectMultiple
+    )
+
+
 @admin.register(Movie)
-class MovieAdmin(admin.ModelAdmin):
+class MovieAdmin(AutocompleteFilterMixin, admin.ModelAdmin):
     list_display = (
         "title",
         "year",
@@ -28,17 +160,70 @@ class MovieAdmin(admin.ModelAdmin):
         "display_categories",
         "display_streaming_services",
     )
-    list_filter = ("categories", "streaming_services", "recommended_by")
-    search_fields = ("title", "director", "writer", "starring")
+    list_filter = ("categories", "streaming_services", ("recommended_by", AutocompleteFilter))
+    list_select_related = ("recommended_by",)
+    search_fields = ("title", "^people__name")
     ordering = ("title",)
-    inlines = [ViewingInline]
+    inlines = [MovieCreditInline, ViewingInline]
     autocomplete_fields = ("recommended_by", "categories", "streaming_services")
+    actions = ["edit_links"]
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        # display_categories/display_streaming_services read these
+        return super().get_queryset(request).prefetch_related("categories", "streaming_services")
+
+    @admin.action(description="Add or remove categories and streaming services")
+    def edit_links(self, request, queryset):
+        """
+        Change the selected movies' categories and streaming services. Each
+        category or service is added to (or removed from) all of them at
+        once from its own side of the relation, so the queries and the
+        m2m_changed receivers run per category/service, not per movie.
+        """
+        form = EditLinksForm(request.POST if "apply" in request.POST else None)
+        if form.is_valid():
+            movie_ids = list(queryset.values_list("pk", flat=True))
+            changes = [
+                (form.cleaned_data["add_categories"], "add"),
+                (form.cleaned_data["remove_categories"], "remove"),
+                (form.cleaned_data["add_streaming_services"], "add"),
+                (form.cleaned_data["remove_streaming_services"], "remove"),
+            ]
+            with transaction.atomic():
+                for objects, method in changes:
+                    for obj in objects:
+                        for start in range(0, len(movie_ids), LINK_BATCH_SIZE):
+                            getattr(obj.movies, method)(*movie_ids[start:start + LINK_BATCH_SIZE])
+            self.message_user(
+                request, f"Updated the categories and streaming services of {len(movie_ids)} movies.", messages.SUCCESS
+            )
+            return None
+
+        return TemplateResponse(request, "admin/tracker/movie/edit_links.html", {
+            **self.admin_site.each_context(request),
+            "title": "Edit categories and streaming services",
+            "opts": self.model._meta,
+            "form": form,
+            "movies": queryset,
+            "action_checkbox_name": helpers.ACTION_CHECKBOX_NAME,
+            "selected": request.POST.getlist(helpers.ACTION_CHECKBOX_NAME),
+            "select_across": request.POST.get("select_across", "0"),
+        })
 
     def display_categories(self, obj):
         return ", ".join([c.name for c in obj.categories.all()])
 
     display_categories.short_description = "Categories"
 
+    def get_search_results(self, request, queryset, search_term):
+        # Full-text (FTS5) prefix search over titles, descriptions, people
+        # and comments instead of LIKE '%term%' scans
+        if not fts_query(search_term):
+            return super().get_search_results(request, queryset, search_term)
+        return queryset.filter(pk__in=matching_ids_sql(search_term)), False
+
     def display_streaming_services(self, obj):
         return ", ".join([s.name for s in obj.streaming_services.all()])
 
@@ -49,15 +234,27 @@ class MovieAdmin(admin.ModelAdmin):
 # Viewing Admin
 # -----------------------------
 @admin.register(Viewing)
-class ViewingAdmin(admin.ModelAdmin):
+class ViewingAdmin(AutocompleteFilterMixin, admin.ModelAdmin):
     list_display = ("user", "movie", "watched_on", "rating", "comment", "created_at")
-    list_filter = ("watched_on", "rating", "movie", "user")
+    list_filter = ("watched_on", "rating", ("movie", AutocompleteFilter), ("user", AutocompleteFilter))
+    list_select_related = ("user", "movie")
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     search_fields = ("movie__title", "user__username", "comment")
     autocomplete_fields = ("user", "movie")
     readonly_fields = ("created_at",)
     ordering = ("-created_at",)
 
 
+# -----------------------------
+# Person Admin
+# -----------------------------
+@admin.register(Person)
+class PersonAdmin(admin.ModelAdmin):
+    list_display = ("name",)
+    search_fields = ("^name",)
+
+
 # -----------------------------
 # Category Admin
 # -----------------------------
@@ -3,3 +3,8 @@ from django.apps import AppConfig
 
 class TrackerConfig(AppConfig):
     name = 'tracker'
+
+    def ready(self):
+        # Connect the receivers that keep the caches and indexes current, and
+        # register the system checks
+        from . import cards, checks, facet_index, facets, ratings, recommender, search, similarity, stats, thumbnails  # noqa: F401
@@ -0,0 +1,107 @@
+"""
+Async versions of the read-heavy views (the grid, the detail page and the
+suggest page), served in place of the ones in views.py when
+TRACKER_ASYNC_VIEWS is set, as the ASGI profile (movie_club/settings_asgi.py)
+does. They share views.py's helpers and filters.py, so both render the same
+pages.
+
+Django runs sync ORM and helper calls from async code on one thread per
+request (thread_sensitive, so they share the request's connection and
+transaction), which means a request's queries reach the database one after
+another whichever way they're awaited; they're awaited in turn here. What
+the async path buys is that a worker waiting on the database can keep
+serving other requests. Templates render on that thread too, since the
+context processors read the session.
+
+Writes (the POST on the detail page) stay on the sync path, with their
+signal receivers. Conditional GETs (see http_cache.py) are checked first, as
+in views.py.
+"""
+from asgiref.sync import sync_to_async
+from django.http import Http404
+from django.shortcuts import render
+
+from . import views
+from .facets import get_facet_options
+from .filters import filter_movies
+from .http_cache import conditional_response, detail_validators, grid_validators, patch_response
+
+_render = sync_to_async(render)
+
+
+async def _load_user(request):
+    # Resolve the lazy user once, without blocking the event loop, so the
+    # sync helpers and templates find it already loaded
+    request.user = await request.auser()
+
+
+def _grid_context(request):
+    grid = filter_movies(request.GET, request.user)
+    context = views._grid_page_context(request, grid)
+    context["facet_counts"] = grid["facet_counts"]
+    return grid, context
+
+
+async def movie_list(request):
+    await _load_user(request)
+    validators = await sync_to_async(grid_validators)(request)
+    response = conditional_response(request, validators, views.GRID_VARY)
+    if response is not None:
+        return response
+
+    grid, context = await sync_to_async(_grid_context)(request)
+    if request.headers.get("x-requested-with") == "XMLHttpRequest":
+        response = await _render(request, "tracker/_movie_grid.html", context)
+        return patch_response(request, response, validators, views.GRID_VARY)
+
+    facet_options = await sync_to_async(get_facet_options)()
+    context.update(grid["selected"])
+    context.update(facet_options)
+    response = await _render(request, "tracker/movie_list.html", context)
+    return patch_response(request, response, validators, views.GRID_VARY)
+
+
+async def _similar_movies(movie_id):
+    return [s.similar async for s in views._similar_to(movie_id)]
+
+
+async def movie_detail(request, movie_id):
+    if request.method == "POST":
+        return await sync_to_async(views.movie_detail)(request, movie_id)
+
+    await _load_user(request)
+    validators = await sync_to_async(detail_validators)(request, movie_id)
+    response = conditional_response(request, validators)
+    if response is not None:
+        return response
+
+    movie = await views._detail_movies().filter(pk=movie_id).afirst()
+    if movie is None:
+        raise Http404("No Movie matches the given query.")
+    similar_movies = await _similar_movies(movie_id)
+    response = await _render(
+        request,
+        "tracker/movie_detail.html",
+        views._detail_context(request, movie, similar_movies),
+    )
+    return patch_response(request, response, validators)
+
+
+async def _recommendations(user):
+    if not user.is_authenticated:
+        return []
+    return [
+        r async for r in views._recommendations_for(user)[:views.RECOMMENDATIONS_ON_SUGGEST]
+    ]
+
+
+async def movie_suggest(request):
+    await _load_user(request)
+    facet_options = await sync_to_async(get_facet_options)()
+    suggestions, form_values = await sync_to_async(views._pick_suggestions)(request)
+    recommendations = await _recommendations(request.user)
+    return await _render(
+        request,
+        "tracker/movie_suggest.html",
+        views._suggest_context(facet_options, suggestions, form_values, recommendations),
+    )
@@ -0,0 +1,35 @@
+"""
+A small in-process thread pool for work that shouldn't hold up a response
+(thumbnail rendering, media cleanup). Jobs are best-effort: errors are
+logged, and anything lost on a restart is picked up by the matching
+management command (generate_thumbnails, sweep_posters).
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def _run(fn, args):
+    try:
+        fn(*args)
+    except Exception:
+        logger.exception("Background job %s%r failed", fn.__name__, args)
+    finally:
+        # Each worker thread gets its own connection; don't leave it open
+        connection.close()
+
+
+def run_in_background(fn, *args):
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, "TRACKER_BACKGROUND_WORKERS", 2),
+            thread_name_prefix="tracker-background",
+        )
+    _executor.submit(_run, fn, args)
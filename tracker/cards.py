@@ -0,0 +1,248 @@
+"""
+Fragment cache for the movie grid's cards.
+
+The parts of a card that look the same to everyone (the poster, the details
+and the "Who's seen it?" list) are rendered once and cached under the movie's
+card_version. Movie.save and the receivers below give a movie a new
+card_version whenever the movie, its categories or streaming services, its
+viewings or the users named on it change. Old versions are never deleted;
+they just stop being asked for and expire.
+
+The seen/unseen controls are the per-user overlay: _movie_card.html renders
+them fresh around the cached parts. The viewers list leaves out the current
+user's own viewing, so it's cached once for everyone who hasn't seen a movie
+and once per user who has.
+
+A warm page of cards costs one get_many. Hit and miss counts are kept per
+process and added to shared counters in the cache every few seconds, see
+card_cache_stats() and the card_cache_stats command. Which cache is used is
+set by TRACKER_CARD_CACHE (a CACHES alias, "default" unless configured).
+"""
+import threading
+import time
+import zlib
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+from django.db import models
+from django.db.models import Q, prefetch_related_objects
+from django.dispatch import receiver
+from django.template.loader import get_template
+from django.utils.safestring import mark_safe
+
+from .models import Category, Movie, StreamingService, Viewing, touched_fields
+
+CARD_PARTS = {
+    "poster": "tracker/_movie_card_poster.html",
+    "details": "tracker/_movie_card_details.html",
+    "viewers": "tracker/_movie_card_viewers.html",
+}
+CARD_KEY = "tracker:card:{movie_id}:{version}:{part}"
+HITS_KEY = "tracker:card:stats:hits"
+MISSES_KEY = "tracker:card:stats:misses"
+STATS_FLUSH_SECONDS = 10
+
+
+def _cache():
+    return caches[getattr(settings, "TRACKER_CARD_CACHE", DEFAULT_CACHE_ALIAS)]
+
+
+def _timeout():
+    # Versioned keys never go stale, so this only bounds the dead ones
+    return getattr(settings, "TRACKER_CARD_CACHE_TIMEOUT", 60 * 60 * 24)
+
+
+def card_key(movie, part, viewer_id=None):
+    key = CARD_KEY.format(movie_id=movie.pk, version=movie.card_version, part=part)
+    return f"{key}:{viewer_id}" if viewer_id else key
+
+
+def card_token(movie, snippet=None):
+    """
+    Opaque version of a movie's whole rendered card, for clients that keep
+    cards they've already rendered. Search snippets are per query, so they
+    change it too.
+    """
+    if not snippet:
+        return str(movie.card_version)
+    return f"{movie.card_version}.{zlib.crc32(snippet.encode()):08x}"
+
+
+def render_cards(movies, user_id=None, user_viewings=None, snippets=None):
+    """
+    Return the shared parts of each movie's card, in order, as dicts of
+    {"movie", "viewing", "snippet", "version", "poster", "details", "viewers"}.
+
+    `user_viewings` maps movie id -> the current user's Viewing; that viewing
+    becomes "viewing" and is left out of "viewers". `snippets` maps movie
+    id -> search snippet.
+    """
+    user_viewings = user_viewings or {}
+    snippets = snippets or {}
+    keys = {}
+    for movie in movies:
+        for part in CARD_PARTS:
+            viewer_id = user_id if part == "viewers" and movie.pk in user_viewings else None
+            keys[movie.pk, part] = card_key(movie, part, viewer_id)
+
+    cache = _cache()
+    found = cache.get_many(keys.values()) if keys else {}
+    missing = {
+        (movie_id, part): key for (movie_id, part), key in keys.items() if key not in found
+    }
+    _record(hits=len(keys) - len(missing), misses=len(missing))
+
+    if missing:
+        rendered = _render_parts(movies, missing, user_id)
+        cache.set_many(rendered, _timeout())
+        found.update(rendered)
+
+    return [
+        {
+            "movie": movie,
+            "viewing": user_viewings.get(movie.pk),
+            "snippet": snippets.get(movie.pk),
+            "version": card_token(movie, snippets.get(movie.pk)),
+            **{part: mark_safe(found[keys[movie.pk, part]]) for part in CARD_PARTS},
+        }
+        for movie in movies
+    ]
+
+
+def _render_parts(movies, missing, user_id):
+    """Render just the `missing` {(movie id, part): key} card parts."""
+    details_for = [m for m in movies if (m.pk, "details") in missing]
+    if details_for:
+        prefetch_related_objects(details_for, "recommended_by", "categories", "streaming_services")
+
+    others = {}
+    viewers_for = [m for m in movies if (m.pk, "viewers") in missing]
+    if viewers_for:
+        viewings = Viewing.objects.filter(
+            movie__in=viewers_for
+        ).exclude(user_id=user_id).select_related("user")
+        for v in viewings:
+            others.setdefault(v.movie_id, []).append(v)
+
+    templates = {part: get_template(name) for part, name in CARD_PARTS.items()}
+    rendered = {}
+    for movie in movies:
+        context = {"movie": movie, "others": others.get(movie.pk, [])}
+        for part, template in templates.items():
+            key = missing.get((movie.pk, part))
+            if key is not None:
+                rendered[key] = template.render(context)
+    return rendered
+
+
+# --- Hit/miss instrumentation ---
+
+_pending = {HITS_KEY: 0, MISSES_KEY: 0}
+_pending_lock = threading.Lock()
+_last_flush = time.monotonic()
+
+
+def _record(hits, misses):
+    global _last_flush
+    with _pending_lock:
+        _pending[HITS_KEY] += hits
+        _pending[MISSES_KEY] += misses
+        if time.monotonic() - _last_flush < STATS_FLUSH_SECONDS:
+            return
+        _last_flush = time.monotonic()
+        counts = dict(_pending)
+        _pending.update({key: 0 for key in _pending})
+    _add_counts(counts)
+
+
+def _add_counts(counts):
+    cache = _cache()
+    for key, count in counts.items():
+        if not count:
+            continue
+        try:
+            cache.incr(key, count)
+        except ValueError:
+            # First count, or evicted
+            if not cache.add(key, count, None):
+                cache.incr(key, count)
+
+
+def flush_card_cache_stats():
+    """Add this process's not-yet-shared counts to the cache now."""
+    global _last_flush
+    with _pending_lock:
+        _last_flush = time.monotonic()
+        counts = dict(_pending)
+        _pending.update({key: 0 for key in _pending})
+    _add_counts(counts)
+
+
+def card_cache_stats():
+    """Shared fragment counts as {"hits", "misses", "lookups", "hit_rate"}."""
+    flush_card_cache_stats()
+    counts = _cache().get_many([HITS_KEY, MISSES_KEY])
+    hits, misses = counts.get(HITS_KEY, 0), counts.get(MISSES_KEY, 0)
+    lookups = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "lookups": lookups,
+        "hit_rate": hits / lookups if lookups else None,
+    }
+
+
+def reset_card_cache_stats():
+    with _pending_lock:
+        _pending.update({key: 0 for key in _pending})
+    _cache().delete_many([HITS_KEY, MISSES_KEY])
+
+
+# --- Version bumps ---
+
+def bump_card_versions(*args, **filters):
+    """Give every movie matching the filter a new card_version and updated_at."""
+    Movie.objects.filter(*args, **filters).update(**touched_fields())
+
+
+@receiver(models.signals.m2m_changed, sender=Movie.categories.through)
+@receiver(models.signals.m2m_changed, sender=Movie.streaming_services.through)
+def bump_on_m2m_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ("post_add", "post_remove", "post_clear"):
+            bump_card_versions(pk=instance.pk)
+    elif action in ("post_add", "post_remove"):
+        bump_card_versions(pk__in=pk_set)
+    elif action == "pre_clear":
+        # Afterwards there's no telling which movies were attached
+        bump_card_versions(pk__in=list(instance.movies.values_list("pk", flat=True)))
+
+
+@receiver(models.signals.post_save, sender=Viewing)
+@receiver(models.signals.post_delete, sender=Viewing)
+def bump_on_viewing_change(sender, instance, **kwargs):
+    bump_card_versions(pk__in=instance.movie_ids())
+
+
+@receiver(models.signals.post_save, sender=Category)
+@receiver(models.signals.pre_delete, sender=Category)
+def bump_on_category_change(sender, instance, created=False, **kwargs):
+    if not created:
+        bump_card_versions(categories=instance)
+
+
+@receiver(models.signals.post_save, sender=StreamingService)
+@receiver(models.signals.pre_delete, sender=StreamingService)
+def bump_on_streaming_service_change(sender, instance, created=False, **kwargs):
+    if not created:
+        bump_card_versions(streaming_services=instance)
+
+
+@receiver(models.signals.post_save, sender=User)
+@receiver(models.signals.pre_delete, sender=User)
+def bump_on_user_change(sender, instance, created=False, update_fields=None, **kwargs):
+    # Cards show recommenders' and viewers' names; logins only touch last_login
+    if created or update_fields == frozenset({"last_login"}):
+        return
+    bump_card_versions(Q(recommended_by=instance) | Q(viewing__user=instance))
@@ -0,0 +1,47 @@
+"""
+System checks for the tracker's settings, run by runserver, migrate and
+`manage.py check`.
+"""
+from django.conf import settings
+from django.core import checks
+from django.core.cache import DEFAULT_CACHE_ALIAS
+from django.utils.module_loading import import_string
+
+# Backends whose entries live in one process only
+PROCESS_LOCAL_CACHES = (
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+)
+
+
+def cache_backend(alias):
+    """The dotted path of the class behind CACHES[alias], aliases resolved."""
+    backend = settings.CACHES.get(alias, {}).get("BACKEND", "")
+    try:
+        cls = import_string(backend)
+    except ImportError:
+        return backend
+    return f"{cls.__module__}.{cls.__qualname__}"
+
+
+@checks.register(checks.Tags.caches)
+def check_shared_caches(app_configs, **kwargs):
+    """
+    With more than one worker process (TRACKER_WORKER_PROCESSES), the facet
+    options cache must be shared between them, or an edit in one worker
+    leaves the filter dropdowns stale in the others. So must the card cache,
+    whose hit and miss counters are summed across workers in it.
+    """
+    if getattr(settings, "TRACKER_WORKER_PROCESSES", 1) <= 1:
+        return []
+    errors = []
+    for setting in ("TRACKER_FACET_CACHE", "TRACKER_CARD_CACHE"):
+        alias = getattr(settings, setting, DEFAULT_CACHE_ALIAS)
+        if cache_backend(alias) in PROCESS_LOCAL_CACHES:
+            errors.append(checks.Error(
+                f"{setting} ({alias!r}) is a per-process cache, but "
+                f"TRACKER_WORKER_PROCESSES is {settings.TRACKER_WORKER_PROCESSES}.",
+                hint="Point it at a cache every worker shares, e.g. FileBasedCache, Memcached or Redis.",
+                id="tracker.E001",
+            ))
+    return errors
@@ -0,0 +1,50 @@
+"""
+Deferred deletion of media files that no longer belong to any movie.
+
+Files are handed to the queue only when the transaction that orphaned them
+commits (a rollback drops them), and a background thread deletes whatever
+has queued up in one batch, so a bulk delete costs the request nothing.
+
+The queue lives in this process's memory only, so anything still pending
+when it exits is never deleted from here. Every queued file is a poster or
+a thumbnail no movie refers to any more, which is exactly what
+`manage.py sweep_posters` looks for; run it periodically (e.g. daily from
+cron) to collect what a restart left behind.
+"""
+import threading
+
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from .background import run_in_background
+
+_queue = set()
+_lock = threading.Lock()
+_drain_scheduled = False
+
+
+def _drain():
+    global _drain_scheduled
+    with _lock:
+        names = sorted(_queue)
+        _queue.clear()
+        _drain_scheduled = False
+    for name in names:
+        default_storage.delete(name)
+
+
+def _enqueue(names):
+    global _drain_scheduled
+    with _lock:
+        _queue.update(names)
+        if _drain_scheduled:
+            return
+        _drain_scheduled = True
+    run_in_background(_drain)
+
+
+def delete_file_later(*names):
+    """Queue media files for deletion after the current transaction commits."""
+    names = {name for name in names if name}
+    if names:
+        transaction.on_commit(lambda: _enqueue(names))
@@ -0,0 +1,460 @@
+"""
+In-process facet index for the movie grid filters.
+
+Each category, streaming service, recommender and member's seen list is a
+bitmap of movie IDs, held as a Python int with bit N set for movie N, so a
+filter combination is a handful of `&`s and an option's count is
+`bit_count()`. People have far more keys, so each person/role keeps a plain
+set of movie IDs instead of a dense bitmap. Those are keyed by person id,
+with a separate name lookup, so a rename only touches the lookup.
+
+The index is loaded lazily and kept current through the database, not a
+cache: the receivers at the bottom append FacetChange rows in the same
+transaction as each change, and every search first replays the rows this
+process hasn't applied yet. That's one indexed query per search, and a
+change costs each worker a reload of the movies it touched rather than a
+rebuild. Rows are replayed in id order, which is commit order under
+SQLite's single writer. The log is pruned as it grows; a process that has
+fallen too far behind (more than MAX_REPLAY changes) rebuilds instead.
+
+Big results aren't sent back to SQLite as id lists: past MAX_ID_LIST
+movies, restrict_queryset applies the same filters in SQL instead.
+"""
+import json
+import threading
+from collections import defaultdict
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.db import models
+from django.db.models.expressions import RawSQL
+from django.dispatch import receiver
+
+from .models import Category, FacetChange, Movie, MovieCredit, Person, StreamingService, Viewing
+from .replicas import primary_reads
+
+# Pending changes past which rebuilding is cheaper than replaying them
+MAX_REPLAY = 1000
+# Prune the log every PRUNE_EVERY changes, keeping the last KEEP_CHANGES.
+# More than MAX_REPLAY, so a process whose last change is pruned rebuilds.
+PRUNE_EVERY = 1000
+KEEP_CHANGES = 5000
+
+# Longest id list restrict_queryset sends to SQLite
+MAX_ID_LIST = 2000
+
+# bitmap_ids walks up to this many set bits one at a time, and unpacks
+# every bit with numpy past that
+SPARSE_BITS = 64
+
+_CHANGE_FIELDS = ("pk", "kind", "movie_id", "facet", "key")
+
+
+def bitmap_ids(bitmap):
+    """Movie IDs set in `bitmap`, ascending."""
+    if bitmap.bit_count() <= SPARSE_BITS:
+        ids = []
+        while bitmap:
+            lowest = bitmap & -bitmap
+            ids.append(lowest.bit_length() - 1)
+            bitmap ^= lowest
+        return ids
+    packed = np.frombuffer(bitmap.to_bytes((bitmap.bit_length() + 7) // 8, "little"), dtype=np.uint8)
+    return np.flatnonzero(np.unpackbits(packed, bitorder="little")).tolist()
+
+
+def ids_bitmap(ids):
+    bitmap = 0
+    for i in ids:
+        bitmap |= 1 << i
+    return bitmap
+
+
+def _ids_sql(bitmap):
+    # One JSON parameter instead of one bind variable per ID, so long lists
+    # don't hit SQLite's variable limit
+    return RawSQL("SELECT value FROM json_each(%s)", (json.dumps(bitmap_ids(bitmap)),))
+
+
+class FacetIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        # The last FacetChange applied, as _CHANGE_FIELDS; () for an empty
+        # log, None until loaded
+        self._last_change = None
+        self._reset()
+
+    def _reset(self):
+        self.all_movies = 0
+        self.categories = defaultdict(int)
+        self.streaming_services = defaultdict(int)
+        self.recommenders = defaultdict(int)
+        self.seen = defaultdict(int)
+        self.people = defaultdict(set)  # (role, person ID) -> movie IDs
+        self._movie_people = defaultdict(set)  # movie ID -> (role, person ID) keys
+        self.person_ids = {}  # name -> person ID
+        self._person_names = {}  # person ID -> name
+
+    # --- Loading ---
+
+    def rebuild(self):
+        # Always from the primary; a replica may be behind the log
+        with self._lock, primary_reads():
+            # Note the newest change first, so anything logged during the
+            # load is replayed afterwards rather than lost
+            last_change = FacetChange.objects.order_by("-pk").values_list(*_CHANGE_FIELDS).first()
+            self._reset()
+
+            movies = Movie.objects.values_list("id", "recommended_by_id")
+            for movie_id, recommender_id in movies.iterator(chunk_size=2000):
+                self.all_movies |= 1 << movie_id
+                if recommender_id is not None:
+                    self.recommenders[recommender_id] |= 1 << movie_id
+
+            self._load_relations(Movie.objects.all())
+
+            self._last_change = last_change or ()
+
+    def _load_m2m(self, target, rows, column):
+        for movie_id, key in rows.values_list("movie_id", column).iterator(chunk_size=2000):
+            target[key] |= 1 << movie_id
+
+    def _load_relations(self, movies):
+        """Load category, service, credit and viewing bits for `movies`."""
+        self._load_m2m(
+            self.categories,
+            Movie.categories.through.objects.filter(movie__in=movies),
+            "category_id",
+        )
+        self._load_m2m(
+            self.streaming_services,
+            Movie.streaming_services.through.objects.filter(movie__in=movies),
+            "streamingservice_id",
+        )
+        self._load_credits(MovieCredit.objects.filter(movie__in=movies))
+        self._load_viewings(Viewing.objects.filter(movie__in=movies))
+
+    def _load_credits(self, credits):
+        rows = credits.values_list("movie_id", "role", "person_id", "person__name")
+        for movie_id, role, person_id, name in rows.iterator(chunk_size=2000):
+            self.people[(role, person_id)].add(movie_id)
+            self._movie_people[movie_id].add((role, person_id))
+            self.person_ids[name] = person_id
+            self._person_names[person_id] = name
+
+    def _load_viewings(self, viewings):
+        for user_id, movie_id in viewings.values_list("user_id", "movie_id").iterator(chunk_size=2000):
+            self.seen[user_id] |= 1 << movie_id
+
+    def _remove_movies(self, movie_ids):
+        mask = ~ids_bitmap(movie_ids)
+        self.all_movies &= mask
+        for facet in (self.categories, self.streaming_services, self.recommenders, self.seen):
+            for key in facet:
+                facet[key] &= mask
+        for movie_id in movie_ids:
+            for key in self._movie_people.pop(movie_id, ()):
+                self._drop_credit(key, movie_id)
+
+    def _drop_credit(self, key, movie_id):
+        self.people[key].discard(movie_id)
+        if not self.people[key]:
+            del self.people[key]
+
+    def _refresh_movies(self, movie_ids):
+        """Reload some movies' bits from the database, dropping any that are gone."""
+        self._remove_movies(movie_ids)
+        movies = Movie.objects.filter(pk__in=movie_ids)
+        for movie_id, recommender_id in movies.values_list("id", "recommended_by_id"):
+            self.all_movies |= 1 << movie_id
+            if recommender_id is not None:
+                self.recommenders[recommender_id] |= 1 << movie_id
+        self._load_relations(movies)
+
+    def _refresh_person(self, person_id):
+        """Reload one person's name, or drop their credits if they're gone."""
+        old_name = self._person_names.pop(person_id, None)
+        if self.person_ids.get(old_name) == person_id:
+            del self.person_ids[old_name]
+        name = Person.objects.filter(pk=person_id).values_list("name", flat=True).first()
+        if name is not None:
+            self.person_ids[name] = person_id
+            self._person_names[person_id] = name
+            return
+        for role in MovieCredit.Role.values:
+            for movie_id in self.people.pop((role, person_id), ()):
+                self._movie_people[movie_id].discard((role, person_id))
+
+    def invalidate(self):
+        """
+        Forget everything; the next search here, and in every other process,
+        rebuilds from the database.
+        """
+        log_changes([FacetChange(kind=FacetChange.Kind.RELOAD)])
+        with self._lock:
+            self._last_change = None
+            self._reset()
+
+    # --- Replaying the change log ---
+
+    def _ensure_loaded(self):
+        if self._last_change is None:
+            self.rebuild()
+            return
+
+        since = self._last_change[0] if self._last_change else 0
+        with primary_reads():
+            changes = list(
+                FacetChange.objects.filter(pk__gte=since)
+                .order_by("pk")
+                .values_list(*_CHANGE_FIELDS)[:MAX_REPLAY + 2]
+            )
+        if self._last_change:
+            # Gone (pruned, or rolled back after this process applied it)
+            # or replaced, so what came before it can't be trusted either
+            if not changes or changes[0] != self._last_change:
+                self.rebuild()
+                return
+            changes = changes[1:]
+        if not changes:
+            return
+        if len(changes) > MAX_REPLAY or any(kind == FacetChange.Kind.RELOAD for _, kind, *_ in changes):
+            self.rebuild()
+            return
+
+        with primary_reads():
+            self._replay(changes)
+        self._last_change = changes[-1]
+
+    def _replay(self, changes):
+        # Seen bits and names in order; changed movies are reloaded once at
+        # the end, as they are now, which is at least as new as the log
+        movie_ids = set()
+        for _, kind, movie_id, facet, key in changes:
+            if kind == FacetChange.Kind.MOVIE:
+                movie_ids.add(movie_id)
+            elif kind == FacetChange.Kind.SEEN:
+                self.seen[key] |= 1 << movie_id
+            elif kind == FacetChange.Kind.UNSEEN:
+                self.seen[key] &= ~(1 << movie_id)
+            elif kind == FacetChange.Kind.PERSON:
+                self._refresh_person(key)
+            elif kind == FacetChange.Kind.DROP:
+                getattr(self, facet).pop(key, None)
+        if movie_ids:
+            self._refresh_movies(movie_ids)
+
+    # --- Querying ---
+
+    def search(self, seen_user_id=None, seen="", category_ids=(), streaming_id=None,
+               recommender_id=None, people=None, within=None):
+        """
+        Return (matches, counts) for a filter combination.
+
+        `matches` is the bitmap of movies passing every filter. `counts`
+        maps each facet to {option: number of matches if that option were
+        picked}, counted against the other facets' filters only, so the
+        numbers next to the current selection stay meaningful. `within`, a
+        bitmap, limits everything (matches and counts) to those movies.
+        """
+        with self._lock:
+            self._ensure_loaded()
+
+            filters = {}
+            if seen_user_id is not None and seen in ("0", "1"):
+                user_seen = self.seen.get(seen_user_id, 0)
+                filters["seen"] = user_seen if seen == "1" else self.all_movies & ~user_seen
+            if category_ids:
+                any_category = 0
+                for category_id in category_ids:
+                    any_category |= self.categories.get(category_id, 0)
+                filters["categories"] = any_category
+            if streaming_id is not None:
+                filters["streaming"] = self.streaming_services.get(streaming_id, 0)
+            if recommender_id is not None:
+                filters["recommended_by"] = self.recommenders.get(recommender_id, 0)
+            for role, name in (people or {}).items():
+                person_id = self.person_ids.get(name)
+                filters[role] = ids_bitmap(self.people.get((role, person_id), ()))
+
+            universe = self.all_movies if within is None else self.all_movies & within
+
+            def matching(excluding=None):
+                bitmap = universe
+                for facet, facet_bitmap in filters.items():
+                    if facet != excluding:
+                        bitmap &= facet_bitmap
+                return bitmap
+
+            matches = matching()
+
+            counts = {}
+            for facet, options in (
+                ("categories", self.categories),
+                ("streaming", self.streaming_services),
+                ("recommended_by", self.recommenders),
+            ):
+                base = matching(excluding=facet)
+                counts[facet] = {key: (base & bitmap).bit_count() for key, bitmap in options.items()}
+            if seen_user_id is not None:
+                base = matching(excluding="seen")
+                user_seen = self.seen.get(seen_user_id, 0)
+                counts["seen"] = {
+                    "1": (base & user_seen).bit_count(),
+                    "0": (base & ~user_seen).bit_count(),
+                }
+
+            return matches, counts
+
+    def restrict_queryset(self, queryset, matches, in_sql=None):
+        """
+        Filter a Movie queryset down to the movies set in `matches`. Up to
+        MAX_ID_LIST of them go to SQLite as a list of ids; for more,
+        `in_sql(queryset)`, the same filters as SQL, is used if given.
+        """
+        with self._lock:
+            if matches == self.all_movies:
+                return queryset
+        if in_sql is not None and matches.bit_count() > MAX_ID_LIST:
+            return in_sql(queryset)
+        return queryset.filter(pk__in=_ids_sql(matches))
+
+    # --- Verification ---
+
+    def check_against_orm(self):
+        """
+        Compare every bitmap with the equivalent ORM query.
+        Returns a list of human-readable mismatches (empty if consistent).
+        """
+        with self._lock:
+            self._ensure_loaded()
+            problems = []
+
+            def compare(label, bitmap, queryset):
+                expected = set(queryset.values_list("pk", flat=True))
+                actual = set(bitmap_ids(bitmap))
+                if actual != expected:
+                    problems.append(
+                        f"{label}: {len(actual - expected)} extra, {len(expected - actual)} missing"
+                    )
+
+            compare("all movies", self.all_movies, Movie.objects.all())
+            for pk in Category.objects.values_list("pk", flat=True):
+                compare(f"category {pk}", self.categories.get(pk, 0), Movie.objects.filter(categories=pk))
+            for pk in StreamingService.objects.values_list("pk", flat=True):
+                compare(f"streaming service {pk}", self.streaming_services.get(pk, 0), Movie.objects.filter(streaming_services=pk))
+            for pk in User.objects.values_list("pk", flat=True):
+                compare(f"recommender {pk}", self.recommenders.get(pk, 0), Movie.objects.filter(recommended_by=pk))
+                compare(f"seen by user {pk}", self.seen.get(pk, 0), Movie.objects.filter(viewing__user=pk))
+            credits = MovieCredit.objects.values_list("role", "person_id", "person__name").distinct()
+            for role, person_id, name in credits:
+                if self.person_ids.get(name) != person_id:
+                    problems.append(f"{name}: indexed as person {self.person_ids.get(name)}, not {person_id}")
+                compare(
+                    f"{role} {name}",
+                    ids_bitmap(self.people.get((role, person_id), ())),
+                    Movie.objects.filter(credits__role=role, credits__person=person_id),
+                )
+            return problems
+
+    def stats(self):
+        with self._lock:
+            self._ensure_loaded()
+            return {
+                "movies": self.all_movies.bit_count(),
+                "categories": len(self.categories),
+                "streaming_services": len(self.streaming_services),
+                "recommenders": len(self.recommenders),
+                "members_with_viewings": len(self.seen),
+                "people_credits": len(self.people),
+                "last_change": self._last_change[0] if self._last_change else None,
+            }
+
+
+index = FacetIndex()
+
+
+# --- Keeping the index current ---
+
+def log_changes(changes):
+    """
+    Append FacetChange rows for every process's index to replay. Call it
+    inside the transaction making the change, so the two commit together.
+    """
+    logged = FacetChange.objects.bulk_create(changes)
+    newest = logged[-1].pk if logged else None
+    if newest is not None and newest // PRUNE_EVERY != (newest - len(logged)) // PRUNE_EVERY:
+        FacetChange.objects.filter(pk__lte=newest - KEEP_CHANGES).delete()
+
+
+def log_seen(user_id, movie_ids, seen):
+    kind = FacetChange.Kind.SEEN if seen else FacetChange.Kind.UNSEEN
+    log_changes([FacetChange(kind=kind, key=user_id, movie_id=movie_id) for movie_id in movie_ids])
+
+
+def _log_movies(movie_ids):
+    log_changes([FacetChange(kind=FacetChange.Kind.MOVIE, movie_id=movie_id) for movie_id in movie_ids])
+
+
+def _log_drops(key, *facets):
+    log_changes([FacetChange(kind=FacetChange.Kind.DROP, facet=facet, key=key) for facet in facets])
+
+
+@receiver(models.signals.post_save, sender=Movie)
+@receiver(models.signals.post_delete, sender=Movie)
+def log_movie_change(sender, instance, **kwargs):
+    _log_movies([instance.pk])
+
+
+@receiver(models.signals.m2m_changed, sender=Movie.categories.through)
+@receiver(models.signals.m2m_changed, sender=Movie.streaming_services.through)
+def log_m2m_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        _log_movies([instance.pk])
+    elif pk_set:
+        # Changed from the category/service side; pk_set holds the movies
+        _log_movies(sorted(pk_set))
+    elif action == "post_clear":
+        # Which movies isn't known any more
+        log_changes([FacetChange(kind=FacetChange.Kind.RELOAD)])
+
+
+@receiver(models.signals.post_save, sender=Viewing)
+def log_viewing_saved(sender, instance, **kwargs):
+    if moved_from := instance.moved_from():
+        log_seen(moved_from[0], [moved_from[1]], False)
+    log_seen(instance.user_id, [instance.movie_id], True)
+
+
+@receiver(models.signals.post_delete, sender=Viewing)
+def log_viewing_deleted(sender, instance, **kwargs):
+    log_seen(instance.user_id, [instance.movie_id], False)
+
+
+@receiver(models.signals.post_save, sender=Person)
+def log_person_saved(sender, instance, created, **kwargs):
+    # A new person has no credits until a movie's save adds them
+    if not created:
+        log_changes([FacetChange(kind=FacetChange.Kind.PERSON, key=instance.pk)])
+
+
+@receiver(models.signals.post_delete, sender=Person)
+def log_person_deleted(sender, instance, **kwargs):
+    log_changes([FacetChange(kind=FacetChange.Kind.PERSON, key=instance.pk)])
+
+
+@receiver(models.signals.post_delete, sender=Category)
+def log_category_deleted(sender, instance, **kwargs):
+    _log_drops(instance.pk, "categories")
+
+
+@receiver(models.signals.post_delete, sender=StreamingService)
+def log_streaming_service_deleted(sender, instance, **kwargs):
+    _log_drops(instance.pk, "streaming_services")
+
+
+@receiver(models.signals.post_delete, sender=User)
+def log_user_deleted(sender, instance, **kwargs):
+    _log_drops(instance.pk, "recommenders", "seen")
@@ -0,0 +1,128 @@
+"""
+Cached option lists for the movie grid and suggest page filters.
+
+The lists only change when a movie, category, streaming service, person or
+user does, so
+they're stored in Django's cache under a version key and the version is
+bumped from model signals. Which cache is used is set by
+TRACKER_FACET_CACHE (a CACHES alias, "default" unless configured). Django's
+default is a per-process local-memory cache; with several worker processes,
+point this at a shared backend so invalidations reach all of them.
+"""
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+from django.db import models, transaction
+from django.dispatch import receiver
+
+from .models import Category, Movie, MovieCredit, Person, StreamingService
+from .replicas import primary_reads
+
+VERSION_KEY = "tracker:facets:version"
+OPTIONS_KEY = "tracker:facets:options:{version}"
+
+
+def _cache():
+    return caches[getattr(settings, "TRACKER_FACET_CACHE", DEFAULT_CACHE_ALIAS)]
+
+
+def _timeout():
+    # Backstop only; normal invalidation is the version bump below
+    return getattr(settings, "TRACKER_FACET_CACHE_TIMEOUT", 60 * 60)
+
+
+def people_for_role(role):
+    """Sorted names of everyone credited in `role` on at least one movie."""
+    return list(
+        Person.objects.filter(credits__role=role)
+        .distinct()
+        .values_list("name", flat=True)
+    )
+
+
+def build_facet_options():
+    return {
+        "categories": list(Category.objects.all().order_by("name")),
+        "streaming_services": list(StreamingService.objects.all()),
+        "recommenders": list(
+            User.objects.filter(recommended_movies__isnull=False).distinct()
+        ),
+        "writers": people_for_role(MovieCredit.Role.WRITER),
+        "directors": people_for_role(MovieCredit.Role.DIRECTOR),
+        "starring_list": people_for_role(MovieCredit.Role.STARRING),
+    }
+
+
+def _current_version(cache):
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # Seed from the clock so an evicted version never restarts at a
+        # number whose options are still sitting in the cache
+        cache.add(VERSION_KEY, time.time_ns() // 1000, None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def facet_options_version():
+    """Changes whenever the options do; part of the grid's ETag."""
+    return _current_version(_cache())
+
+
+def get_facet_options():
+    """
+    Return the filter dropdown data: categories, streaming_services,
+    recommenders, writers, directors and starring_list.
+    """
+    cache = _cache()
+    key = OPTIONS_KEY.format(version=_current_version(cache))
+    options = cache.get(key)
+    if options is None:
+        # Filed under the newest version, so never built from a replica
+        with primary_reads():
+            options = build_facet_options()
+        cache.set(key, options, _timeout())
+    return options
+
+
+def invalidate_facet_options():
+    cache = _cache()
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        # Key missing or evicted; any fresh value orphans the old entries
+        cache.set(VERSION_KEY, _current_version(cache) + 1, None)
+
+
+def _invalidate_on_commit():
+    # After commit, so a concurrent read can't re-cache pre-commit data
+    # (and so the credit rebuild in Movie's post_save has happened)
+    transaction.on_commit(invalidate_facet_options)
+
+
+@receiver(models.signals.post_save, sender=Movie)
+@receiver(models.signals.post_save, sender=Category)
+@receiver(models.signals.post_save, sender=StreamingService)
+@receiver(models.signals.post_save, sender=Person)
+@receiver(models.signals.post_delete, sender=Movie)
+@receiver(models.signals.post_delete, sender=Category)
+@receiver(models.signals.post_delete, sender=StreamingService)
+@receiver(models.signals.post_delete, sender=Person)
+@receiver(models.signals.post_delete, sender=User)
+def invalidate_on_save_or_delete(sender, **kwargs):
+    _invalidate_on_commit()
+
+
+@receiver(models.signals.post_save, sender=User)
+def invalidate_on_user_change(sender, created, update_fields=None, **kwargs):
+    # The recommenders list shows names; new users and logins don't matter
+    if not created and update_fields != frozenset({"last_login"}):
+        _invalidate_on_commit()
+
+
+@receiver(models.signals.m2m_changed, sender=Movie.categories.through)
+@receiver(models.signals.m2m_changed, sender=Movie.streaming_services.through)
+def invalidate_on_m2m_change(sender, action, **kwargs):
+    if action in ("post_add", "post_remove", "post_clear"):
+        _invalidate_on_commit()
@@ -0,0 +1,147 @@
+"""
+The movie grid's search, sort and filters, shared by the grid views (sync
+and async), the exports and the export_movies command.
+
+filter_movies answers the filters from the in-memory facet index
+(facet_index.py), narrowed to every full-text match when there's a q=, and
+returns a queryset of the matching movies: a list of ids when there are few
+enough, otherwise the same filters as SQL. Only the relevance sort is
+capped, at search.SEARCH_RESULT_LIMIT hits.
+"""
+from .facet_index import bitmap_ids, ids_bitmap, index as facet_index
+from .models import Movie, MovieCredit, Viewing
+from .search import matching_ids, matching_ids_sql, search_movies
+
+SORT_OPTIONS = {
+    "title_asc": "title",
+    "title_desc": "-title",
+    "year_asc": "year",
+    "year_desc": "-year",
+    "recent": "-created_at",
+    # Maintained on Movie by ratings.py, indexed for the keyset pagination
+    "top_rated": "-rating_score",
+    "most_watched": "-viewing_count",
+    # Ranked by search score when q= is given, otherwise by title
+    "relevance": "title",
+}
+
+
+def int_or_none(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def filter_by_person(movies, role, name):
+    # Both conditions in one filter() so they apply to the same credit row
+    return movies.filter(credits__role=role, credits__person__name=name)
+
+
+def _filter_in_sql(movies, q, seen_user_id, seen, category_ids, streaming_id, recommender_id, people):
+    """The facet index's filters as SQL, for results too big to pass as ids."""
+    if q:
+        movies = movies.filter(pk__in=matching_ids_sql(q))
+    if seen_user_id is not None and seen in ("0", "1"):
+        viewed = Viewing.objects.filter(user=seen_user_id).values("movie_id")
+        movies = movies.filter(pk__in=viewed) if seen == "1" else movies.exclude(pk__in=viewed)
+    if category_ids:
+        in_categories = Movie.categories.through.objects.filter(category__in=category_ids)
+        movies = movies.filter(pk__in=in_categories.values("movie_id"))
+    if streaming_id is not None:
+        movies = movies.filter(streaming_services=streaming_id)
+    if recommender_id is not None:
+        movies = movies.filter(recommended_by=recommender_id)
+    for role, name in people.items():
+        movies = filter_by_person(movies, role, name)
+    return movies
+
+
+def filter_movies(params, user):
+    """
+    Apply the grid's search, sort and filter query params (a QueryDict such
+    as request.GET) for `user`, who may be anonymous. Returns a dict:
+
+    - movies / ordering: every filtered movie, and its SORT_OPTIONS ordering
+    - ranked_ids: with q= and the relevance sort, the best SEARCH_RESULT_LIMIT
+      search hits among them in relevance order; otherwise None
+    - selected: the chosen filter values, for re-rendering the filter form
+    - facet_counts: per-option match counts from the facet index
+    """
+    # Categories etc. are only loaded for cards missing from the card cache
+    movies = Movie.objects.all()
+
+    # --- Free-text search (FTS5, see search.py) ---
+    q = params.get("q", "").strip()
+
+    # --- Sorting ---
+    sort_key = params.get("sort") or ("relevance" if q else "title_asc")
+    ordering = SORT_OPTIONS.get(sort_key, "title")
+
+    # --- Filters (answered by the in-memory facet index) ---
+    # Seen/Unseen
+    seen_filter = ""
+    if user.is_authenticated:
+        seen_filter = params.get("seen", "")
+
+    # Categories (multi-choice)
+    category_ids = params.getlist("categories")
+
+    # Director / Writer / Starring filters (exact person)
+    director_filter = params.get("director", "")
+    writer_filter = params.get("writer", "")
+    starring_filter = params.get("starring", "")
+    people = {
+        role: name
+        for role, name in (
+            (MovieCredit.Role.DIRECTOR, director_filter),
+            (MovieCredit.Role.WRITER, writer_filter),
+            (MovieCredit.Role.STARRING, starring_filter),
+        )
+        if name
+    }
+
+    # Recommender / Streaming filters
+    recommender_id = params.get("recommended_by", "")
+    streaming_id = params.get("streaming", "")
+
+    filters = {
+        "seen_user_id": user.id if user.is_authenticated else None,
+        "seen": seen_filter,
+        "category_ids": [i for i in map(int_or_none, category_ids) if i is not None],
+        "streaming_id": int_or_none(streaming_id),
+        "recommender_id": int_or_none(recommender_id),
+        "people": people,
+    }
+    matches, facet_counts = facet_index.search(
+        within=ids_bitmap(matching_ids(q)) if q else None,
+        **filters,
+    )
+    movies = facet_index.restrict_queryset(
+        movies, matches, lambda movies: _filter_in_sql(movies, q, **filters)
+    )
+
+    # Only relevance ranking is capped at SEARCH_RESULT_LIMIT hits
+    ranked_ids = None
+    if q and sort_key == "relevance":
+        matched = set(bitmap_ids(matches))
+        ranked_ids = [movie_id for movie_id in search_movies(q) if movie_id in matched]
+
+    selected = {
+        "q": q,
+        "sort": sort_key,
+        "selected_seen": seen_filter,
+        "selected_categories": category_ids,
+        "selected_director": director_filter,
+        "selected_writer": writer_filter,
+        "selected_starring": starring_filter,
+        "selected_recommender": recommender_id,
+        "selected_streaming": streaming_id,
+    }
+    return {
+        "movies": movies,
+        "ordering": ordering,
+        "ranked_ids": ranked_ids,
+        "selected": selected,
+        "facet_counts": facet_counts,
+    }
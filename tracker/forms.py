@@ -1,6 +1,7 @@
 import datetime
 from django import forms
-from .models import Movie, Viewing, Category
+from django.db.models import Q
+from .models import Movie, Person, Viewing, Category, split_names
 
 YEAR_CHOICES = (
     [('', 'Not sure')] +
@@ -77,6 +78,37 @@ class MovieForm(TailwindFormMixin, forms.ModelForm):
         super().__init__(*args, **kwargs)
         self.fields["categories"].queryset = Category.objects.order_by("name")
 
+    def _clean_people(self, field):
+        """
+        Tidy a comma-separated people field and match names case-insensitively
+        to existing people, so "will ferrell" credits the same Person as
+        "Will Ferrell" and exact-person filtering finds both movies.
+        """
+        names = split_names(self.cleaned_data.get(field))
+        if names:
+            query = Q()
+            for name in names:
+                query |= Q(name__iexact=name)
+            existing = {
+                name.lower(): name
+                for name in Person.objects.filter(query).values_list("name", flat=True)
+            }
+            # Spellings that differ only in case become one name
+            tidied = {}
+            for name in names:
+                tidied.setdefault(name.lower(), existing.get(name.lower(), name))
+            names = list(tidied.values())
+        return ", ".join(names)
+
+    def clean_starring(self):
+        return self._clean_people("starring")
+
+    def clean_director(self):
+        return self._clean_people("director")
+
+    def clean_writer(self):
+        return self._clean_people("writer")
+
 
 class ViewingForm(TailwindFormMixin, forms.ModelForm):
     """
@@ -0,0 +1,120 @@
+"""
+Conditional GET and Cache-Control for the movie detail page and the
+anonymous grid.
+
+Both pages are built from movies, and a movie's updated_at moves whenever
+something either page shows about it does: Movie.save sets it,
+touched_fields() sets it alongside card_version when its viewings,
+categories, streaming services or the users named on it change (see
+cards.py), and similarity.py sets it when its similar movies do. So one
+aggregate query is enough to validate a page:
+
+- detail: the newest updated_at of the movie and its similar movies;
+- anonymous grid: the movie count and newest updated_at, plus the facet
+  options version (see facets.py) and the query string.
+
+A request whose If-None-Match or If-Modified-Since still matches gets a 304
+before the page is fetched or rendered.
+
+Anonymous pages have no CSRF token or session in them, so they're public,
+with s-maxage=TRACKER_SHARED_CACHE_SECONDS: a reverse proxy can serve them
+that long and then revalidate, while browsers revalidate every time. Vary:
+Cookie keeps members' pages out of the shared entries. A member's detail
+page has their own viewing form and a CSRF token, so its ETag also covers
+who they are and their CSRF secret, it has no Last-Modified, and it's
+private. The signed-in grid isn't handled here; its pages revalidate
+through movie_ids.
+
+With a per-process TRACKER_FACET_CACHE each worker has its own facet
+version, so grid ETags only match within a worker; a shared cache backend
+makes them match everywhere.
+"""
+import hashlib
+
+from django.conf import settings
+from django.db.models import Count, Max, Q
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+
+from .facets import facet_options_version
+from .models import Movie, SimilarMovie
+
+
+def _shared_cache_seconds():
+    return getattr(settings, "TRACKER_SHARED_CACHE_SECONDS", 60)
+
+
+def _etag_and_last_modified(request, validators):
+    """
+    `validators` is (updated_at, parts): when the page's movies last changed
+    and whatever else it depends on.
+    """
+    updated_at, parts = validators
+    user = request.user
+    if user.is_authenticated:
+        # Read when the response is finished too, as rendering the page
+        # sets a CSRF secret if the request came without one
+        viewer = (user.pk, user.get_username(), request.META.get("CSRF_COOKIE", ""))
+    else:
+        viewer = ("anonymous",)
+    key = ":".join(map(str, (*parts, updated_at and updated_at.isoformat(), *viewer)))
+    etag = f'"{hashlib.md5(key.encode(), usedforsecurity=False).hexdigest()}"'
+    # Only an anonymous page is the same for everyone as of that time
+    last_modified = None
+    if updated_at is not None and not user.is_authenticated:
+        last_modified = int(updated_at.timestamp())
+    return etag, last_modified
+
+
+def detail_validators(request, movie_id):
+    """Validators for a GET of the movie's detail page; None if there's no such movie."""
+    if request.method not in ("GET", "HEAD"):
+        return None
+    similar_ids = SimilarMovie.objects.filter(movie_id=movie_id).values("similar_id")
+    found = Movie.objects.filter(Q(pk=movie_id) | Q(pk__in=similar_ids)).aggregate(
+        movie=Count("pk", filter=Q(pk=movie_id)), updated_at=Max("updated_at")
+    )
+    if not found["movie"]:
+        return None
+    return found["updated_at"], ("detail", movie_id)
+
+
+def grid_validators(request):
+    """Validators for a GET of the grid by an anonymous visitor; None otherwise."""
+    if request.method not in ("GET", "HEAD") or request.user.is_authenticated:
+        return None
+    found = Movie.objects.aggregate(movies=Count("pk"), updated_at=Max("updated_at"))
+    return found["updated_at"], (
+        "grid",
+        found["movies"],
+        facet_options_version(),
+        request.headers.get("x-requested-with", ""),
+        request.GET.urlencode(),
+    )
+
+
+def conditional_response(request, validators, vary=()):
+    """A 304 (or 412) response if the client's copy is still current, else None."""
+    if validators is None:
+        return None
+    etag, last_modified = _etag_and_last_modified(request, validators)
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        patch_response(request, response, validators, vary)
+    return response
+
+
+def patch_response(request, response, validators, vary=()):
+    """Add the validators and the Cache-Control and Vary rules to a response."""
+    if validators is None:
+        return response
+    etag, last_modified = _etag_and_last_modified(request, validators)
+    response.headers["ETag"] = etag
+    if last_modified is not None:
+        response.headers["Last-Modified"] = http_date(last_modified)
+    if request.user.is_authenticated:
+        patch_cache_control(response, private=True, no_cache=True)
+    else:
+        patch_cache_control(response, public=True, max_age=0, s_maxage=_shared_cache_seconds())
+    patch_vary_headers(response, ["Cookie", *vary])
+    return response
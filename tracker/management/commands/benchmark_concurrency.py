@@ -0,0 +1,160 @@
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from django.test import AsyncClient, Client, override_settings
+from django.urls import reverse
+
+from tracker.models import Movie, Viewing
+
+
+def _paths():
+    movie = Movie.objects.order_by("-viewing_count", "pk").first()
+    if movie is None:
+        raise CommandError("Nothing to benchmark; run generate_synthetic_data first.")
+    return [reverse("movie_list"), reverse("movie_detail", args=[movie.pk]), reverse("movie_suggest")]
+
+
+def _summary(latencies, elapsed):
+    latencies.sort()
+    percentiles = statistics.quantiles(latencies, n=100, method="inclusive")
+    return {
+        "requests": len(latencies),
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies), 2),
+        "p95_ms": round(percentiles[94], 2),
+        "p99_ms": round(percentiles[98], 2),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare WSGI (sync views, one thread per client) against ASGI (the "
+        "async views, one task per client) under concurrent clients. Each "
+        "runs in its own process, with the request handler called in-process "
+        "rather than through a server, and reports requests per second and "
+        "p50/p95/p99 latency."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, default=16, help="Simultaneous clients.")
+        parser.add_argument("--requests", type=int, default=400, help="Requests per mode.")
+        parser.add_argument("--paths", nargs="*", help="Paths to cycle through (default: grid, detail, suggest).")
+        parser.add_argument("--user", help="Username to log in as (default: the most active member).")
+        parser.add_argument(
+            "--asgi-settings",
+            default="movie_club.settings_asgi",
+            help="Settings module for the ASGI run.",
+        )
+        parser.add_argument("--mode", choices=["wsgi", "asgi"], help="Run one mode in this process.")
+
+    def handle(self, *args, **options):
+        if options["mode"]:
+            return self._run_mode(options)
+
+        results = {}
+        for mode in ("wsgi", "asgi"):
+            env = dict(os.environ)
+            env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(settings.BASE_DIR), env.get("PYTHONPATH")]))
+            if mode == "asgi":
+                env["DJANGO_SETTINGS_MODULE"] = options["asgi_settings"]
+            command = [
+                sys.executable, "-m", "django", "benchmark_concurrency", "--mode", mode,
+                "--concurrency", str(options["concurrency"]), "--requests", str(options["requests"]),
+            ]
+            if options["paths"]:
+                command += ["--paths", *options["paths"]]
+            if options["user"]:
+                command += ["--user", options["user"]]
+            finished = subprocess.run(command, env=env, capture_output=True, text=True)
+            if finished.returncode:
+                raise CommandError(f"The {mode} run failed:\n{finished.stderr}")
+            results[mode] = json.loads(finished.stdout.strip().splitlines()[-1])
+            r = results[mode]
+            self.stdout.write(
+                f"{mode}: {r['rps']:8.1f} req/s  p50 {r['p50_ms']:8.2f} ms  "
+                f"p95 {r['p95_ms']:8.2f} ms  p99 {r['p99_ms']:8.2f} ms"
+            )
+        ratio = results["asgi"]["rps"] / results["wsgi"]["rps"]
+        self.stdout.write(self.style.SUCCESS(f"ASGI serves {ratio:.2f}x the requests per second of WSGI."))
+
+    # --- One mode, in a child process ---
+
+    def _member(self, username):
+        if username:
+            try:
+                return User.objects.get(username=username)
+            except User.DoesNotExist:
+                raise CommandError(f"No user {username!r}.")
+        busiest = Viewing.objects.order_by().values("user").annotate(n=Count("pk")).order_by("-n").first()
+        if busiest is None:
+            raise CommandError("No viewings to benchmark with; run generate_synthetic_data first.")
+        return User.objects.get(pk=busiest["user"])
+
+    def _run_mode(self, options):
+        if options["mode"] == "asgi" and not getattr(settings, "TRACKER_ASYNC_VIEWS", False):
+            raise CommandError("The ASGI run needs settings with TRACKER_ASYNC_VIEWS set.")
+        user = self._member(options["user"])
+        paths = options["paths"] or _paths()
+        # Request i goes to paths[i % len(paths)]
+        requests = [paths[i % len(paths)] for i in range(options["requests"])]
+
+        with override_settings(DEBUG=False, ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]):
+            run = self._run_wsgi if options["mode"] == "wsgi" else self._run_asgi
+            latencies, elapsed = run(user, requests, options["concurrency"])
+        self.stdout.write(json.dumps(_summary(latencies, elapsed)))
+
+    def _run_wsgi(self, user, requests, concurrency):
+        local = threading.local()
+
+        def fetch(path):
+            client = getattr(local, "client", None)
+            if client is None:
+                client = local.client = Client()
+                client.force_login(user)
+            started = time.perf_counter()
+            response = client.get(path)
+            if response.status_code >= 400:
+                raise CommandError(f"GET {path} returned {response.status_code}.")
+            return (time.perf_counter() - started) * 1000
+
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            # One untimed round to log every client in and warm the caches
+            list(pool.map(fetch, requests[:concurrency]))
+            started = time.perf_counter()
+            latencies = list(pool.map(fetch, requests))
+        return latencies, time.perf_counter() - started
+
+    def _run_asgi(self, user, requests, concurrency):
+        async def client_loop(client, queue, latencies):
+            while queue:
+                path = queue.pop()
+                started = time.perf_counter()
+                response = await client.get(path)
+                if response.status_code >= 400:
+                    raise CommandError(f"GET {path} returned {response.status_code}.")
+                latencies.append((time.perf_counter() - started) * 1000)
+
+        async def main():
+            clients = [AsyncClient() for _ in range(concurrency)]
+            for client in clients:
+                await client.aforce_login(user)
+            warmup = requests[:concurrency]
+            await asyncio.gather(*(client_loop(c, [p], []) for c, p in zip(clients, warmup)))
+
+            queue, latencies = list(reversed(requests)), []
+            started = time.perf_counter()
+            await asyncio.gather(*(client_loop(c, queue, latencies) for c in clients))
+            return latencies, time.perf_counter() - started
+
+        return asyncio.run(main())
@@ -0,0 +1,190 @@
+import json
+import statistics
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from tracker import facet_index
+from tracker.models import Category, Movie, Viewing
+
+
+def _scenarios(movie, category, user):
+    """(name, method, url, data, logged in) for every view in tracker/urls.py."""
+    grid = reverse("movie_list")
+    first_page = list(Movie.objects.order_by("title", "pk").values_list("pk", flat=True)[:24])
+    return [
+        ("movie_list", "get", grid, {}, False),
+        ("movie_list:member", "get", grid, {"seen": "0"}, True),
+        ("movie_list:filtered", "get", grid, {"categories": category.pk, "sort": "top_rated"}, True),
+        ("movie_list:search", "get", grid, {"q": movie.title.split()[0]}, True),
+        ("movie_grid", "get", reverse("movie_grid"), {}, True),
+        ("movie_ids", "get", reverse("movie_ids"), {"sort": "recent"}, True),
+        ("movie_cards", "get", reverse("movie_cards"), {"ids": ",".join(map(str, first_page))}, True),
+        ("export_movies", "get", reverse("export_movies", args=["csv"]), {"categories": category.pk}, False),
+        ("export_viewings", "get", reverse("export_viewings", args=["jsonl"]), {}, True),
+        ("toggle_seen", "post", reverse("toggle_seen", args=[movie.pk]), {}, True),
+        (
+            "toggle_seen_batch",
+            "post",
+            reverse("toggle_seen_batch"),
+            {"ids": ",".join(map(str, first_page)), "seen": "1"},
+            True,
+        ),
+        ("movie_suggest", "get", reverse("movie_suggest"), {}, True),
+        ("movie_suggest:rated", "post", reverse("movie_suggest"), {"mode": "rated", "count": 3}, True),
+        ("movie_recommendations", "get", reverse("movie_recommendations"), {}, True),
+        ("club_stats", "get", reverse("club_stats"), {}, False),
+        ("club_stats_data", "get", reverse("club_stats_data"), {"member": user.username}, False),
+        ("add_movie", "get", reverse("add_movie"), {}, True),
+        ("movie_detail", "get", reverse("movie_detail", args=[movie.pk]), {}, True),
+        ("movie_edit", "get", reverse("movie_edit", args=[movie.pk]), {}, True),
+        ("movie_delete", "get", reverse("movie_delete", args=[movie.pk]), {}, True),
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        "Time every tracker view against the current database (e.g. one filled "
+        "by generate_synthetic_data) and record p50/p95 latency and query counts. "
+        "Compares against a JSON baseline and fails on regressions; --save "
+        "writes the results as the new baseline. Writes are rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--baseline", default="benchmark_baseline.json", help="Baseline JSON file.")
+        parser.add_argument("--save", action="store_true", help="Write these results as the baseline.")
+        parser.add_argument("--iterations", type=int, default=20, help="Timed requests per view.")
+        parser.add_argument("--warmup", type=int, default=2, help="Untimed requests per view first.")
+        parser.add_argument(
+            "--cold",
+            action="store_true",
+            help="Clear the caches and facet index before every request.",
+        )
+        parser.add_argument(
+            "--tolerance",
+            type=float,
+            default=0.25,
+            help="Allowed p95 slowdown over the baseline, as a fraction (default 0.25).",
+        )
+        parser.add_argument(
+            "--min-delta-ms",
+            type=float,
+            default=2.0,
+            help="Ignore p95 slowdowns smaller than this, as noise.",
+        )
+        parser.add_argument("--only", nargs="*", help="Benchmark just these scenario names.")
+        parser.add_argument("--user", help="Username to log in as (default: the most active member).")
+
+    def _member(self, username):
+        if username:
+            try:
+                return User.objects.get(username=username)
+            except User.DoesNotExist:
+                raise CommandError(f"No user {username!r}.")
+        busiest = (
+            Viewing.objects.order_by().values("user").annotate(n=Count("pk")).order_by("-n").first()
+        )
+        if busiest is None:
+            raise CommandError("No viewings to benchmark with; run generate_synthetic_data first.")
+        return User.objects.get(pk=busiest["user"])
+
+    def _reset(self):
+        for alias in settings.CACHES:
+            caches[alias].clear()
+        facet_index.index.invalidate()
+
+    def _request(self, client, method, url, data):
+        # Roll back whatever the view writes so every sample sees the same data
+        with transaction.atomic():
+            response = getattr(client, method)(url, data)
+            if response.streaming:
+                b"".join(response.streaming_content)
+            transaction.set_rollback(True)
+        if response.status_code >= 400:
+            raise CommandError(f"{method.upper()} {url} returned {response.status_code}.")
+
+    def _measure(self, client, method, url, data, options):
+        for _ in range(options["warmup"]):
+            self._request(client, method, url, data)
+        timings, queries = [], []
+        for _ in range(options["iterations"]):
+            if options["cold"]:
+                self._reset()
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                self._request(client, method, url, data)
+                timings.append((time.perf_counter() - started) * 1000)
+            queries.append(len(captured))
+        percentiles = statistics.quantiles(timings, n=100, method="inclusive")
+        return {
+            "p50_ms": round(statistics.median(timings), 2),
+            "p95_ms": round(percentiles[94], 2),
+            "queries": max(queries),
+        }
+
+    def handle(self, *args, **options):
+        if options["iterations"] < 2:
+            raise CommandError("--iterations must be at least 2.")
+        movie = Movie.objects.order_by("-viewing_count", "pk").first()
+        category = Category.objects.order_by("pk").first()
+        if movie is None or category is None:
+            raise CommandError("Nothing to benchmark; run generate_synthetic_data first.")
+        user = self._member(options["user"])
+
+        anonymous, member = Client(), Client()
+        member.force_login(user)
+
+        results = {}
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]):
+            for name, method, url, data, logged_in in _scenarios(movie, category, user):
+                if options["only"] and name not in options["only"]:
+                    continue
+                results[name] = self._measure(member if logged_in else anonymous, method, url, data, options)
+                self.stdout.write(
+                    f"{name:24} p50 {results[name]['p50_ms']:8.2f} ms  "
+                    f"p95 {results[name]['p95_ms']:8.2f} ms  {results[name]['queries']:3} queries"
+                )
+
+        report = {
+            "recorded_at": timezone.now().isoformat(timespec="seconds"),
+            "movies": Movie.objects.count(),
+            "viewings": Viewing.objects.count(),
+            "users": User.objects.count(),
+            "cold": options["cold"],
+            "views": results,
+        }
+        path = Path(options["baseline"])
+        if options["save"]:
+            path.write_text(json.dumps(report, indent=2) + "\n")
+            self.stdout.write(self.style.SUCCESS(f"Saved the baseline to {path}."))
+            return
+        if not path.exists():
+            self.stdout.write(f"No baseline at {path}; run with --save to record one.")
+            return
+
+        baseline = json.loads(path.read_text())["views"]
+        regressions = []
+        for name, result in results.items():
+            base = baseline.get(name)
+            if base is None:
+                continue
+            slower = result["p95_ms"] - base["p95_ms"]
+            if slower > options["min_delta_ms"] and result["p95_ms"] > base["p95_ms"] * (1 + options["tolerance"]):
+                regressions.append(f"{name}: p95 {base['p95_ms']} -> {result['p95_ms']} ms")
+            if result["queries"] > base["queries"]:
+                regressions.append(f"{name}: {base['queries']} -> {result['queries']} queries")
+        if regressions:
+            for regression in regressions:
+                self.stderr.write(regression)
+            raise CommandError(f"{len(regressions)} regression(s) against {path}.")
+        self.stdout.write(self.style.SUCCESS(f"No regressions against {path}."))
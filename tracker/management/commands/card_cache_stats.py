@@ -0,0 +1,42 @@
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS
+from django.core.management.base import BaseCommand
+
+from tracker.cards import card_cache_stats, reset_card_cache_stats
+from tracker.checks import PROCESS_LOCAL_CACHES, cache_backend
+
+
+class Command(BaseCommand):
+    help = (
+        "Report the movie grid's card fragment cache hit and miss counts, "
+        "summed across workers through TRACKER_CARD_CACHE. That has to be a "
+        "cache the web processes share with this one (FileBasedCache, "
+        "Memcached, Redis); with a per-process cache such as LocMemCache "
+        "this command only sees its own counts, which are zero."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--reset",
+            action="store_true",
+            help="Zero the counters after reporting them.",
+        )
+
+    def handle(self, *args, **options):
+        alias = getattr(settings, "TRACKER_CARD_CACHE", DEFAULT_CACHE_ALIAS)
+        if cache_backend(alias) in PROCESS_LOCAL_CACHES:
+            self.stderr.write(self.style.WARNING(
+                f"TRACKER_CARD_CACHE ({alias!r}) is a per-process cache, so the "
+                "web processes' counts can't be seen from here."
+            ))
+        stats = card_cache_stats()
+        self.stdout.write(f"hits: {stats['hits']}")
+        self.stdout.write(f"misses: {stats['misses']}")
+        if stats["hit_rate"] is None:
+            self.stdout.write("hit rate: n/a (no lookups yet)")
+        else:
+            self.stdout.write(f"hit rate: {stats['hit_rate']:.1%}")
+
+        if options["reset"]:
+            reset_card_cache_stats()
+            self.stdout.write(self.style.SUCCESS("Counters reset."))
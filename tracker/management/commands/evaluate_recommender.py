@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from tracker.recommender import evaluate
+
+
+class Command(BaseCommand):
+    help = (
+        "Hold out a random share of the ratings, train on the rest and report "
+        "RMSE and precision@k on the held-out part. Stores nothing."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--test-fraction", type=float, default=0.2, help="Share of ratings held out (default: 0.2).")
+        parser.add_argument("--k", type=int, default=10, help="List length for precision@k (default: 10).")
+        parser.add_argument(
+            "--relevant",
+            type=float,
+            default=4.0,
+            help="Held-out rating that counts as a hit for precision@k (default: 4.0).",
+        )
+        parser.add_argument("--seed", type=int, default=0, help="Random seed for the split (default: 0).")
+        parser.add_argument("--factors", type=int, default=16, help="Latent dimensions (default: 16).")
+        parser.add_argument("--iterations", type=int, default=15, help="ALS sweeps (default: 15).")
+        parser.add_argument("--regularization", type=float, default=None, help="Ridge penalty per rating.")
+
+    def handle(self, *args, **options):
+        try:
+            results = evaluate(
+                test_fraction=options["test_fraction"],
+                k=options["k"],
+                relevant=options["relevant"],
+                seed=options["seed"],
+                factors=options["factors"],
+                iterations=options["iterations"],
+                regularization=options["regularization"],
+            )
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        self.stdout.write(f"train ratings: {results['train_ratings']}")
+        self.stdout.write(f"test ratings: {results['test_ratings']}")
+        self.stdout.write(f"RMSE: {results['rmse']:.4f} (mean-rating baseline {results['baseline_rmse']:.4f})")
+        if results["precision_at_k"] is None:
+            self.stdout.write(f"precision@{options['k']}: n/a (no held-out rating >= {options['relevant']})")
+        else:
+            self.stdout.write(
+                f"precision@{options['k']}: {results['precision_at_k']:.4f} "
+                f"over {results['evaluated_users']} member(s)"
+            )
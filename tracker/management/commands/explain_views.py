@@ -0,0 +1,115 @@
+import re
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import Client, override_settings
+
+from tracker.management.commands.benchmark_views import _scenarios
+from tracker.models import Category, Movie, Viewing
+
+# Plan steps worth a second look: a table read end to end without an index,
+# or a sort that no index provides
+WARNING_RE = re.compile(r"^(SCAN \w+$|USE TEMP B-TREE)")
+
+
+class _Recorder:
+    """Execute wrapper keeping each distinct statement with its first parameters."""
+
+    def __init__(self):
+        self.statements = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        if not many:
+            self.statements.setdefault(sql, params)
+        return execute(sql, params, many, context)
+
+
+def _plan_lines(rows):
+    """EXPLAIN QUERY PLAN rows (id, parent, _, detail) as indented lines."""
+    depth = {0: -1}
+    lines = []
+    for node, parent, _, detail in rows:
+        depth[node] = depth.get(parent, -1) + 1
+        lines.append("  " * depth[node] + detail)
+    return lines
+
+
+class Command(BaseCommand):
+    help = (
+        "Run every tracker view against the current database and print "
+        "SQLite's EXPLAIN QUERY PLAN for each distinct query it makes. Steps "
+        "that scan a whole table without an index or sort through a temporary "
+        "B-tree are marked with '!'. Writes are rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--only", nargs="*", help="Just these scenario names (see benchmark_views).")
+        parser.add_argument(
+            "--warnings",
+            action="store_true",
+            help="Only print queries whose plan has a marked step.",
+        )
+        parser.add_argument("--user", help="Username to log in as (default: the most active member).")
+
+    def _member(self, username):
+        if username:
+            try:
+                return User.objects.get(username=username)
+            except User.DoesNotExist:
+                raise CommandError(f"No user {username!r}.")
+        busiest = Viewing.objects.order_by().values("user").annotate(n=Count("pk")).order_by("-n").first()
+        if busiest is None:
+            raise CommandError("No viewings to explain with; run generate_synthetic_data first.")
+        return User.objects.get(pk=busiest["user"])
+
+    def _explain(self, sql, params):
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+            return _plan_lines(cursor.fetchall())
+
+    def handle(self, *args, **options):
+        if connection.vendor != "sqlite":
+            raise CommandError("EXPLAIN QUERY PLAN is SQLite's; this database is %s." % connection.vendor)
+        movie = Movie.objects.order_by("-viewing_count", "pk").first()
+        category = Category.objects.order_by("pk").first()
+        if movie is None or category is None:
+            raise CommandError("Nothing to explain; run generate_synthetic_data first.")
+        user = self._member(options["user"])
+
+        anonymous, member = Client(), Client()
+        member.force_login(user)
+
+        flagged = 0
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]):
+            for name, method, url, data, logged_in in _scenarios(movie, category, user):
+                if options["only"] and name not in options["only"]:
+                    continue
+                recorder = _Recorder()
+                with transaction.atomic():
+                    with connection.execute_wrapper(recorder):
+                        response = getattr(member if logged_in else anonymous, method)(url, data)
+                        if response.streaming:
+                            b"".join(response.streaming_content)
+                    plans = [(sql, self._explain(sql, params)) for sql, params in recorder.statements.items()]
+                    transaction.set_rollback(True)
+
+                shown = []
+                for sql, plan in plans:
+                    marked = [bool(WARNING_RE.match(line.strip())) for line in plan]
+                    flagged += any(marked)
+                    if options["warnings"] and not any(marked):
+                        continue
+                    shown.append((sql, plan, marked))
+                if not shown:
+                    continue
+                self.stdout.write(self.style.MIGRATE_HEADING(f"{name} ({method.upper()} {url})"))
+                for sql, plan, marked in shown:
+                    self.stdout.write(f"  {sql}")
+                    for line, mark in zip(plan, marked):
+                        self.stdout.write(f"  {'!' if mark else ' '}   {line}")
+                    self.stdout.write("")
+
+        self.stdout.write(f"{flagged} queries with a full scan or a temporary sort.")
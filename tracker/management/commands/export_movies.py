@@ -0,0 +1,82 @@
+from pathlib import Path
+
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.management.base import BaseCommand, CommandError
+from django.http import QueryDict
+
+from tracker.export import (
+    EXPORT_FORMATS,
+    MOVIE_COLUMNS,
+    VIEWING_COLUMNS,
+    encode_lines,
+    movie_record,
+    movies_in_order,
+    viewing_record,
+    viewings_in_order,
+)
+from tracker.filters import filter_movies
+from tracker.models import Viewing
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream movies and/or viewings out as CSV or JSON Lines, in the format "
+        "import_movies reads. --query takes a movie list query string "
+        "(e.g. 'categories=3&sort=year_desc') to export just those movies."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--output", "-o", default="-", help="File to write; '-' (the default) is stdout.")
+        parser.add_argument("--format", choices=sorted(EXPORT_FORMATS), help="Defaults to the output's extension, else jsonl.")
+        parser.add_argument(
+            "--type",
+            choices=["movie", "viewing", "all"],
+            default="movie",
+            help="What to export; 'all' (movies, then viewings) needs JSON Lines.",
+        )
+        parser.add_argument("--query", default="", help="Movie list filters, as a query string.")
+        parser.add_argument("--user", help="Username for the seen filter, and the only member whose viewings are exported.")
+
+    def handle(self, *args, **options):
+        output = options["output"]
+        fmt = options["format"] or (Path(output).suffix.lstrip(".").lower() if output != "-" else "")
+        if fmt not in EXPORT_FORMATS:
+            fmt = "jsonl"
+        if options["type"] == "all" and fmt == "csv":
+            raise CommandError("Movies and viewings have different columns; export them to separate CSV files.")
+
+        user = AnonymousUser()
+        if options["user"]:
+            try:
+                user = User.objects.get(username=options["user"])
+            except User.DoesNotExist:
+                raise CommandError(f"No user {options['user']!r}.")
+
+        grid = filter_movies(QueryDict(options["query"]), user)
+
+        chunks = []
+        if options["type"] in ("movie", "all"):
+            movies = movies_in_order(grid["movies"], grid["ordering"], grid["ranked_ids"])
+            chunks.append(encode_lines(map(movie_record, movies), fmt, MOVIE_COLUMNS))
+        if options["type"] in ("viewing", "all"):
+            viewings = Viewing.objects.filter(movie__in=grid["movies"])
+            if user.is_authenticated:
+                viewings = viewings.filter(user=user)
+            chunks.append(encode_lines(map(viewing_record, viewings_in_order(viewings)), fmt, VIEWING_COLUMNS))
+
+        if output == "-":
+            for lines in chunks:
+                for line in lines:
+                    self.stdout.write(line, ending="")
+            return
+        try:
+            stream = open(output, "w", encoding="utf-8", newline="")
+        except OSError as exc:
+            raise CommandError(str(exc))
+        rows = 0
+        with stream:
+            for lines in chunks:
+                for line in lines:
+                    stream.write(line)
+                    rows += 1
+        self.stdout.write(self.style.SUCCESS(f"Wrote {rows} lines to {output}."))
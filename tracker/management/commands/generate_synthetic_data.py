@@ -0,0 +1,293 @@
+import datetime
+import itertools
+import random
+import time
+from bisect import bisect
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from tracker import facet_index
+from tracker.facets import invalidate_facet_options
+from tracker.models import (
+    Category,
+    Movie,
+    MovieCredit,
+    Person,
+    StreamingService,
+    Viewing,
+    new_card_version,
+)
+from tracker.ratings import refresh_rating_aggregates
+from tracker.search import rebuild_search_index
+from tracker.similarity import rebuild_similar_movies
+from tracker.stats import rebuild_stats
+
+USERNAME_PREFIX = "synth_user_"
+
+FIRST_NAMES = (
+    "Ada Alan Alice Amir Ana Ben Bea Carl Chen Clara Dan Dana Eli Emma Eva Finn Gail Gus Hana Hugo "
+    "Ida Ivan Jack Jade Jon Kai Kate Leo Lena Liam Lou Max Maya Mia Nat Nina Noah Ola Omar Pia "
+    "Raj Ray Rosa Sam Sara Tom Uma Vera Wes Zoe"
+).split()
+LAST_NAMES = (
+    "Abbott Baker Bell Brooks Carter Chang Cole Cruz Diaz Dunn Ellis Evans Fox Garcia Gray Hale "
+    "Hayes Hill Holt Hunt Ito Jones Kane Kim Knox Lane Lee Lopez Lowe Marsh Meyer Mills Moss Nash "
+    "Neal Nolan Olsen Ortiz Page Park Patel Price Quinn Reed Reyes Ross Russo Shaw Silva Singh "
+    "Stone Stark Todd Vance Wade Walsh Ward Webb West Wolfe Wong Wood Young"
+).split()
+WORDS = (
+    "snow holiday winter night star bell candle gift home family journey miracle secret letter "
+    "train city village mountain forest river north christmas eve morning light heart wish "
+    "dream song dance party kitchen cookie tree window street frost storm fire carol angel "
+    "reindeer sleigh elf toy workshop stocking chimney market skate lake cabin road return "
+    "promise stranger friend brother sister father mother daughter son uncle grandmother "
+    "neighbour detective thief prince princess king queen ghost spirit past present future"
+).split()
+SERVICE_NAMES = (
+    "Netflix", "Hulu", "Prime Video", "Disney+", "Max", "Peacock", "Paramount+", "Apple TV+",
+    "Tubi", "Pluto TV", "Kanopy", "Criterion Channel", "Mubi", "Shudder", "Starz", "Showtime",
+)
+
+
+def _zipf_cum_weights(n, exponent=1.0):
+    """Cumulative weights for picking index i with probability ~ 1 / (i + 1)^exponent."""
+    return list(itertools.accumulate(1 / (i + 1) ** exponent for i in range(n)))
+
+
+def _pick(rng, cum_weights):
+    return bisect(cum_weights, rng.random() * cum_weights[-1])
+
+
+def _pick_distinct(rng, cum_weights, count):
+    count = min(count, len(cum_weights))
+    if count > len(cum_weights) // 2:
+        # Rejection sampling would crawl through the long tail; take a plain sample
+        return rng.sample(range(len(cum_weights)), count)
+    chosen = {}
+    while len(chosen) < count:
+        chosen.setdefault(_pick(rng, cum_weights), None)
+    return list(chosen)
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the database with a synthetic catalogue for load and regression "
+        "testing: movies with skewed category, streaming and people fan-out, "
+        "members with skewed activity, and viewings whose ratings follow each "
+        "movie's quality. Refuses to add to a database that already has movies "
+        "unless --append is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--movies", type=int, default=1000)
+        parser.add_argument("--users", type=int, default=50)
+        parser.add_argument("--viewings", type=int, default=20000)
+        parser.add_argument("--categories", type=int, default=20)
+        parser.add_argument("--services", type=int, default=10)
+        parser.add_argument("--people", type=int, default=None, help="Default: about two per movie.")
+        parser.add_argument("--seed", type=int, default=0, help="Random seed; the same seed gives the same data.")
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--append", action="store_true", help="Add to a database that already has movies.")
+        parser.add_argument(
+            "--similar",
+            action="store_true",
+            help="Also rebuild similar movies (slow for large catalogues).",
+        )
+
+    def handle(self, *args, **options):
+        if not options["append"] and Movie.objects.exists():
+            raise CommandError("The database already has movies; pass --append to add to them.")
+        if options["users"] < 1 and options["viewings"]:
+            raise CommandError("Viewings need at least one user.")
+
+        self.rng = random.Random(options["seed"])
+        self.batch_size = options["batch_size"]
+        started = time.monotonic()
+        with transaction.atomic():
+            categories = self._named_rows(Category, [f"Genre {i + 1:02}" for i in range(options["categories"])])
+            services = self._named_rows(StreamingService, self._service_names(options["services"]))
+            people = self._people(options["people"] or max(options["movies"] * 2, 10))
+            users = self._users(options["users"])
+            movies, quality = self._movies(options["movies"], categories, services, people, users)
+            viewings = self._viewings(options["viewings"], movies, quality, users)
+        self.stdout.write(
+            f"Created {len(movies)} movies, {len(users)} users and {viewings} viewings "
+            f"in {time.monotonic() - started:.1f}s."
+        )
+
+        self.stdout.write("Rebuilding rating aggregates, stats, the search index and the facet index…")
+        refresh_rating_aggregates()
+        rebuild_stats()
+        rebuild_search_index()
+        facet_index.index.invalidate()
+        invalidate_facet_options()
+        if options["similar"]:
+            self.stdout.write("Rebuilding similar movies…")
+            rebuild_similar_movies()
+        self.stdout.write(self.style.SUCCESS(f"Done in {time.monotonic() - started:.1f}s."))
+
+    # --- Lookups ---
+
+    def _service_names(self, count):
+        return [SERVICE_NAMES[i] if i < len(SERVICE_NAMES) else f"Service {i + 1}" for i in range(count)]
+
+    def _named_rows(self, model, names):
+        model.objects.bulk_create([model(name=name) for name in names], ignore_conflicts=True)
+        by_name = dict(model.objects.filter(name__in=names).values_list("name", "id"))
+        return [by_name[name] for name in names]
+
+    def _people(self, count):
+        names = []
+        pairs = list(itertools.product(FIRST_NAMES, LAST_NAMES))
+        self.rng.shuffle(pairs)
+        for i in range(count):
+            first, last = pairs[i % len(pairs)]
+            round_ = i // len(pairs)
+            names.append(f"{first} {last}" if round_ == 0 else f"{first} {last} {round_ + 1}")
+        for start in range(0, len(names), self.batch_size):
+            Person.objects.bulk_create(
+                [Person(name=name) for name in names[start:start + self.batch_size]], ignore_conflicts=True
+            )
+        ids = {}
+        for start in range(0, len(names), self.batch_size):
+            chunk = names[start:start + self.batch_size]
+            ids.update(Person.objects.filter(name__in=chunk).values_list("name", "id"))
+        return [(ids[name], name) for name in names]
+
+    def _users(self, count):
+        offset = User.objects.filter(username__startswith=USERNAME_PREFIX).count()
+        password = make_password("synthetic")
+        users = [
+            User(
+                username=f"{USERNAME_PREFIX}{offset + i + 1:06}",
+                first_name=self.rng.choice(FIRST_NAMES),
+                password=password,
+            )
+            for i in range(count)
+        ]
+        User.objects.bulk_create(users, batch_size=self.batch_size)
+        return list(
+            User.objects.filter(username__in=[u.username for u in users]).order_by("username").values_list("id", flat=True)
+        )
+
+    # --- Movies ---
+
+    def _movies(self, count, categories, services, people, users):
+        rng = self.rng
+        category_weights = _zipf_cum_weights(len(categories), 1.1) if categories else None
+        service_weights = _zipf_cum_weights(len(services), 0.8) if services else None
+        people_weights = _zipf_cum_weights(len(people), 0.9)
+        user_weights = _zipf_cum_weights(len(users), 1.0) if users else None
+        now = timezone.now()
+
+        movie_ids, quality = [], {}
+        for start in range(0, count, self.batch_size):
+            size = min(self.batch_size, count - start)
+            batch, links = [], []
+            for _ in range(size):
+                title = " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 4))).title()
+                credits = {
+                    "starring": _pick_distinct(rng, people_weights, rng.randint(2, 4)),
+                    "director": _pick_distinct(rng, people_weights, 1 if rng.random() < 0.9 else 2),
+                    "writer": _pick_distinct(rng, people_weights, rng.randint(1, 2)),
+                }
+                movie = Movie(
+                    title=title,
+                    year=rng.randint(1940, now.year),
+                    description=" ".join(rng.choice(WORDS) for _ in range(rng.randint(12, 40))).capitalize() + ".",
+                    runtime_minutes=rng.randint(75, 150),
+                    card_version=new_card_version(),
+                    **{role: ", ".join(people[i][1] for i in picked) for role, picked in credits.items()},
+                )
+                if users and rng.random() < 0.4:
+                    movie.recommended_by_id = users[_pick(rng, user_weights)]
+                batch.append(movie)
+                links.append((
+                    [categories[i] for i in _pick_distinct(rng, category_weights, 1 + min(int(rng.expovariate(1.2)), 3))]
+                    if categories else [],
+                    [services[i] for i in _pick_distinct(rng, service_weights, min(int(rng.expovariate(1.0)), 3))]
+                    if services else [],
+                    credits,
+                ))
+            Movie.objects.bulk_create(batch)
+
+            category_rows, service_rows, credit_rows = [], [], []
+            for movie, (category_ids, service_ids, credits) in zip(batch, links):
+                movie_ids.append(movie.pk)
+                # Most movies are middling; a few are loved or loathed
+                quality[movie.pk] = min(max(rng.gauss(3.2, 0.8), 0.5), 5.0)
+                category_rows += [Movie.categories.through(movie_id=movie.pk, category_id=i) for i in category_ids]
+                service_rows += [
+                    Movie.streaming_services.through(movie_id=movie.pk, streamingservice_id=i) for i in service_ids
+                ]
+                credit_rows += [
+                    MovieCredit(movie_id=movie.pk, person_id=people[i][0], role=role, order=order)
+                    for role, picked in credits.items()
+                    for order, i in enumerate(picked)
+                ]
+            Movie.categories.through.objects.bulk_create(category_rows)
+            Movie.streaming_services.through.objects.bulk_create(service_rows)
+            MovieCredit.objects.bulk_create(credit_rows)
+            self.stdout.write(f"{len(movie_ids)} / {count} movies")
+        return movie_ids, quality
+
+    # --- Viewings ---
+
+    def _share_out(self, total, weights, cap):
+        """Split `total` in proportion to `weights`, no share above `cap`."""
+        shares = [0] * len(weights)
+        open_ = set(range(len(weights)))
+        remaining = total
+        while remaining > 0 and open_:
+            weight = sum(weights[i] for i in open_)
+            for i in sorted(open_):
+                extra = min(cap - shares[i], max(1, round(remaining * weights[i] / weight)))
+                shares[i] += extra
+                if shares[i] >= cap:
+                    open_.discard(i)
+            remaining = total - sum(shares)
+        # Rounding up may overshoot slightly; trim from the busiest
+        while remaining < 0:
+            busiest = max(range(len(shares)), key=shares.__getitem__)
+            cut = min(-remaining, shares[busiest])
+            shares[busiest] -= cut
+            remaining += cut
+        return shares
+
+    def _viewings(self, count, movie_ids, quality, users):
+        if not count or not movie_ids or not users:
+            return 0
+        rng = self.rng
+        # Popular movies get most viewings; members range from lurkers to
+        # completionists
+        movie_weights = _zipf_cum_weights(len(movie_ids), 0.8)
+        activity = [rng.paretovariate(1.2) for _ in users]
+        per_user = self._share_out(min(count, len(users) * len(movie_ids)), activity, len(movie_ids))
+        start_date = timezone.now().date() - datetime.timedelta(days=5 * 365)
+
+        created, batch = 0, []
+        for user_id, wanted in zip(users, per_user):
+            bias = rng.gauss(0, 0.4)
+            for i in _pick_distinct(rng, movie_weights, wanted):
+                movie_id = movie_ids[i]
+                viewing = Viewing(user_id=user_id, movie_id=movie_id)
+                if rng.random() < 0.8:
+                    score = quality[movie_id] + bias + rng.gauss(0, 0.7)
+                    viewing.rating = Decimal(min(max(round(score * 2) / 2, 0.5), 5.0)).quantize(Decimal("0.1"))
+                if rng.random() < 0.7:
+                    viewing.watched_on = start_date + datetime.timedelta(days=rng.randrange(5 * 365))
+                if rng.random() < 0.1:
+                    viewing.comment = " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 15))).capitalize()
+                batch.append(viewing)
+                if len(batch) >= self.batch_size:
+                    Viewing.objects.bulk_create(batch)
+                    created += len(batch)
+                    batch = []
+                    self.stdout.write(f"{created} viewings")
+        Viewing.objects.bulk_create(batch)
+        return created + len(batch)
@@ -0,0 +1,69 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from tracker.models import Movie, touched_fields
+from tracker.thumbnails import needs_refresh, render_variants, replace_variants
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate poster thumbnails for movies that are missing them or named "
+        "the old way (or all movies with --force), resizing in a pool of "
+        "worker processes. Existing thumbnails are replaced, not deleted first."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count() or 1,
+            help="Number of worker processes (default: CPU count).",
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Regenerate thumbnails even where they're already up to date.",
+        )
+
+    def handle(self, *args, **options):
+        movies = Movie.objects.exclude(poster="").exclude(poster__isnull=True)
+        todo = {}
+        old_records = {}
+        for movie in movies.only("poster", "poster_thumbnails").iterator(chunk_size=500):
+            if options["force"] or needs_refresh(movie):
+                # The current variants stay up until their replacements are
+                # written over them (or, for another name, the record moves on)
+                todo[movie.pk] = movie.poster.name
+                old_records[movie.pk] = movie.poster_thumbnails
+
+        if not todo:
+            self.stdout.write("All poster thumbnails are up to date.")
+            return
+
+        # Workers only read and write image files; the parent keeps the
+        # database work, and mustn't hand its open connection to children
+        connections.close_all()
+
+        done = failed = 0
+        with ProcessPoolExecutor(max_workers=options["workers"], initializer=django.setup) as pool:
+            futures = {pool.submit(render_variants, source): pk for pk, source in todo.items()}
+            for future in as_completed(futures):
+                pk = futures[future]
+                try:
+                    record = future.result()
+                except Exception as exc:
+                    failed += 1
+                    self.stderr.write(f"Movie {pk} ({todo[pk]}): {exc}")
+                    continue
+                stored = Movie.objects.filter(pk=pk, poster=record["source"]).update(
+                    poster_thumbnails=record, **touched_fields()
+                )
+                if stored:
+                    replace_variants(old_records[pk], record)
+                done += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Generated thumbnails for {done} movie(s), {failed} failed."))
@@ -0,0 +1,478 @@
+import contextlib
+import csv
+import io
+import json
+import sys
+import time
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from tracker import facet_index
+from tracker.export import CSV_LIST_SEPARATOR
+from tracker.facets import invalidate_facet_options
+from tracker.models import (
+    Category,
+    Movie,
+    MovieCredit,
+    Person,
+    StreamingService,
+    Viewing,
+    new_card_version,
+    split_names,
+    touched_fields,
+)
+from tracker.ratings import refresh_rating_aggregates
+from tracker.search import rebuild_search_index
+from tracker.similarity import rebuild_similar_movies
+from tracker.stats import rebuild_stats
+
+MOVIE_TEXT_FIELDS = ("description", "starring", "director", "writer", "poster")
+MOVIE_INT_FIELDS = ("year", "runtime_minutes")
+VIEWING_FIELDS = ("watched_on", "rating", "comment")
+
+
+class RecordError(ValueError):
+    pass
+
+
+def _int(record, field):
+    value = record.get(field)
+    if value in (None, ""):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise RecordError(f"{field} must be a whole number, not {value!r}")
+
+
+def _names(value):
+    if value in (None, ""):
+        return []
+    if isinstance(value, str):
+        value = value.split(CSV_LIST_SEPARATOR)
+    names = []
+    for name in value:
+        name = str(name).strip()
+        if name and name not in names:
+            names.append(name)
+    return names
+
+
+def _movie_key(title, year):
+    return (title.strip().casefold(), year)
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream movies and viewings from JSON Lines or CSV into the database in "
+        "batches. Each line/row is a movie (title, year, description, "
+        "runtime_minutes, starring, director, writer, poster, recommended_by "
+        "username, categories and streaming_services by name, optional "
+        "created_at and nested viewings) or, with type=viewing, a viewing "
+        "(title, year, user username, watched_on, rating, comment). Movies "
+        "are matched on title and year, so re-importing updates them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help='Input file, or "-" for stdin.')
+        parser.add_argument(
+            "--format",
+            choices=("jsonl", "csv"),
+            help="Input format (default: from the file extension, .csv or .jsonl/.ndjson).",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Records per transaction and per bulk query (default: 500).",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Run the whole import, then roll it back.",
+        )
+        parser.add_argument(
+            "--no-create",
+            action="store_true",
+            help="Reject records naming unknown categories or streaming services instead of creating them.",
+        )
+
+    # --- Input ---
+
+    def _format(self, path, chosen):
+        if chosen:
+            return chosen
+        suffix = Path(path).suffix.lower()
+        if suffix == ".csv":
+            return "csv"
+        if suffix in (".jsonl", ".ndjson", ".json"):
+            return "jsonl"
+        raise CommandError("Can't tell the input format from the file name; pass --format.")
+
+    def _records(self, stream, fmt):
+        """Yield (line number, record dict or RecordError)."""
+        if fmt == "csv":
+            reader = csv.DictReader(stream)
+            for row in reader:
+                yield reader.line_num, {k: v for k, v in row.items() if k and v not in (None, "")}
+            return
+        for line_number, line in enumerate(stream, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as exc:
+                yield line_number, RecordError(f"invalid JSON: {exc}")
+                continue
+            if not isinstance(record, dict):
+                yield line_number, RecordError("expected a JSON object")
+                continue
+            yield line_number, record
+
+    def _batches(self, records, size):
+        batch = []
+        for item in records:
+            batch.append(item)
+            if len(batch) >= size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    # --- Lookup maps ---
+
+    def _load_maps(self):
+        self.users = dict(User.objects.values_list("username", "id"))
+        self.categories = dict(Category.objects.values_list("name", "id"))
+        self.services = dict(StreamingService.objects.values_list("name", "id"))
+        self.people = {name.lower(): (pk, name) for pk, name in Person.objects.values_list("id", "name")}
+        self.movies = {}
+        for pk, title, year in Movie.objects.values_list("id", "title", "year").iterator(chunk_size=5000):
+            self.movies[_movie_key(title, year)] = pk
+
+    def _user_id(self, username, field):
+        try:
+            return self.users[username]
+        except KeyError:
+            raise RecordError(f"{field}: no user {username!r}")
+
+    def _check_known(self, names, lookup, label):
+        missing = [name for name in names if name not in lookup]
+        if missing and self.no_create:
+            raise RecordError(f"unknown {label}: {', '.join(missing)}")
+
+    def _create_missing(self, lookup, model, names):
+        if not names:
+            return
+        model.objects.bulk_create([model(name=name) for name in names], ignore_conflicts=True)
+        lookup.update(model.objects.filter(name__in=names).values_list("name", "id"))
+
+    # --- Parsing ---
+
+    def _parse_viewing(self, record, movie_key=None):
+        if movie_key is None:
+            title = str(record.get("title") or "").strip()
+            if not title:
+                raise RecordError("viewing is missing the movie title")
+            movie_key = _movie_key(title, _int(record, "year"))
+        user = record.get("user")
+        if not user:
+            raise RecordError("viewing is missing user")
+
+        viewing = {"movie_key": movie_key, "user_id": self._user_id(user, "user")}
+        if record.get("watched_on") not in (None, ""):
+            try:
+                viewing["watched_on"] = parse_date(str(record["watched_on"]))
+            except ValueError:
+                viewing["watched_on"] = None
+            if viewing["watched_on"] is None:
+                raise RecordError(f"watched_on must be YYYY-MM-DD, not {record['watched_on']!r}")
+        if record.get("rating") not in (None, ""):
+            try:
+                viewing["rating"] = Decimal(str(record["rating"]))
+            except InvalidOperation:
+                raise RecordError(f"rating must be a number, not {record['rating']!r}")
+            if not 0 <= viewing["rating"] <= 5:
+                raise RecordError("rating must be between 0 and 5")
+        if "comment" in record:
+            viewing["comment"] = str(record["comment"] or "")
+        return viewing
+
+    def _parse_movie(self, record):
+        title = str(record.get("title") or "").strip()
+        if not title:
+            raise RecordError("movie is missing title")
+        fields = {"title": title}
+        for field in MOVIE_INT_FIELDS:
+            if field in record:
+                fields[field] = _int(record, field)
+        for field in MOVIE_TEXT_FIELDS:
+            if field in record:
+                fields[field] = str(record[field] or "")
+        if record.get("recommended_by"):
+            fields["recommended_by_id"] = self._user_id(record["recommended_by"], "recommended_by")
+        elif "recommended_by" in record:
+            fields["recommended_by_id"] = None
+
+        created_at = None
+        if record.get("created_at"):
+            try:
+                created_at = parse_datetime(str(record["created_at"]))
+            except ValueError:
+                created_at = None
+            if created_at is None:
+                raise RecordError(f"created_at must be an ISO 8601 datetime, not {record['created_at']!r}")
+
+        movie = {
+            "key": _movie_key(title, fields.get("year")),
+            "fields": fields,
+            "created_at": created_at,
+            "categories": None,
+            "streaming_services": None,
+        }
+        if "categories" in record:
+            movie["categories"] = _names(record["categories"])
+            self._check_known(movie["categories"], self.categories, "categories")
+        if "streaming_services" in record:
+            movie["streaming_services"] = _names(record["streaming_services"])
+            self._check_known(movie["streaming_services"], self.services, "streaming services")
+
+        viewings = record.get("viewings") or []
+        if not isinstance(viewings, list):
+            raise RecordError("viewings must be a list")
+        movie["viewings"] = [self._parse_viewing(v, movie["key"]) for v in viewings]
+        return movie
+
+    # --- Writing ---
+
+    def _write_movies(self, movies):
+        """Create or update a batch of parsed movies; returns their ids by key."""
+        self._create_missing(self.categories, Category, sorted({
+            name for m in movies for name in m["categories"] or () if name not in self.categories
+        }))
+        self._create_missing(self.services, StreamingService, sorted({
+            name for m in movies for name in m["streaming_services"] or () if name not in self.services
+        }))
+
+        existing_ids = [self.movies[m["key"]] for m in movies if m["key"] in self.movies]
+        existing = Movie.objects.in_bulk(existing_ids)
+        # bulk_update doesn't apply auto_now, so updated_at is set here
+        now = timezone.now()
+        created, updated, update_fields = [], [], {"card_version", "updated_at"}
+        for m in movies:
+            movie = existing.get(self.movies.get(m["key"]))
+            if movie is None:
+                movie = Movie(**m["fields"])
+                created.append(movie)
+            else:
+                for field, value in m["fields"].items():
+                    setattr(movie, field, value)
+                update_fields.update(m["fields"])
+                movie.updated_at = now
+                updated.append(movie)
+            movie.card_version = new_card_version()
+            m["movie"] = movie
+
+        Movie.objects.bulk_create(created, batch_size=self.batch_size)
+        if updated:
+            Movie.objects.bulk_update(updated, sorted(update_fields), batch_size=self.batch_size)
+        for m in movies:
+            self.movies[m["key"]] = m["movie"].pk
+
+        # auto_now_add ignores the value on insert; apply imported dates after
+        dated = []
+        for m in movies:
+            if m["created_at"] is not None:
+                m["movie"].created_at = m["created_at"]
+                dated.append(m["movie"])
+        if dated:
+            Movie.objects.bulk_update(dated, ["created_at"], batch_size=self.batch_size)
+
+        self._write_m2m(movies, "categories", Movie.categories.through, "category_id", self.categories)
+        self._write_m2m(movies, "streaming_services", Movie.streaming_services.through, "streamingservice_id", self.services)
+        self._write_credits([m["movie"] for m in movies])
+        self.counts["movies created"] += len(created)
+        self.counts["movies updated"] += len(updated)
+
+    def _write_m2m(self, movies, field, through, column, lookup):
+        replacing = [m for m in movies if m[field] is not None]
+        if not replacing:
+            return
+        through.objects.filter(movie_id__in=[m["movie"].pk for m in replacing]).delete()
+        through.objects.bulk_create(
+            [through(movie_id=m["movie"].pk, **{column: lookup[name]}) for m in replacing for name in m[field]],
+            batch_size=self.batch_size,
+            ignore_conflicts=True,
+        )
+
+    def _write_credits(self, movies):
+        """Bulk version of Movie.sync_credits for a batch of movies."""
+        wanted = {}
+        for movie in movies:
+            for role in MovieCredit.Role.values:
+                names = split_names(getattr(movie, role))
+                wanted[movie.pk, role] = names
+
+        missing = {}
+        for names in wanted.values():
+            for name in names:
+                if name.lower() not in self.people:
+                    missing.setdefault(name.lower(), name)
+        if missing:
+            Person.objects.bulk_create([Person(name=name) for name in missing.values()], ignore_conflicts=True)
+            for pk, name in Person.objects.filter(name__in=list(missing.values())).values_list("id", "name"):
+                self.people[name.lower()] = (pk, name)
+
+        MovieCredit.objects.filter(movie_id__in=[m.pk for m in movies]).delete()
+        credits = []
+        for (movie_id, role), names in wanted.items():
+            person_ids = []
+            for name in names:
+                person_id = self.people[name.lower()][0]
+                if person_id not in person_ids:
+                    person_ids.append(person_id)
+            credits.extend(
+                MovieCredit(movie_id=movie_id, person_id=person_id, role=role, order=order)
+                for order, person_id in enumerate(person_ids)
+            )
+        MovieCredit.objects.bulk_create(credits, batch_size=self.batch_size)
+
+    def _write_viewings(self, viewings):
+        rows = {}
+        for v in viewings:
+            movie_id = self.movies.get(v["movie_key"])
+            if movie_id is None:
+                self._error(v["line"], "viewing names a movie that hasn't been imported (movies must come first)")
+                continue
+            rows[v["user_id"], movie_id] = v  # the last record for a pair wins
+        if not rows:
+            return
+
+        movie_ids = {movie_id for _, movie_id in rows}
+        existing = {
+            (v.user_id, v.movie_id): v
+            for v in Viewing.objects.filter(movie_id__in=movie_ids, user_id__in={u for u, _ in rows})
+        }
+        now = timezone.now()
+        created, updated, update_fields = [], [], set()
+        for (user_id, movie_id), v in rows.items():
+            values = {field: v[field] for field in VIEWING_FIELDS if field in v}
+            viewing = existing.get((user_id, movie_id))
+            if viewing is None:
+                created.append(Viewing(user_id=user_id, movie_id=movie_id, **values))
+            else:
+                for field, value in values.items():
+                    setattr(viewing, field, value)
+                update_fields.update(values)
+                viewing.updated_at = now
+                updated.append(viewing)
+
+        Viewing.objects.bulk_create(created, batch_size=self.batch_size)
+        if updated and update_fields:
+            Viewing.objects.bulk_update(updated, sorted({*update_fields, "updated_at"}), batch_size=self.batch_size)
+        # Their cards list viewers (see cards.py) and show the club rating
+        Movie.objects.filter(pk__in=movie_ids).update(**touched_fields())
+        refresh_rating_aggregates(movie_ids)
+        self.counts["viewings created"] += len(created)
+        self.counts["viewings updated"] += len(updated)
+
+    def _import_batch(self, batch):
+        movies, viewings = {}, []
+        for line_number, record in batch:
+            try:
+                if isinstance(record, RecordError):
+                    raise record
+                if record.get("type", "movie") == "viewing":
+                    viewing = self._parse_viewing(record)
+                    viewing["line"] = line_number
+                    viewings.append(viewing)
+                elif record.get("type", "movie") == "movie":
+                    movie = self._parse_movie(record)
+                    for viewing in movie["viewings"]:
+                        viewing["line"] = line_number
+                    movies[movie["key"]] = movie  # the last record for a title/year wins
+                else:
+                    raise RecordError(f"unknown type {record['type']!r}")
+            except RecordError as exc:
+                self._error(line_number, exc)
+
+        with transaction.atomic():
+            if movies:
+                self._write_movies(list(movies.values()))
+            viewings = [v for m in movies.values() for v in m["viewings"]] + viewings
+            if viewings:
+                self._write_viewings(viewings)
+
+    def _error(self, line_number, message):
+        self.counts["errors"] += 1
+        self.stderr.write(f"line {line_number}: {message}")
+
+    # --- Follow-up ---
+
+    def _rebuild_derived(self):
+        # bulk_create/bulk_update skip the model signals that normally keep
+        # these in step
+        self.stdout.write("Rebuilding the search index, facet index, stats and similar movies…")
+        rebuild_search_index()
+        facet_index.index.invalidate()
+        invalidate_facet_options()
+        rebuild_stats()
+        # From sparse per-movie vectors (see similarity.py), not a dense
+        # movie x term matrix, so big imports don't need the memory for one
+        rebuild_similar_movies()
+        self.stdout.write(
+            "Run generate_thumbnails for new posters and train_recommender to "
+            "include the imported ratings in recommendations."
+        )
+
+    def handle(self, *args, **options):
+        self.batch_size = options["batch_size"]
+        if self.batch_size < 1:
+            raise CommandError("--batch-size must be at least 1.")
+        self.no_create = options["no_create"]
+        self.counts = dict.fromkeys(
+            ("records", "movies created", "movies updated", "viewings created", "viewings updated", "errors"), 0
+        )
+
+        path = options["path"]
+        fmt = self._format(path, options["format"]) if path != "-" else (options["format"] or "jsonl")
+        if path == "-":
+            stream = io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8", newline="")
+        else:
+            try:
+                stream = open(path, encoding="utf-8-sig", newline="")
+            except OSError as exc:
+                raise CommandError(str(exc))
+
+        started = time.monotonic()
+        # Each batch commits on its own; a dry run wraps them all to roll back
+        with stream, transaction.atomic() if options["dry_run"] else contextlib.nullcontext():
+            self._load_maps()
+            for batch in self._batches(self._records(stream, fmt), self.batch_size):
+                self._import_batch(batch)
+                self.counts["records"] += len(batch)
+                rate = self.counts["records"] / max(time.monotonic() - started, 1e-9)
+                self.stdout.write(
+                    f"{self.counts['records']} records "
+                    f"({self.counts['movies created'] + self.counts['movies updated']} movies, "
+                    f"{self.counts['viewings created'] + self.counts['viewings updated']} viewings, "
+                    f"{self.counts['errors']} errors) {rate:.0f}/s"
+                )
+            if options["dry_run"]:
+                transaction.set_rollback(True)
+
+        for name, value in self.counts.items():
+            self.stdout.write(f"{name}: {value}")
+        if options["dry_run"]:
+            self.stdout.write(self.style.WARNING("Dry run: nothing was saved."))
+            return
+        if any(self.counts[name] for name in ("movies created", "movies updated", "viewings created", "viewings updated")):
+            self._rebuild_derived()
+        self.stdout.write(self.style.SUCCESS(f"Imported in {time.monotonic() - started:.1f}s."))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from tracker.facet_index import index
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the in-memory facet index and tell running workers (through "
+        "its change log) to rebuild theirs. With --check, also compare "
+        "every bitmap against the equivalent ORM query."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Verify the rebuilt index against the database.",
+        )
+
+    def handle(self, *args, **options):
+        index.invalidate()
+        index.rebuild()
+
+        for name, value in index.stats().items():
+            self.stdout.write(f"{name}: {value}")
+
+        if options["check"]:
+            problems = index.check_against_orm()
+            for problem in problems:
+                self.stderr.write(problem)
+            if problems:
+                raise CommandError(f"Facet index disagrees with the database in {len(problems)} place(s).")
+            self.stdout.write(self.style.SUCCESS("Facet index matches the database."))
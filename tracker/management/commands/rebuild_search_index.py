@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from tracker.models import Movie
+from tracker.search import rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the full-text search table from the movies and viewings. "
+        "Only needed after writes that skip model signals, such as bulk_create."
+    )
+
+    def handle(self, *args, **options):
+        rebuild_search_index()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {Movie.objects.count()} movies."))
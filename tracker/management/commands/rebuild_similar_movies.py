@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from tracker.similarity import rebuild_similar_movies
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute every movie's TF-IDF vector (MovieTerm) and content-based "
+        "neighbours (cosine over description, categories and people) into the "
+        "SimilarMovie table."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--top-k",
+            type=int,
+            default=None,
+            help="Neighbours kept per movie (default: TRACKER_SIMILAR_MOVIES or 8).",
+        )
+
+    def handle(self, *args, **options):
+        movies, stored = rebuild_similar_movies(options["top_k"])
+        self.stdout.write(self.style.SUCCESS(f"Stored {stored} neighbour(s) for {movies} movie(s)."))
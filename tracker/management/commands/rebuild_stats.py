@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from tracker.stats import rebuild_stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the stats dashboard's rollup totals from every movie and "
+        "viewing, e.g. after bulk edits that bypass the model signals."
+    )
+
+    def handle(self, *args, **options):
+        rows = rebuild_stats()
+        self.stdout.write(self.style.SUCCESS(f"Stored {rows} rollup row(s)."))
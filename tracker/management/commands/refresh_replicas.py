@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from tracker.replicas import refresh_replica, replica_aliases
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy the primary SQLite database over each read replica's file "
+        "(TRACKER_READ_REPLICAS, see tracker/replicas.py). With --interval, "
+        "keep doing so every that many seconds."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("aliases", nargs="*", help="Replica aliases (default: all of them).")
+        parser.add_argument("--interval", type=float, help="Refresh every this many seconds until stopped.")
+
+    def handle(self, *args, **options):
+        configured = replica_aliases()
+        aliases = options["aliases"] or configured
+        if not aliases:
+            raise CommandError("No replicas configured; set TRACKER_READ_REPLICAS.")
+        unknown = sorted(set(aliases) - set(configured))
+        if unknown:
+            raise CommandError(f"Not replicas: {', '.join(unknown)}.")
+
+        while True:
+            started = time.perf_counter()
+            for alias in aliases:
+                try:
+                    refresh_replica(alias)
+                except ValueError as exc:
+                    raise CommandError(str(exc))
+            elapsed = (time.perf_counter() - started) * 1000
+            self.stdout.write(self.style.SUCCESS(f"Refreshed {', '.join(aliases)} in {elapsed:.0f} ms."))
+            if not options["interval"]:
+                return
+            time.sleep(max(options["interval"] - elapsed / 1000, 0))
@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from tracker.models import Movie, touched_fields
+from tracker.ratings import AGGREGATE_FIELDS, refresh_rating_aggregates
+
+
+def _snapshot():
+    return {
+        row[0]: tuple(round(value, 6) if isinstance(value, float) else value for value in row[1:])
+        for row in Movie.objects.values_list("id", *AGGREGATE_FIELDS).iterator(chunk_size=5000)
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute every movie's viewing count, rating count, mean rating and "
+        "Bayesian score from its viewings, e.g. after raw SQL edits or a change "
+        "to TRACKER_RATING_PRIOR. With --check, only report the movies that "
+        "were out of date."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Report stale movies without fixing them.",
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            before = _snapshot()
+            refresh_rating_aggregates()
+            after = _snapshot()
+            stale = sorted(pk for pk, values in after.items() if before.get(pk) != values)
+            if options["check"]:
+                transaction.set_rollback(True)
+            elif stale:
+                # Their cards show the club rating, see cards.py
+                for start in range(0, len(stale), 500):
+                    Movie.objects.filter(pk__in=stale[start:start + 500]).update(**touched_fields())
+
+        if options["check"]:
+            for pk in stale:
+                self.stderr.write(f"movie {pk}: stored {before.get(pk)}, expected {after[pk]}")
+            if stale:
+                raise CommandError(f"{len(stale)} movie(s) have stale rating aggregates.")
+            self.stdout.write(self.style.SUCCESS("Rating aggregates match the viewings."))
+            return
+        self.stdout.write(self.style.SUCCESS(f"Repaired {len(stale)} of {len(after)} movie(s)."))
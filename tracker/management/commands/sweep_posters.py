@@ -0,0 +1,68 @@
+import time
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from tracker.models import Movie
+from tracker.thumbnails import variant_names
+
+POSTER_DIR = "posters"
+
+
+class Command(BaseCommand):
+    help = (
+        "Reconcile MEDIA_ROOT/posters with the database: delete poster and "
+        "thumbnail files no movie refers to, and report movies whose poster "
+        "file is missing."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="List what would be deleted without deleting anything.",
+        )
+        parser.add_argument(
+            "--min-age",
+            type=int,
+            default=60,
+            help=(
+                "Only delete files older than this many minutes, so uploads "
+                "and thumbnails still being written are left alone (default: 60)."
+            ),
+        )
+
+    def handle(self, *args, **options):
+        referenced = set()
+        posters = Movie.objects.exclude(poster="").exclude(poster__isnull=True)
+        for name, thumbnails in posters.values_list("poster", "poster_thumbnails").iterator(chunk_size=2000):
+            referenced.add(name)
+            if thumbnails:
+                referenced.update(variant_names(thumbnails))
+
+        if not default_storage.exists(POSTER_DIR):
+            self.stdout.write(f"No {POSTER_DIR}/ directory in media storage.")
+            return
+
+        _, files = default_storage.listdir(POSTER_DIR)
+        cutoff = time.time() - options["min_age"] * 60
+        orphans = [
+            name
+            for name in (f"{POSTER_DIR}/{f}" for f in files)
+            if name not in referenced
+            and default_storage.get_modified_time(name).timestamp() < cutoff
+        ]
+
+        for name in orphans:
+            if options["dry_run"]:
+                self.stdout.write(f"Would delete {name}")
+            else:
+                default_storage.delete(name)
+                self.stdout.write(f"Deleted {name}")
+
+        on_disk = {f"{POSTER_DIR}/{f}" for f in files}
+        for name in sorted(n for n in referenced if n not in on_disk):
+            self.stderr.write(f"Missing file: {name}")
+
+        verb = "Would delete" if options["dry_run"] else "Deleted"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {len(orphans)} orphaned file(s)."))
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+
+from tracker.recommender import train
+
+
+class Command(BaseCommand):
+    help = (
+        "Factorize every Viewing rating with ALS and rebuild each member's "
+        "precomputed recommendations."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--factors", type=int, default=16, help="Latent dimensions (default: 16).")
+        parser.add_argument("--iterations", type=int, default=15, help="ALS sweeps (default: 15).")
+        parser.add_argument(
+            "--regularization",
+            type=float,
+            default=None,
+            help="Ridge penalty per rating (default: TRACKER_RECOMMENDER_REGULARIZATION or 0.1).",
+        )
+        parser.add_argument(
+            "--top-n",
+            type=int,
+            default=None,
+            help="Recommendations kept per member (default: TRACKER_RECOMMENDATIONS_PER_USER or 20).",
+        )
+
+    def handle(self, *args, **options):
+        counts = train(
+            factors=options["factors"],
+            iterations=options["iterations"],
+            regularization=options["regularization"],
+            top_n=options["top_n"],
+        )
+        for name, value in counts.items():
+            self.stdout.write(f"{name}: {value}")
+        self.stdout.write(self.style.SUCCESS("Recommendations rebuilt."))
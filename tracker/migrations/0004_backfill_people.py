@@ -0,0 +1,54 @@
+# Generated by Django 6.0 on 2026-10-17 19:10
+
+from django.db import migrations
+
+ROLES = ("starring", "director", "writer")
+
+
+def split_names(value):
+    names = []
+    for part in (value or "").split(","):
+        name = part.strip()
+        if name and name not in names:
+            names.append(name)
+    return names
+
+
+def backfill_people(apps, schema_editor):
+    Movie = apps.get_model("tracker", "Movie")
+    Person = apps.get_model("tracker", "Person")
+    MovieCredit = apps.get_model("tracker", "MovieCredit")
+
+    movies = list(Movie.objects.values_list("id", *ROLES))
+    names = {
+        name
+        for row in movies
+        for value in row[1:]
+        for name in split_names(value)
+    }
+    Person.objects.bulk_create(
+        [Person(name=name) for name in names], ignore_conflicts=True
+    )
+    person_ids = dict(Person.objects.values_list("name", "id"))
+
+    MovieCredit.objects.bulk_create(
+        [
+            MovieCredit(movie_id=row[0], person_id=person_ids[name], role=role, order=order)
+            for row in movies
+            for role, value in zip(ROLES, row[1:])
+            for order, name in enumerate(split_names(value))
+        ],
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0003_person_moviecredit'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_people, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 6.0 on 2026-10-17 20:02
+
+from django.db import migrations
+
+CREATE_SEARCH_TABLE = """
+CREATE VIRTUAL TABLE tracker_movie_search USING fts5(
+    title,
+    description,
+    people,
+    comments,
+    tokenize = 'unicode61 remove_diacritics 2',
+    prefix = '2 3'
+)
+"""
+
+BACKFILL_SEARCH_TABLE = """
+INSERT INTO tracker_movie_search (rowid, title, description, people, comments)
+SELECT
+    m.id,
+    m.title,
+    m.description,
+    m.starring || ', ' || m.director || ', ' || m.writer,
+    COALESCE(
+        (SELECT group_concat(v.comment, ' ') FROM tracker_viewing v WHERE v.movie_id = m.id),
+        ''
+    )
+FROM tracker_movie m
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0004_backfill_people'),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE_SEARCH_TABLE, "DROP TABLE tracker_movie_search"),
+        migrations.RunSQL(BACKFILL_SEARCH_TABLE, migrations.RunSQL.noop),
+    ]
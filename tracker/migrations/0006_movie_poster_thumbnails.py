@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-17 20:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0005_movie_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='poster_thumbnails',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='Generated poster variants, see tracker/thumbnails.py'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-17 21:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0006_movie_poster_thumbnails'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='card_version',
+            field=models.PositiveIntegerField(default=1, editable=False, help_text="Changes whenever the movie's grid card would, see tracker/cards.py"),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 6.0 on 2026-10-17 21:45
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('tracker', '0007_movie_card_version'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovieFactors',
+            fields=[
+                ('movie', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='factors', serialize=False, to='tracker.movie')),
+                ('bias', models.FloatField()),
+                ('vector', models.BinaryField(help_text='float32 array, little-endian')),
+            ],
+            options={
+                'verbose_name_plural': 'Movie factors',
+            },
+        ),
+        migrations.CreateModel(
+            name='UserFactors',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='movie_factors', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('bias', models.FloatField()),
+                ('vector', models.BinaryField(help_text='float32 array, little-endian')),
+            ],
+            options={
+                'verbose_name_plural': 'User factors',
+            },
+        ),
+        migrations.CreateModel(
+            name='Recommendation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField(help_text='Predicted rating, 0–5')),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('movie', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recommendations', to='tracker.movie')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recommendations', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['user', 'rank'],
+                'indexes': [models.Index(fields=['user', 'rank'], name='tracker_rec_user_rank')],
+                'unique_together': {('user', 'movie')},
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 6.0 on 2026-10-17 22:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0008_recommender'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimilarMovie',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField(help_text='Cosine similarity, 0–1')),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('movie', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar_movies', to='tracker.movie')),
+                ('similar', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='tracker.movie')),
+            ],
+            options={
+                'ordering': ['movie', 'rank'],
+                'indexes': [models.Index(fields=['movie', 'rank'], name='tracker_similar_movie_rank')],
+                'unique_together': {('movie', 'similar')},
+            },
+        ),
+    ]
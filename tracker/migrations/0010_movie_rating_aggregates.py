@@ -0,0 +1,76 @@
+# Generated by Django 6.0 on 2026-10-17 22:50
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Avg, Count, Sum
+
+
+def backfill_rating_aggregates(apps, schema_editor):
+    # Same arithmetic as tracker/ratings.py, without the live models
+    Movie = apps.get_model("tracker", "Movie")
+    Viewing = apps.get_model("tracker", "Viewing")
+    prior_mean = float(getattr(settings, "TRACKER_RATING_PRIOR", 3.0))
+    prior_weight = float(getattr(settings, "TRACKER_RATING_PRIOR_WEIGHT", 2))
+
+    viewing_counts = dict(
+        Viewing.objects.order_by().values("movie").annotate(n=Count("id")).values_list("movie", "n")
+    )
+    ratings = {
+        row["movie"]: row
+        for row in Viewing.objects.filter(rating__isnull=False)
+        .order_by()
+        .values("movie")
+        .annotate(n=Count("id"), total=Sum("rating"), mean=Avg("rating"))
+    }
+    movies = []
+    for movie in Movie.objects.filter(pk__in=viewing_counts.keys()).only("id"):
+        movie.viewing_count = viewing_counts[movie.pk]
+        rated = ratings.get(movie.pk)
+        if rated:
+            movie.rating_count = rated["n"]
+            movie.rating_mean = float(rated["mean"])
+            movie.rating_score = (prior_mean * prior_weight + float(rated["total"])) / (prior_weight + rated["n"])
+        movies.append(movie)
+    Movie.objects.bulk_update(
+        movies, ["viewing_count", "rating_count", "rating_mean", "rating_score"], batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0009_similarmovie'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='rating_mean',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='rating_score',
+            field=models.FloatField(default=0, editable=False, help_text='Mean rating shrunk towards a prior for movies with few ratings'),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='viewing_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='movie',
+            index=models.Index(fields=['rating_score', 'id'], name='tracker_movie_rating_score'),
+        ),
+        migrations.AddIndex(
+            model_name='movie',
+            index=models.Index(fields=['viewing_count', 'id'], name='tracker_movie_viewing_count'),
+        ),
+        migrations.RunPython(backfill_rating_aggregates, migrations.RunPython.noop),
+    ]
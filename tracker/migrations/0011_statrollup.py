@@ -0,0 +1,87 @@
+# Generated by Django 6.0 on 2026-10-17 23:15
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+# Each viewing's (metric, key) totals, as tracker/stats.py counts them
+VIEWING_TERMS = """
+SELECT 'viewings' AS metric, '' AS key, v.user_id, v.rating FROM tracker_viewing v
+UNION ALL
+SELECT 'month', strftime('%Y-%m', v.watched_on), v.user_id, v.rating
+FROM tracker_viewing v WHERE v.watched_on IS NOT NULL
+UNION ALL
+SELECT 'rating', printf('%.1f', v.rating), v.user_id, v.rating
+FROM tracker_viewing v WHERE v.rating IS NOT NULL
+UNION ALL
+SELECT 'category', CAST(mc.category_id AS TEXT), v.user_id, v.rating
+FROM tracker_viewing v JOIN tracker_movie_categories mc ON mc.movie_id = v.movie_id
+UNION ALL
+SELECT 'streaming', CAST(ms.streamingservice_id AS TEXT), v.user_id, v.rating
+FROM tracker_viewing v JOIN tracker_movie_streaming_services ms ON ms.movie_id = v.movie_id
+UNION ALL
+SELECT 'recommender', CAST(m.recommended_by_id AS TEXT), v.user_id, v.rating
+FROM tracker_viewing v JOIN tracker_movie m ON m.id = v.movie_id WHERE m.recommended_by_id IS NOT NULL
+"""
+
+BACKFILL_STATS = [
+    # Per member
+    f"""
+    INSERT INTO tracker_statrollup (metric, key, user_id, count, rating_count, rating_sum)
+    SELECT metric, key, user_id, COUNT(*), COUNT(rating), COALESCE(SUM(rating), 0)
+    FROM ({VIEWING_TERMS}) GROUP BY metric, key, user_id
+    """,
+    # Club-wide
+    f"""
+    INSERT INTO tracker_statrollup (metric, key, user_id, count, rating_count, rating_sum)
+    SELECT metric, key, NULL, COUNT(*), COUNT(rating), COALESCE(SUM(rating), 0)
+    FROM ({VIEWING_TERMS}) GROUP BY metric, key
+    """,
+    """
+    INSERT INTO tracker_statrollup (metric, key, user_id, count, rating_count, rating_sum)
+    SELECT 'movies', '', NULL, COUNT(*), 0, 0 FROM tracker_movie HAVING COUNT(*) > 0
+    """,
+    """
+    INSERT INTO tracker_statrollup (metric, key, user_id, count, rating_count, rating_sum)
+    SELECT 'recommended', CAST(recommended_by_id AS TEXT), NULL, COUNT(*), 0, 0
+    FROM tracker_movie WHERE recommended_by_id IS NOT NULL GROUP BY recommended_by_id
+    """,
+    """
+    INSERT INTO tracker_statrollup (metric, key, user_id, count, rating_count, rating_sum)
+    SELECT 'category_movies', CAST(category_id AS TEXT), NULL, COUNT(*), 0, 0
+    FROM tracker_movie_categories GROUP BY category_id
+    """,
+    """
+    INSERT INTO tracker_statrollup (metric, key, user_id, count, rating_count, rating_sum)
+    SELECT 'streaming_movies', CAST(streamingservice_id AS TEXT), NULL, COUNT(*), 0, 0
+    FROM tracker_movie_streaming_services GROUP BY streamingservice_id
+    """,
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0010_movie_rating_aggregates'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('metric', models.CharField(choices=[('viewings', 'Viewings'), ('month', 'Viewings per month'), ('rating', 'Ratings given'), ('category', 'Viewings per category'), ('streaming', 'Viewings per streaming service'), ('recommender', 'Viewings per recommender'), ('movies', 'Movies'), ('recommended', 'Movies per recommender'), ('category_movies', 'Movies per category'), ('streaming_movies', 'Movies per streaming service')], max_length=20)),
+                ('key', models.CharField(blank=True, max_length=20)),
+                ('count', models.IntegerField(default=0)),
+                ('rating_count', models.IntegerField(default=0)),
+                ('rating_sum', models.FloatField(default=0)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'metric'], name='tracker_stat_user_metric')],
+                'constraints': [models.UniqueConstraint(fields=('metric', 'key', 'user'), name='tracker_stat_member_unique'), models.UniqueConstraint(condition=models.Q(('user__isnull', True)), fields=('metric', 'key'), name='tracker_stat_club_unique')],
+            },
+        ),
+        migrations.RunSQL(BACKFILL_STATS, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 6.0 on 2026-10-17 23:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0013_sort_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovieTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=100)),
+                ('weight', models.FloatField(help_text="TF-IDF weight over the vector's norm")),
+                ('movie', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='tracker.movie')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['term', 'movie', 'weight'], name='tracker_movie_term')],
+                'unique_together': {('movie', 'term')},
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 6.0 on 2026-10-17 23:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0014_movieterm'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FacetChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('movie', 'Reload a movie'), ('seen', 'Member has seen a movie'), ('unseen', "Member hasn't seen a movie"), ('person', "Reload a person's name"), ('drop', 'Forget a facet option'), ('reload', 'Reload everything')], max_length=10)),
+                ('movie_id', models.IntegerField(blank=True, null=True)),
+                ('facet', models.CharField(blank=True, max_length=20)),
+                ('key', models.IntegerField(blank=True, help_text='Member, person or facet option id', null=True)),
+            ],
+        ),
+    ]
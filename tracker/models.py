@@ -1,9 +1,13 @@
-import os
+import secrets
+
 from django.dispatch import receiver
 
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.utils import timezone
+
+from .cleanup import delete_file_later
 
 
 class Category(models.Model):
@@ -25,6 +29,42 @@ class StreamingService(models.Model):
     def __str__(self):
         return self.name
 
+
+def split_names(value):
+    """Split a comma-separated people string into unique, stripped names."""
+    names = []
+    for part in (value or "").split(","):
+        name = part.strip()
+        if name and name not in names:
+            names.append(name)
+    return names
+
+
+def new_card_version():
+    # Random rather than incremented, so a stale in-memory Movie can never
+    # save back a version whose cached cards show older content
+    return secrets.randbelow(2**31 - 1) + 1
+
+
+def touched_fields():
+    """
+    Values for Movie.objects.update() that mark movies as changed: a new
+    card_version for the card cache, a new updated_at for HTTP validators.
+    """
+    return {"card_version": new_card_version(), "updated_at": timezone.now()}
+
+
+class Person(models.Model):
+    name = models.CharField(max_length=200, unique=True)
+
+    class Meta:
+        ordering = ["name"]
+        verbose_name_plural = "People"
+
+    def __str__(self):
+        return self.name
+
+
 class Movie(models.Model):
     title = models.CharField(max_length=200)
     year = models.PositiveIntegerField(blank=True, null=True)
@@ -68,31 +108,162 @@ class Movie(models.Model):
         null=True,
         help_text="Upload a movie poster image"
     )
+    poster_thumbnails = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        help_text="Generated poster variants, see tracker/thumbnails.py",
+    )
+
+    people = models.ManyToManyField(
+        Person,
+        through="MovieCredit",
+        related_name="movies",
+        blank=True,
+    )
+
+    card_version = models.PositiveIntegerField(
+        default=1,
+        editable=False,
+        help_text="Changes whenever the movie's grid card would, see tracker/cards.py",
+    )
+
+    # Maintained from Viewing by tracker/ratings.py; repair_rating_aggregates
+    # recomputes them
+    viewing_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_mean = models.FloatField(blank=True, null=True, editable=False)
+    rating_score = models.FloatField(
+        default=0,
+        editable=False,
+        help_text="Mean rating shrunk towards a prior for movies with few ratings",
+    )
 
     created_at = models.DateTimeField(auto_now_add=True)
+    # Also bumped when its viewings, categories, streaming services or
+    # similar movies change, see touched_fields() and tracker/http_cache.py
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if all(role in field_names for role in MovieCredit.Role.values):
+            instance._loaded_people = instance.people_strings()
+        if "poster" in field_names:
+            instance._loaded_poster = instance.poster.name or None
+        if "recommended_by_id" in field_names:
+            instance._loaded_recommended_by = instance.recommended_by_id
+        return instance
+
+    def people_strings(self):
+        return tuple(getattr(self, role) for role in MovieCredit.Role.values)
+
+    def people_changed(self):
+        return getattr(self, "_loaded_people", None) != self.people_strings()
+
+    def sync_credits(self):
+        """
+        Rebuild this movie's MovieCredit rows from the starring/director/writer
+        strings, creating any Person that doesn't exist yet.
+        """
+        wanted = [
+            (role, name, order)
+            for role in MovieCredit.Role.values
+            for order, name in enumerate(split_names(getattr(self, role)))
+        ]
+        names = {name for _, name, _ in wanted}
+
+        people = {p.name: p for p in Person.objects.filter(name__in=names)}
+        missing = [Person(name=name) for name in names if name not in people]
+        if missing:
+            Person.objects.bulk_create(missing, ignore_conflicts=True)
+            people = {p.name: p for p in Person.objects.filter(name__in=names)}
+
+        MovieCredit.objects.filter(movie=self).delete()
+        MovieCredit.objects.bulk_create([
+            MovieCredit(movie=self, person=people[name], role=role, order=order)
+            for role, name, order in wanted
+        ])
+        self._loaded_people = self.people_strings()
 
     def save(self, *args, **kwargs):
-        if self.pk:
-            old_instance = Movie.objects.get(pk=self.pk)
-            if old_instance.poster and old_instance.poster != self.poster:
-                old_instance.poster.delete(save=False)
-        super().save(*args, **kwargs)
+        # Compare against the poster name loaded in from_db rather than
+        # re-fetching the row; the old file goes once the save commits
+        old_poster = getattr(self, "_loaded_poster", None)
+        self.card_version = new_card_version()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            kwargs["update_fields"] = {*update_fields, "card_version", "updated_at"}
+        # So the receivers' writes (facet change log, search index, stats)
+        # commit or roll back with the row
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+        new_poster = self.poster.name or None
+        if old_poster and old_poster != new_poster:
+            delete_file_later(old_poster)
+        self._loaded_poster = new_poster
+        if update_fields is None or "recommended_by" in update_fields:
+            self._loaded_recommended_by = self.recommended_by_id
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            return super().delete(*args, **kwargs)
 
     class Meta:
         ordering = ["title"]
+        indexes = [
+            # Keyset pagination for the grid's sorts, see pagination.py
+            models.Index(fields=["title", "id"], name="tracker_movie_title"),
+            models.Index(fields=["year", "id"], name="tracker_movie_year"),
+            models.Index(fields=["created_at", "id"], name="tracker_movie_created_at"),
+            models.Index(fields=["rating_score", "id"], name="tracker_movie_rating_score"),
+            models.Index(fields=["viewing_count", "id"], name="tracker_movie_viewing_count"),
+            # Max(updated_at) for the anonymous grid's validators
+            models.Index(fields=["updated_at"], name="tracker_movie_updated_at"),
+        ]
 
     def __str__(self):
         return self.title
 
+
+class MovieCredit(models.Model):
+    class Role(models.TextChoices):
+        # Values match the Movie fields the credits are parsed from
+        STARRING = "starring", "Starring"
+        DIRECTOR = "director", "Director"
+        WRITER = "writer", "Writer"
+
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name="credits")
+    person = models.ForeignKey(Person, on_delete=models.CASCADE, related_name="credits")
+    role = models.CharField(max_length=20, choices=Role.choices)
+    order = models.PositiveSmallIntegerField(default=0)
+
+    class Meta:
+        unique_together = ("movie", "person", "role")
+        ordering = ["role", "order"]
+        indexes = [
+            models.Index(fields=["role", "person"], name="tracker_credit_role_person"),
+        ]
+
+    def __str__(self):
+        return f"{self.person} ({self.get_role_display()}) in {self.movie}"
+
+
+@receiver(models.signals.post_save, sender=Movie)
+def sync_movie_credits_on_save(sender, instance, created, raw, **kwargs):
+    # Also runs for loaddata (raw=True) so fixtures get their credits
+    if created or raw or instance.people_changed():
+        instance.sync_credits()
+
 @receiver(models.signals.post_delete, sender=Movie)
 def auto_delete_movie_poster_on_delete(sender, instance, **kwargs):
     if instance.poster:
-        if os.path.isfile(instance.poster.path):
-            os.remove(instance.poster.path)
+        delete_file_later(instance.poster.name)
 
 class Viewing(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
-    movie = models.ForeignKey(Movie, on_delete=models.CASCADE)
+    # Looked up through the (movie, created_at) index below
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, db_index=False)
 
     watched_on = models.DateField(blank=True, null=True)
     rating = models.DecimalField(
@@ -106,10 +277,213 @@ class Viewing(models.Model):
     comment = models.TextField(blank=True)
 
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         unique_together = ("user", "movie")
         ordering = ["-created_at"]
+        indexes = [
+            # A movie's viewings in the default ordering, for the detail page
+            models.Index(fields=["movie", "created_at"], name="tracker_viewing_movie_created"),
+        ]
+
+    # Remembered as loaded (and as last saved), so the receivers of a save
+    # can tell what it changed without fetching the row again
+    LOADED_FIELDS = ("user_id", "movie_id", "watched_on", "rating")
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if all(name in field_names for name in cls.LOADED_FIELDS):
+            instance._loaded_keys = tuple(getattr(instance, name) for name in cls.LOADED_FIELDS)
+        return instance
+
+    def loaded_values(self):
+        """LOADED_FIELDS as in the database before this save, or None if unknown."""
+        return getattr(self, "_loaded_keys", None)
+
+    def moved_from(self):
+        """
+        (user_id, movie_id) as loaded, if they've changed since; the receivers
+        of a save that moves a viewing update the old movie too.
+        """
+        loaded = self.loaded_values()
+        if loaded and loaded[:2] != (self.user_id, self.movie_id):
+            return loaded[:2]
+        return None
+
+    def movie_ids(self):
+        moved_from = self.moved_from()
+        return {self.movie_id, moved_from[1]} if moved_from else {self.movie_id}
+
+    def save(self, *args, **kwargs):
+        # So the movie's rating aggregates (tracker/ratings.py) commit with it
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None:
+            self._loaded_keys = tuple(getattr(self, name) for name in self.LOADED_FIELDS)
+        elif loaded := self.loaded_values():
+            saved = {
+                field.attname
+                for field in self._meta.concrete_fields
+                if field.name in update_fields or field.attname in update_fields
+            }
+            self._loaded_keys = tuple(
+                getattr(self, name) if name in saved else value for name, value in zip(self.LOADED_FIELDS, loaded)
+            )
 
     def __str__(self):
         return f"{self.user} watched {self.movie}"
+
+
+class MovieFactors(models.Model):
+    """A movie's learned bias and latent vector, see tracker/recommender.py."""
+    movie = models.OneToOneField(
+        Movie, on_delete=models.CASCADE, primary_key=True, related_name="factors"
+    )
+    bias = models.FloatField()
+    vector = models.BinaryField(help_text="float32 array, little-endian")
+
+    class Meta:
+        verbose_name_plural = "Movie factors"
+
+
+class UserFactors(models.Model):
+    """A member's learned bias and latent vector, see tracker/recommender.py."""
+    user = models.OneToOneField(
+        User, on_delete=models.CASCADE, primary_key=True, related_name="movie_factors"
+    )
+    bias = models.FloatField()
+    vector = models.BinaryField(help_text="float32 array, little-endian")
+
+    class Meta:
+        verbose_name_plural = "User factors"
+
+
+class Recommendation(models.Model):
+    """One of a member's top predicted unseen movies."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="recommendations")
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name="recommendations")
+    score = models.FloatField(help_text="Predicted rating, 0–5")
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        unique_together = ("user", "movie")
+        ordering = ["user", "rank"]
+        indexes = [
+            models.Index(fields=["user", "rank"], name="tracker_rec_user_rank"),
+        ]
+
+    def __str__(self):
+        return f"{self.movie} for {self.user} ({self.score:.1f})"
+
+
+class SimilarMovie(models.Model):
+    """One of a movie's nearest neighbours by content, see tracker/similarity.py."""
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name="similar_movies")
+    similar = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name="+")
+    score = models.FloatField(help_text="Cosine similarity, 0–1")
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        unique_together = ("movie", "similar")
+        ordering = ["movie", "rank"]
+        indexes = [
+            models.Index(fields=["movie", "rank"], name="tracker_similar_movie_rank"),
+        ]
+
+    def __str__(self):
+        return f"{self.similar} is like {self.movie} ({self.score:.2f})"
+
+
+class MovieTerm(models.Model):
+    """
+    One term of a movie's TF-IDF vector, see tracker/similarity.py. Only
+    terms other movies share are kept, so this is an index from a term to
+    the movies it can make alike.
+    """
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name="+", db_index=False)
+    term = models.CharField(max_length=100)
+    weight = models.FloatField(help_text="TF-IDF weight over the vector's norm")
+
+    class Meta:
+        unique_together = ("movie", "term")
+        indexes = [
+            # Covers the scoring query: a term's movies and their weights
+            models.Index(fields=["term", "movie", "weight"], name="tracker_movie_term"),
+        ]
+
+    def __str__(self):
+        return f"{self.term} in {self.movie_id} ({self.weight:.3f})"
+
+
+class StatRollup(models.Model):
+    """
+    One running total behind the stats dashboard, see tracker/stats.py.
+    Rows with no user are club-wide; the rest are one member's.
+    """
+    class Metric(models.TextChoices):
+        # Viewing totals; keys are "" / "YYYY-MM" / "4.5" / an object id
+        VIEWINGS = "viewings", "Viewings"
+        MONTH = "month", "Viewings per month"
+        RATING = "rating", "Ratings given"
+        CATEGORY = "category", "Viewings per category"
+        STREAMING = "streaming", "Viewings per streaming service"
+        RECOMMENDER = "recommender", "Viewings per recommender"
+        # Movie totals, club-wide only
+        MOVIES = "movies", "Movies"
+        RECOMMENDED = "recommended", "Movies per recommender"
+        CATEGORY_MOVIES = "category_movies", "Movies per category"
+        STREAMING_MOVIES = "streaming_movies", "Movies per streaming service"
+
+    metric = models.CharField(max_length=20, choices=Metric.choices)
+    key = models.CharField(max_length=20, blank=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name="+")
+    count = models.IntegerField(default=0)
+    rating_count = models.IntegerField(default=0)
+    rating_sum = models.FloatField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["metric", "key", "user"], name="tracker_stat_member_unique"),
+            models.UniqueConstraint(
+                fields=["metric", "key"],
+                condition=models.Q(user__isnull=True),
+                name="tracker_stat_club_unique",
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["user", "metric"], name="tracker_stat_user_metric"),
+        ]
+
+    @property
+    def average_rating(self):
+        return self.rating_sum / self.rating_count if self.rating_count else None
+
+    def __str__(self):
+        scope = self.user or "club"
+        return f"{scope} {self.metric} {self.key}: {self.count}"
+
+
+class FacetChange(models.Model):
+    """
+    A change every process's facet index must replay, written in the same
+    transaction as the change itself, see tracker/facet_index.py.
+    """
+    class Kind(models.TextChoices):
+        MOVIE = "movie", "Reload a movie"
+        SEEN = "seen", "Member has seen a movie"
+        UNSEEN = "unseen", "Member hasn't seen a movie"
+        PERSON = "person", "Reload a person's name"
+        DROP = "drop", "Forget a facet option"
+        RELOAD = "reload", "Reload everything"
+
+    kind = models.CharField(max_length=10, choices=Kind.choices)
+    # Plain ids rather than foreign keys: the rows outlive what they name
+    movie_id = models.IntegerField(null=True, blank=True)
+    facet = models.CharField(max_length=20, blank=True)
+    key = models.IntegerField(null=True, blank=True, help_text="Member, person or facet option id")
+
+    def __str__(self):
+        return f"#{self.pk} {self.get_kind_display()}"
@@ -0,0 +1,122 @@
+import base64
+import json
+
+from django.core.exceptions import BadRequest, ValidationError
+from django.db.models import F, Q
+
+MOVIES_PER_PAGE = 24
+
+
+def _cursor_default(value):
+    # Full-precision isoformat; DjangoJSONEncoder would drop microseconds and
+    # break the equality half of the keyset comparison on created_at.
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    raise TypeError(f"Cannot encode {type(value).__name__} in a cursor")
+
+
+def _pack(payload):
+    raw = json.dumps(payload, default=_cursor_default, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _unpack(cursor):
+    padded = cursor + "=" * (-len(cursor) % 4)
+    return json.loads(base64.urlsafe_b64decode(padded.encode()))
+
+
+def encode_cursor(value, pk):
+    return _pack([value, pk])
+
+
+def decode_cursor(cursor, field):
+    """
+    Turn a cursor string back into (value, pk) for `field`.
+    Raises BadRequest (a 400) on anything that doesn't decode cleanly.
+    """
+    try:
+        value, pk = _unpack(cursor)
+        if value is not None:
+            value = field.to_python(value)
+        return value, int(pk)
+    except (ValueError, TypeError, ValidationError) as exc:
+        raise BadRequest("Invalid cursor") from exc
+
+
+def _keyset_ordering(field, descending):
+    """
+    Order by the sort field, then by pk as a tie-breaker.
+    NULLs go first ascending and last descending (SQLite's own behaviour),
+    pinned explicitly so the cursor filter below always agrees with it.
+    """
+    if descending:
+        return [F(field.name).desc(nulls_last=True), F("pk").desc()]
+    return [F(field.name).asc(nulls_first=True), F("pk").asc()]
+
+
+def _after_cursor(field, descending, value, pk):
+    """Rows that come strictly after (value, pk) in the keyset ordering."""
+    name = field.name
+    if descending:
+        if value is None:
+            return Q(**{f"{name}__isnull": True, "pk__lt": pk})
+        after = Q(**{f"{name}__lt": value}) | Q(**{name: value, "pk__lt": pk})
+        if field.null:
+            after |= Q(**{f"{name}__isnull": True})
+        return after
+
+    if value is None:
+        return Q(**{f"{name}__isnull": True, "pk__gt": pk}) | Q(**{f"{name}__isnull": False})
+    return Q(**{f"{name}__gt": value}) | Q(**{name: value, "pk__gt": pk})
+
+
+def keyset_page(queryset, ordering, cursor=None, page_size=MOVIES_PER_PAGE):
+    """
+    Return (objects, next_cursor) for one page of `queryset`.
+
+    `ordering` is a single field name as used in SORT_OPTIONS ("year",
+    "-created_at", ...). Only page_size + 1 rows are ever fetched, so the
+    cost of a page doesn't depend on how deep into the list it is.
+    """
+    descending = ordering.startswith("-")
+    field = queryset.model._meta.get_field(ordering.lstrip("-"))
+
+    queryset = queryset.order_by(*_keyset_ordering(field, descending))
+    if cursor:
+        value, pk = decode_cursor(cursor, field)
+        queryset = queryset.filter(_after_cursor(field, descending, value, pk))
+
+    objects = list(queryset[: page_size + 1])
+    next_cursor = None
+    if len(objects) > page_size:
+        objects = objects[:page_size]
+        last = objects[-1]
+        next_cursor = encode_cursor(getattr(last, field.attname), last.pk)
+
+    return objects, next_cursor
+
+
+def ranked_page(queryset, ranked_ids, cursor=None, page_size=MOVIES_PER_PAGE):
+    """
+    Return (objects, next_cursor) for one page of an already-ranked list of
+    ids, such as search results in relevance order. The ranking is computed
+    per request, so here the cursor is simply a position in it.
+    """
+    start = 0
+    if cursor:
+        try:
+            start = int(_unpack(cursor)["pos"])
+        except (ValueError, TypeError, KeyError) as exc:
+            raise BadRequest("Invalid cursor") from exc
+        # A negative position would slice from the end of the ranking
+        if start < 0:
+            raise BadRequest("Invalid cursor")
+
+    page_ids = ranked_ids[start:start + page_size]
+    by_id = queryset.in_bulk(page_ids)
+    objects = [by_id[pk] for pk in page_ids if pk in by_id]
+
+    next_cursor = None
+    if start + page_size < len(ranked_ids):
+        next_cursor = _pack({"pos": start + page_size})
+    return objects, next_cursor
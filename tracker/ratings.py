@@ -0,0 +1,86 @@
+"""
+The club's rating aggregates, kept on Movie so the grid can show and sort
+by them without aggregating over Viewing per request.
+
+Every Viewing save or delete recomputes its movie's viewing_count,
+rating_count, rating_mean and rating_score in one UPDATE of correlated
+subqueries, inside the same transaction as the change (Viewing.save is
+atomic, and deletes already run in one). Recomputing rather than adding
+deltas means a repeated or concurrent update can't drift the totals.
+
+rating_score is a Bayesian average: the mean of the movie's ratings plus
+TRACKER_RATING_PRIOR_WEIGHT imaginary ratings of TRACKER_RATING_PRIOR, so a
+single 5.0 doesn't outrank a dozen 4.5s. Unrated movies score 0 and sort
+last. After changing either setting, run repair_rating_aggregates.
+"""
+from django.conf import settings
+from django.db import models
+from django.db.models import Avg, Case, Count, FloatField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce
+from django.db.models.lookups import GreaterThan
+from django.dispatch import receiver
+
+from .models import Movie, Viewing
+
+AGGREGATE_FIELDS = ("viewing_count", "rating_count", "rating_mean", "rating_score")
+
+
+def _prior():
+    return (
+        float(getattr(settings, "TRACKER_RATING_PRIOR", 3.0)),
+        float(getattr(settings, "TRACKER_RATING_PRIOR_WEIGHT", 2)),
+    )
+
+
+def _viewing_aggregate(aggregate, output_field, **filters):
+    return Subquery(
+        Viewing.objects.filter(movie=OuterRef("pk"), **filters)
+        .order_by()
+        .values("movie")
+        .annotate(value=aggregate)
+        .values("value"),
+        output_field=output_field,
+    )
+
+
+def aggregate_values():
+    """Expressions for Movie.objects.update() that recompute AGGREGATE_FIELDS."""
+    prior_mean, prior_weight = _prior()
+    rating_count = Coalesce(
+        _viewing_aggregate(Count("pk"), models.IntegerField(), rating__isnull=False), 0
+    )
+    rating_sum = Cast(
+        _viewing_aggregate(Sum("rating"), models.DecimalField(), rating__isnull=False), FloatField()
+    )
+    return {
+        "viewing_count": Coalesce(_viewing_aggregate(Count("pk"), models.IntegerField()), 0),
+        "rating_count": rating_count,
+        "rating_mean": Cast(
+            _viewing_aggregate(Avg("rating"), models.DecimalField(), rating__isnull=False), FloatField()
+        ),
+        "rating_score": Case(
+            When(GreaterThan(rating_count, 0), then=(
+                (Value(prior_mean * prior_weight) + rating_sum) / (Value(prior_weight) + rating_count)
+            )),
+            default=Value(0.0),
+            output_field=FloatField(),
+        ),
+    }
+
+
+def refresh_rating_aggregates(movie_ids=None):
+    """
+    Recompute the aggregates of `movie_ids` (all movies if None), e.g. after
+    bulk writes that skip the receivers below. Returns the rows updated.
+    """
+    movies = Movie.objects.all()
+    if movie_ids is not None:
+        movies = movies.filter(pk__in=list(movie_ids))
+    return movies.update(**aggregate_values())
+
+
+@receiver(models.signals.post_save, sender=Viewing)
+@receiver(models.signals.post_delete, sender=Viewing)
+def refresh_rating_aggregates_on_viewing_change(sender, instance, **kwargs):
+    # Also for loaddata (raw=True); a fixture's movies load before its viewings
+    refresh_rating_aggregates(instance.movie_ids())
@@ -0,0 +1,426 @@
+"""
+Collaborative-filtering recommendations from members' Viewing ratings.
+
+The sparse member x movie rating matrix is factorized with alternating least
+squares (ALS) into
+
+    predicted rating = user bias + movie bias + user vector . movie vector
+
+with the overall mean rating folded into the movie biases. train() fits every
+factor from scratch, stores them (UserFactors, MovieFactors) and rewrites
+each rater's top unseen movies into Recommendation.
+
+Between trainings, a changed viewing only re-solves that member's factors
+against the stored movie factors (unpacked once and kept in memory until
+they change) and re-ranks their list, on a background thread once the
+transaction commits. A movie rated for the first time since
+training is first folded in from its raters' stored factors. Everyone else's
+factors only move on the next train_recommender run, so run it periodically.
+
+NumPy is imported where it's used, so the rest of the app doesn't need it.
+"""
+import threading
+from array import array
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import models, transaction
+from django.db.models import Count, Sum
+from django.dispatch import receiver
+
+from .background import run_in_background
+from .models import MovieFactors, Recommendation, UserFactors, Viewing
+
+# Ratings per batch when summing the normal equations, to bound memory
+SOLVE_CHUNK = 20000
+# Members scored per matrix product when ranking everyone
+RANK_CHUNK = 256
+
+
+def _top_n():
+    return getattr(settings, "TRACKER_RECOMMENDATIONS_PER_USER", 20)
+
+
+def _regularization():
+    return getattr(settings, "TRACKER_RECOMMENDER_REGULARIZATION", 0.1)
+
+
+def _pack(vector):
+    import numpy as np
+
+    return np.asarray(vector, dtype="<f4").tobytes()
+
+
+def _unpack(data):
+    import numpy as np
+
+    return np.frombuffer(bytes(data), dtype="<f4").astype(np.float64)
+
+
+# --- Factorization ---
+
+def load_ratings(viewings=None):
+    """(user ids, movie ids, ratings) arrays for every rated viewing."""
+    import numpy as np
+
+    user_ids, movie_ids, ratings = array("q"), array("q"), array("d")
+    viewings = Viewing.objects.all() if viewings is None else viewings
+    rows = viewings.filter(rating__isnull=False).values_list("user_id", "movie_id", "rating")
+    for user_id, movie_id, rating in rows.iterator(chunk_size=5000):
+        user_ids.append(user_id)
+        movie_ids.append(movie_id)
+        ratings.append(float(rating))
+    return np.array(user_ids), np.array(movie_ids), np.array(ratings)
+
+
+def solve(rows, cols, targets, fixed, n_rows, regularization):
+    """
+    One half-step of ALS: for each of `n_rows` rows, the (bias, vector)
+    minimizing the squared error of its `targets` against the `fixed`
+    vectors of its `cols`, ridge-regularized in proportion to its number of
+    ratings. Rows without ratings come out as zeros.
+    """
+    import numpy as np
+
+    size = fixed.shape[1] + 1
+    features = np.hstack([np.ones((len(fixed), 1)), fixed])
+    gram = np.zeros((n_rows, size, size))
+    rhs = np.zeros((n_rows, size))
+    for start in range(0, len(rows), SOLVE_CHUNK):
+        chunk = slice(start, start + SOLVE_CHUNK)
+        x = features[cols[chunk]]
+        np.add.at(gram, rows[chunk], x[:, :, None] * x[:, None, :])
+        np.add.at(rhs, rows[chunk], x * targets[chunk, None])
+
+    counts = np.bincount(rows, minlength=n_rows)
+    gram += regularization * (counts + 1)[:, None, None] * np.eye(size)
+    solution = np.linalg.solve(gram, rhs[:, :, None])[:, :, 0]
+    return solution[:, 0], solution[:, 1:]
+
+
+class Factorization:
+    """Learned factors for users 0..n_users-1 and movies 0..n_movies-1."""
+
+    def __init__(self, mean, user_bias, user_vectors, movie_bias, movie_vectors):
+        self.mean = mean
+        self.user_bias = user_bias
+        self.user_vectors = user_vectors
+        self.movie_bias = movie_bias
+        self.movie_vectors = movie_vectors
+
+    @classmethod
+    def fit(cls, user_rows, movie_rows, ratings, n_users, n_movies,
+            factors=16, iterations=15, regularization=None, seed=0):
+        import numpy as np
+
+        regularization = _regularization() if regularization is None else regularization
+        rng = np.random.default_rng(seed)
+        mean = float(ratings.mean()) if len(ratings) else 0.0
+        residual = ratings - mean
+
+        movie_bias = np.zeros(n_movies)
+        movie_vectors = rng.normal(0, 0.1, (n_movies, factors))
+        for _ in range(iterations):
+            user_bias, user_vectors = solve(
+                user_rows, movie_rows, residual - movie_bias[movie_rows],
+                movie_vectors, n_users, regularization,
+            )
+            movie_bias, movie_vectors = solve(
+                movie_rows, user_rows, residual - user_bias[user_rows],
+                user_vectors, n_movies, regularization,
+            )
+        return cls(mean, user_bias, user_vectors, movie_bias, movie_vectors)
+
+    def predict(self, user_rows, movie_rows):
+        import numpy as np
+
+        scores = (
+            self.mean
+            + self.user_bias[user_rows]
+            + self.movie_bias[movie_rows]
+            + np.einsum("ij,ij->i", self.user_vectors[user_rows], self.movie_vectors[movie_rows])
+        )
+        return np.clip(scores, 0, 5)
+
+    def scores_for(self, user_rows):
+        """Predicted ratings of every movie for each of `user_rows`."""
+        import numpy as np
+
+        scores = (
+            self.mean
+            + self.user_bias[user_rows, None]
+            + self.movie_bias[None, :]
+            + self.user_vectors[user_rows] @ self.movie_vectors.T
+        )
+        return np.clip(scores, 0, 5)
+
+
+def top_unseen(scores, seen_columns, n):
+    """Column indexes of the `n` best `scores` outside `seen_columns`, best first."""
+    import numpy as np
+
+    scores = scores.copy()
+    scores[list(seen_columns)] = -np.inf
+    n = min(n, int(np.isfinite(scores).sum()))
+    if n <= 0:
+        return np.array([], dtype=int)
+    top = np.argpartition(-scores, n - 1)[:n]
+    return top[np.argsort(-scores[top])]
+
+
+# --- Full training ---
+
+def train(factors=16, iterations=15, regularization=None, top_n=None):
+    """
+    Fit factors on every rating, store them and rebuild everyone's
+    recommendations. Returns a dict of counts for reporting.
+    """
+    import numpy as np
+
+    top_n = _top_n() if top_n is None else top_n
+    user_ids, movie_ids, ratings = load_ratings()
+    if not len(ratings):
+        with transaction.atomic():
+            Recommendation.objects.all().delete()
+            UserFactors.objects.all().delete()
+            MovieFactors.objects.all().delete()
+        return {"ratings": 0, "users": 0, "movies": 0, "recommendations": 0}
+
+    users, user_rows = np.unique(user_ids, return_inverse=True)
+    movies, movie_rows = np.unique(movie_ids, return_inverse=True)
+    model = Factorization.fit(
+        user_rows, movie_rows, ratings, len(users), len(movies),
+        factors=factors, iterations=iterations, regularization=regularization,
+    )
+
+    # Everything each rater has seen, rated or not, as movie columns
+    seen = {}
+    column = {movie_id: i for i, movie_id in enumerate(movies.tolist())}
+    for user_id, movie_id in Viewing.objects.values_list("user_id", "movie_id").iterator(chunk_size=5000):
+        if movie_id in column:
+            seen.setdefault(user_id, set()).add(column[movie_id])
+
+    recommendations = []
+    for start in range(0, len(users), RANK_CHUNK):
+        rows = np.arange(start, min(start + RANK_CHUNK, len(users)))
+        for row, scores in zip(rows, model.scores_for(rows)):
+            user_id = int(users[row])
+            for rank, col in enumerate(top_unseen(scores, seen.get(user_id, ()), top_n), 1):
+                recommendations.append(Recommendation(
+                    user_id=user_id, movie_id=int(movies[col]), score=float(scores[col]), rank=rank,
+                ))
+
+    with transaction.atomic():
+        Recommendation.objects.all().delete()
+        UserFactors.objects.all().delete()
+        MovieFactors.objects.all().delete()
+        MovieFactors.objects.bulk_create(
+            [
+                MovieFactors(
+                    movie_id=int(movie_id),
+                    bias=float(model.mean + model.movie_bias[i]),
+                    vector=_pack(model.movie_vectors[i]),
+                )
+                for i, movie_id in enumerate(movies)
+            ],
+            batch_size=1000,
+        )
+        UserFactors.objects.bulk_create(
+            [
+                UserFactors(
+                    user_id=int(user_id),
+                    bias=float(model.user_bias[i]),
+                    vector=_pack(model.user_vectors[i]),
+                )
+                for i, user_id in enumerate(users)
+            ],
+            batch_size=1000,
+        )
+        Recommendation.objects.bulk_create(recommendations, batch_size=1000)
+
+    return {
+        "ratings": len(ratings),
+        "users": len(users),
+        "movies": len(movies),
+        "recommendations": len(recommendations),
+    }
+
+
+# --- Incremental updates ---
+
+# (fingerprint, factors) from the last _load_movie_factors
+_movie_factors = None
+_movie_factors_lock = threading.Lock()
+
+
+def _load_movie_factors():
+    """
+    The stored movie factors as (movie ids, biases, vectors), or None before
+    the first training. Fetching and unpacking every vector costs far more
+    than checking whether any changed, so they're kept between calls until
+    the row count or the bias total moves: a training, a fold-in or a movie
+    deleted.
+    """
+    global _movie_factors
+    import numpy as np
+
+    fingerprint = tuple(MovieFactors.objects.aggregate(rows=Count("pk"), bias=Sum("bias")).values())
+    with _movie_factors_lock:
+        if _movie_factors is not None and _movie_factors[0] == fingerprint:
+            return _movie_factors[1]
+
+    rows = list(MovieFactors.objects.values_list("movie_id", "bias", "vector"))
+    factors = None
+    if rows:
+        movie_ids = np.array([row[0] for row in rows])
+        bias = np.array([row[1] for row in rows])
+        vectors = np.vstack([_unpack(row[2]) for row in rows])
+        factors = movie_ids, bias, vectors
+    with _movie_factors_lock:
+        _movie_factors = (fingerprint, factors)
+    return factors
+
+
+def _fold_in_movie(movie_id, movie_bias):
+    """
+    Fit factors for a movie the last training never saw, from its raters'
+    stored factors. Returns (bias, vector), or None if no rater has any.
+    """
+    import numpy as np
+
+    rated = dict(
+        Viewing.objects.filter(movie_id=movie_id, rating__isnull=False).values_list("user_id", "rating")
+    )
+    raters = list(UserFactors.objects.filter(user_id__in=rated).values_list("user_id", "bias", "vector"))
+    if not raters:
+        return None
+
+    # Stored movie biases include the mean rating; shrink toward their average
+    mean = float(movie_bias.mean())
+    user_bias = np.array([bias for _, bias, _ in raters])
+    user_vectors = np.vstack([_unpack(vector) for _, _, vector in raters])
+    targets = np.array([float(rated[user_id]) for user_id, _, _ in raters]) - user_bias - mean
+    bias, vectors = solve(
+        np.zeros(len(raters), dtype=int), np.arange(len(raters)), targets,
+        user_vectors, 1, _regularization(),
+    )
+    bias, vector = float(bias[0] + mean), vectors[0]
+    MovieFactors.objects.update_or_create(
+        movie_id=movie_id, defaults={"bias": bias, "vector": _pack(vector)}
+    )
+    return bias, vector
+
+
+def refresh_user(user_id, movie_id=None, top_n=None):
+    """
+    Re-solve one member's factors against the stored movie factors and
+    rebuild their recommendations. `movie_id` is the movie whose viewing
+    changed, folded in first if the last training didn't include it.
+    Does nothing before the first training.
+    """
+    import numpy as np
+
+    top_n = _top_n() if top_n is None else top_n
+    loaded = _load_movie_factors()
+    if loaded is None or not User.objects.filter(pk=user_id).exists():
+        # Not trained yet, or the viewing went with its member
+        return
+    movie_ids, movie_bias, movie_vectors = loaded
+
+    if movie_id is not None and movie_id not in set(movie_ids.tolist()):
+        folded = _fold_in_movie(movie_id, movie_bias)
+        if folded is not None:
+            movie_ids = np.append(movie_ids, movie_id)
+            movie_bias = np.append(movie_bias, folded[0])
+            movie_vectors = np.vstack([movie_vectors, folded[1]])
+
+    column = {m: i for i, m in enumerate(movie_ids.tolist())}
+    viewings = list(Viewing.objects.filter(user_id=user_id).values_list("movie_id", "rating"))
+    rated = [(column[m], float(r)) for m, r in viewings if r is not None and m in column]
+    cols = np.array([col for col, _ in rated], dtype=int)
+    targets = np.array([rating for _, rating in rated]) - movie_bias[cols]
+    bias, vectors = solve(
+        np.zeros(len(cols), dtype=int), cols, targets, movie_vectors, 1, _regularization(),
+    )
+    bias, vector = float(bias[0]), vectors[0]
+
+    scores = np.clip(movie_bias + bias + movie_vectors @ vector, 0, 5)
+    seen = {column[m] for m, _ in viewings if m in column}
+    top = top_unseen(scores, seen, top_n)
+
+    with transaction.atomic():
+        if rated:
+            UserFactors.objects.update_or_create(
+                user_id=user_id, defaults={"bias": bias, "vector": _pack(vector)}
+            )
+        else:
+            UserFactors.objects.filter(user_id=user_id).delete()
+        Recommendation.objects.filter(user_id=user_id).delete()
+        Recommendation.objects.bulk_create([
+            Recommendation(user_id=user_id, movie_id=int(movie_ids[col]), score=float(scores[col]), rank=rank)
+            for rank, col in enumerate(top, 1)
+        ])
+
+
+@receiver(models.signals.post_save, sender=Viewing)
+@receiver(models.signals.post_delete, sender=Viewing)
+def refresh_recommendations_on_viewing_change(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    user_id, movie_id = instance.user_id, instance.movie_id
+    transaction.on_commit(lambda: run_in_background(refresh_user, user_id, movie_id))
+
+
+# --- Offline evaluation ---
+
+def evaluate(test_fraction=0.2, k=10, relevant=4.0, seed=0, **fit_options):
+    """
+    Train on a random split of the ratings and score the held-out part:
+    RMSE of the predicted ratings (next to always predicting the training
+    mean), and precision@k, the share of each member's top k movies (not
+    rated in training) that they rated at least `relevant` in the test set.
+    """
+    import numpy as np
+
+    user_ids, movie_ids, ratings = load_ratings()
+    rng = np.random.default_rng(seed)
+    test = rng.random(len(ratings)) < test_fraction
+    train_mask = ~test
+    if not test.any() or not train_mask.any():
+        raise ValueError("Not enough ratings to split into training and test sets.")
+
+    users, user_rows = np.unique(user_ids, return_inverse=True)
+    movies, movie_rows = np.unique(movie_ids, return_inverse=True)
+    model = Factorization.fit(
+        user_rows[train_mask], movie_rows[train_mask], ratings[train_mask],
+        len(users), len(movies), seed=seed, **fit_options,
+    )
+
+    predicted = model.predict(user_rows[test], movie_rows[test])
+    rmse = float(np.sqrt(np.mean((predicted - ratings[test]) ** 2)))
+    baseline = float(np.sqrt(np.mean((ratings[train_mask].mean() - ratings[test]) ** 2)))
+
+    rated_in_training = {}
+    for row, col in zip(user_rows[train_mask], movie_rows[train_mask]):
+        rated_in_training.setdefault(row, set()).add(col)
+    liked = {}
+    for row, col, rating in zip(user_rows[test], movie_rows[test], ratings[test]):
+        if rating >= relevant:
+            liked.setdefault(row, set()).add(col)
+
+    precisions = []
+    rows = np.array(sorted(liked), dtype=int)
+    for start in range(0, len(rows), RANK_CHUNK):
+        chunk = rows[start:start + RANK_CHUNK]
+        for row, scores in zip(chunk, model.scores_for(chunk)):
+            top = top_unseen(scores, rated_in_training.get(row, ()), k)
+            precisions.append(len(liked[row].intersection(top.tolist())) / k)
+
+    return {
+        "train_ratings": int(train_mask.sum()),
+        "test_ratings": int(test.sum()),
+        "rmse": rmse,
+        "baseline_rmse": baseline,
+        "precision_at_k": float(np.mean(precisions)) if precisions else None,
+        "evaluated_users": len(precisions),
+    }
@@ -0,0 +1,177 @@
+"""
+Read replicas: the read-heavy pages read from a copy of the database,
+everything else uses the primary ("default").
+
+With TRACKER_READ_REPLICAS naming one or more database aliases (see the
+movie_club/settings_replica.py profile), ReplicaMiddleware marks GET and HEAD
+requests for the views in TRACKER_REPLICA_VIEWS (the grid and its fragments,
+the detail and suggest pages, the exports), and ReplicaRouter sends their
+reads of TRACKER_REPLICA_APPS models to one replica, picked at random per
+request so a page never mixes two replicas' snapshots. Sessions and users
+stay on the primary, so logging in takes effect at once. Views don't
+change; a streamed export keeps reading its replica until the response is
+closed.
+
+Every write goes to the primary, even for objects read from a replica. Once
+a request has written, the rest of it reads from the primary, and the
+response sets a cookie that keeps that client's reads there for
+TRACKER_REPLICA_STICKY_SECONDS, so members see their own writes while the
+replicas catch up. Caches built from a read (the facet options and the
+facet index) read from the primary under primary_reads(), since they're
+filed under the newest version and would otherwise keep stale data.
+
+The replicas here are SQLite files refreshed from the primary with
+refresh_replica() (the refresh_replicas command), a stand-in for real
+replication; the sticky window should outlast the refresh interval.
+"""
+import contextvars
+import os
+import random
+import sqlite3
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.signals import request_finished
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.dispatch import receiver
+
+STICKY_COOKIE = "tracker_primary"
+REPLICA_VIEWS = (
+    "movie_list",
+    "movie_grid",
+    "movie_ids",
+    "movie_cards",
+    "movie_detail",
+    "movie_suggest",
+    "export_movies",
+    "export_viewings",
+)
+
+
+def replica_aliases():
+    return list(getattr(settings, "TRACKER_READ_REPLICAS", ()))
+
+
+def _sticky_seconds():
+    return getattr(settings, "TRACKER_REPLICA_STICKY_SECONDS", 15)
+
+
+class _RequestState:
+    def __init__(self):
+        self.replica = None
+        self.wrote = False
+
+
+_request = contextvars.ContextVar("replica_request", default=None)
+_primary_only = contextvars.ContextVar("replica_primary_only", default=False)
+
+
+@contextmanager
+def primary_reads():
+    """Read from the primary inside the block, whatever the request."""
+    token = _primary_only.set(True)
+    try:
+        yield
+    finally:
+        _primary_only.reset(token)
+
+
+@receiver(request_finished)
+def _forget_request(sender, **kwargs):
+    # After the response is closed, so a streamed export's reads still count
+    _request.set(None)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _request.get()
+        if (
+            state is None
+            or state.wrote
+            or _primary_only.get()
+            or model._meta.app_label not in getattr(settings, "TRACKER_REPLICA_APPS", ("tracker",))
+        ):
+            return None
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _request.get()
+        if state is not None:
+            state.wrote = True
+        # Explicitly, or an object read from a replica would be saved there
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *replica_aliases()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema with the data, see refresh_replica()
+        if db in replica_aliases():
+            return False
+        return None
+
+
+class ReplicaMiddleware:
+    def __init__(self, get_response):
+        if not replica_aliases():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.views = set(getattr(settings, "TRACKER_REPLICA_VIEWS", REPLICA_VIEWS))
+
+    def __call__(self, request):
+        state = _RequestState()
+        _request.set(state)
+        response = self.get_response(request)
+        if state.wrote:
+            response.set_cookie(
+                STICKY_COOKIE, "1", max_age=_sticky_seconds(), httponly=True, samesite="Lax"
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        state = _request.get()
+        if (
+            state is not None
+            and request.method in ("GET", "HEAD")
+            and request.resolver_match.url_name in self.views
+            and STICKY_COOKIE not in request.COOKIES
+        ):
+            state.replica = random.choice(replica_aliases())
+
+
+# --- Refreshing the SQLite stand-ins ---
+
+
+def refresh_replica(alias):
+    """
+    Replace replica `alias`'s SQLite file with a consistent copy of the
+    primary's. The copy is written beside it and swapped in, so readers
+    never see a half-written file; connections already open keep reading
+    the old one until they close.
+    """
+    primary = connections[DEFAULT_DB_ALIAS]
+    replica = connections[alias]
+    if primary.vendor != "sqlite" or replica.vendor != "sqlite":
+        raise ValueError("Only SQLite replicas can be refreshed by copying.")
+    target = Path(replica.settings_dict["NAME"])
+    partial = target.with_name(f"{target.name}.refreshing")
+    partial.unlink(missing_ok=True)
+
+    # A connection of its own, as the backup can't read through one that's
+    # inside a transaction
+    source = sqlite3.connect(str(primary.settings_dict["NAME"]), uri=True)
+    copy = sqlite3.connect(partial)
+    try:
+        source.backup(copy)
+        # A WAL-mode copy would need its -wal and -shm files to move with it
+        copy.execute("PRAGMA journal_mode=DELETE")
+    finally:
+        copy.close()
+        source.close()
+    os.replace(partial, target)
+    replica.close()
@@ -0,0 +1,173 @@
+"""
+Full-text search over movies, backed by an SQLite FTS5 table.
+
+tracker_movie_search (created in migration 0005) holds one row per movie,
+keyed by the movie's id as rowid, with the title, description, people and
+all viewing comments. Rows are rewritten from Movie and Viewing signals in
+the same transaction as the change.
+
+The raw queries go where the router sends Movie's: searches to the
+request's read replica (see replicas.py), index writes to the primary.
+"""
+import re
+
+from django.db import connections, models, router
+from django.db.models.expressions import RawSQL
+from django.dispatch import receiver
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import Movie, Viewing
+
+SEARCH_TABLE = "tracker_movie_search"
+
+# Most hits the grid will rank by relevance; anything past this isn't worth
+# paging to. Other sorts, the facet counts and exports see every hit.
+SEARCH_RESULT_LIMIT = 1000
+
+# bm25() column weights: title, description, people, comments
+BM25_WEIGHTS = (10.0, 2.0, 5.0, 1.0)
+
+# Control characters can't appear in the indexed text, so they're safe to
+# mark hits with before the snippet is HTML-escaped
+_HIT_START, _HIT_END = "\x02", "\x03"
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def fts_query(text):
+    """
+    Turn free text into an FTS5 MATCH expression: every word must match,
+    each as a prefix, and FTS5 operators in the input are treated as words.
+    Returns "" if there's nothing searchable.
+    """
+    return " ".join(f'"{token}"*' for token in _TOKEN_RE.findall(text or ""))
+
+
+def matching_ids_sql(text):
+    """RawSQL selecting the ids of matching movies, for use with pk__in."""
+    return RawSQL(
+        f"SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s",
+        (fts_query(text),),
+    )
+
+
+def _reading():
+    return connections[router.db_for_read(Movie)]
+
+
+def _writing():
+    return connections[router.db_for_write(Movie)]
+
+
+def _highlight(snippet):
+    return mark_safe(
+        escape(snippet)
+        .replace(_HIT_START, "<mark>")
+        .replace(_HIT_END, "</mark>")
+    )
+
+
+def matching_ids(text):
+    """Ids of every movie matching `text`, unranked."""
+    query = fts_query(text)
+    if not query:
+        return []
+    with _reading().cursor() as cursor:
+        cursor.execute(f"SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s", (query,))
+        return [movie_id for movie_id, in cursor.fetchall()]
+
+
+def search_movies(text, limit=SEARCH_RESULT_LIMIT):
+    """Return the ids of the `limit` movies best matching `text`, best first."""
+    query = fts_query(text)
+    if not query:
+        return []
+
+    weights = ", ".join(str(w) for w in BM25_WEIGHTS)
+    with _reading().cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT rowid
+            FROM {SEARCH_TABLE}
+            WHERE {SEARCH_TABLE} MATCH %s
+            ORDER BY bm25({SEARCH_TABLE}, {weights})
+            LIMIT %s
+            """,
+            (query, limit),
+        )
+        return [movie_id for movie_id, in cursor.fetchall()]
+
+
+def search_snippets(text, movie_ids):
+    """
+    Return {movie_id: snippet} for those of `movie_ids` matching `text`.
+    Snippets are safe HTML with the matched terms wrapped in <mark>.
+    """
+    query = fts_query(text)
+    movie_ids = list(movie_ids)
+    if not query or not movie_ids:
+        return {}
+
+    placeholders = ", ".join(["%s"] * len(movie_ids))
+    with _reading().cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT rowid,
+                   snippet({SEARCH_TABLE}, -1, %s, %s, '…', 12)
+            FROM {SEARCH_TABLE}
+            WHERE {SEARCH_TABLE} MATCH %s AND rowid IN ({placeholders})
+            """,
+            (_HIT_START, _HIT_END, query, *movie_ids),
+        )
+        return {movie_id: _highlight(snippet) for movie_id, snippet in cursor.fetchall()}
+
+
+_INSERT_ROWS = f"""
+    INSERT INTO {SEARCH_TABLE} (rowid, title, description, people, comments)
+    SELECT m.id, m.title, m.description,
+           m.starring || ', ' || m.director || ', ' || m.writer,
+           COALESCE(
+               (SELECT group_concat(v.comment, ' ')
+                FROM tracker_viewing v WHERE v.movie_id = m.id),
+               ''
+           )
+    FROM tracker_movie m
+"""
+
+
+def index_movie(movie_id):
+    """(Re)write the search row for one movie, or drop it if the movie is gone."""
+    with _writing().cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s", (movie_id,))
+        cursor.execute(f"{_INSERT_ROWS} WHERE m.id = %s", (movie_id,))
+
+
+def index_movies(movie_ids):
+    """index_movie for many movies in two statements, e.g. after bulk writes."""
+    movie_ids = list(movie_ids)
+    if not movie_ids:
+        return
+    placeholders = ", ".join(["%s"] * len(movie_ids))
+    with _writing().cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({placeholders})", movie_ids)
+        cursor.execute(f"{_INSERT_ROWS} WHERE m.id IN ({placeholders})", movie_ids)
+
+
+def rebuild_search_index():
+    with _writing().cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+        cursor.execute(_INSERT_ROWS)
+        cursor.execute(f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}) VALUES ('optimize')")
+
+
+@receiver(models.signals.post_save, sender=Movie)
+@receiver(models.signals.post_delete, sender=Movie)
+def index_movie_on_change(sender, instance, **kwargs):
+    index_movie(instance.pk)
+
+
+@receiver(models.signals.post_save, sender=Viewing)
+@receiver(models.signals.post_delete, sender=Viewing)
+def index_movie_on_viewing_change(sender, instance, **kwargs):
+    index_movies(instance.movie_ids())
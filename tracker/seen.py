@@ -0,0 +1,62 @@
+"""
+Marking many movies seen or unseen at once, for the grid's multi-select.
+
+One transaction per batch: a bulk insert (ignore_conflicts, so a double
+click or a racing request can't trip the unique (user, movie) constraint)
+or a single DELETE. Neither sends the Viewing signals, so set_seen does the
+receivers' bookkeeping itself, once per batch rather than once per movie:
+card versions, search rows, rating aggregates, stats totals and the facet
+index's change log in the transaction, the member's recommendations after
+commit.
+"""
+from django.db import transaction
+
+from .background import run_in_background
+from .cards import bump_card_versions
+from .facet_index import log_seen
+from .models import Movie, Viewing
+from .ratings import refresh_rating_aggregates
+from .recommender import refresh_user
+from .search import index_movies
+from .stats import count_viewings
+
+
+def set_seen(user, movie_ids, seen):
+    """
+    Mark `movie_ids` seen (or unseen) for `user`. Returns {movie id: seen}
+    for every id that names a movie; the others are ignored.
+    """
+    movie_ids = set(Movie.objects.filter(pk__in=list(movie_ids)).values_list("pk", flat=True))
+    if not movie_ids:
+        return {}
+
+    with transaction.atomic():
+        # Writing first takes SQLite's write lock (row locks elsewhere), so
+        # what's read below can't go stale before the insert or delete
+        bump_card_versions(pk__in=movie_ids)
+        viewings = Viewing.objects.filter(user=user, movie_id__in=movie_ids)
+        if seen:
+            existing = set(viewings.values_list("movie_id", flat=True))
+            changed = movie_ids - existing
+            Viewing.objects.bulk_create(
+                [Viewing(user=user, movie_id=movie_id) for movie_id in changed],
+                ignore_conflicts=True,
+            )
+            rows = [(user.pk, movie_id, None, None) for movie_id in changed]
+            count_viewings(rows)
+        else:
+            rows = list(viewings.values_list("user_id", "movie_id", "watched_on", "rating"))
+            changed = {movie_id for _, movie_id, _, _ in rows}
+            # A plain DELETE; .delete() would fetch the rows and send
+            # pre/post_delete for each of them. Nothing cascades from Viewing.
+            viewings._raw_delete(viewings.db)
+            count_viewings(rows, -1)
+
+        if changed:
+            index_movies(changed)
+            refresh_rating_aggregates(changed)
+            log_seen(user.pk, sorted(changed), seen)
+            user_id = user.pk
+            transaction.on_commit(lambda: run_in_background(refresh_user, user_id))
+
+    return {movie_id: seen for movie_id in movie_ids}
@@ -0,0 +1,389 @@
+"""
+Content-based "similar movies", precomputed into SimilarMovie.
+
+Each movie becomes a TF-IDF vector over its description words, categories
+and credited people (by role). Only terms shared by at least two movies
+can make two movies alike, and overly common description words say nothing
+about them, so just those terms are kept, in MovieTerm: a sparse vector
+per movie that doubles as an index from each term to its movies. Weights
+are normalized over every term of the movie, kept or not. The cosine
+similarity of two movies is the sum over the terms they share of the
+products of their weights, and each movie keeps its TOP_K best neighbours.
+
+rebuild_similar_movies works out every vector and every neighbour list in
+memory, from flat arrays of (movie, term, weight), one movie's row of
+scores at a time; memory grows with the number of terms, not with the
+catalogue squared.
+
+When a movie, its categories or its people change, a background job run
+after commit recomputes just that movie's vector, then scores it against
+the stored vectors with one aggregate query over the index. From those
+scores it gets its own neighbours and the movies whose weakest neighbour
+it now beats; movies that listed it are rescored the same way. Other
+movies' vectors keep the document frequencies they were built with, so
+weights drift a little until the next rebuild.
+"""
+import math
+import re
+import threading
+from array import array
+from collections import Counter
+from itertools import groupby
+from operator import itemgetter
+
+from django.conf import settings
+from django.db import connection, models, transaction
+from django.db.models import Case, Count, F, FloatField, Sum, Value, When
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .background import run_in_background
+from .models import Category, Movie, MovieCredit, MovieTerm, SimilarMovie
+
+# Description words in more than this share of movies are ignored
+MAX_WORD_DF = 0.5
+# Movies whose neighbours are written per transaction batch
+BLOCK_SIZE = 512
+
+# Categories and people say more about a movie than any one word of its blurb
+TERM_WEIGHTS = {"category": 2.0, "director": 2.0, "writer": 1.5, "starring": 1.5, "word": 1.0}
+
+WORD_RE = re.compile(r"[^\W\d_]{3,}")
+STOPWORDS = frozenset(
+    "about after again all also and any are because been before being but can could did "
+    "does doing down during each few for from further had has have having her here hers "
+    "herself him himself his how into its itself just more most not now off once only other "
+    "our ours out over own same she should some such than that the their theirs them then "
+    "there these they this those through too under until very was were what when where "
+    "which while who whom why will with would you your yours".split()
+)
+
+
+def _top_k():
+    return getattr(settings, "TRACKER_SIMILAR_MOVIES", 8)
+
+
+# --- Features ---
+
+def movie_terms(movie_ids=None):
+    """
+    Yield (movie id, Counter of terms) in id order, for every movie or just
+    `movie_ids`. Terms are "kind:value" strings, e.g. "word:heist",
+    "category:3", "director:12".
+    """
+    def scoped(queryset, field="movie_id"):
+        if movie_ids is not None:
+            queryset = queryset.filter(**{f"{field}__in": movie_ids})
+        return queryset
+
+    descriptions = scoped(Movie.objects.order_by("id"), "id").values_list("id", "description")
+    categories = scoped(Movie.categories.through.objects.order_by("movie_id")).values_list("movie_id", "category_id")
+    credits = scoped(MovieCredit.objects.order_by("movie_id")).values_list("movie_id", "role", "person_id")
+
+    # The three lists are merged on movie id, so only one movie's terms are
+    # in memory at a time
+    category_groups = groupby(categories.iterator(chunk_size=2000), key=itemgetter(0))
+    credit_groups = groupby(credits.iterator(chunk_size=2000), key=itemgetter(0))
+    next_categories = next(category_groups, None)
+    next_credits = next(credit_groups, None)
+    for movie_id, description in descriptions.iterator(chunk_size=2000):
+        terms = Counter(
+            f"word:{word}" for word in WORD_RE.findall(description.lower()) if word not in STOPWORDS
+        )
+        while next_categories and next_categories[0] <= movie_id:
+            if next_categories[0] == movie_id:
+                terms.update(f"category:{category_id}" for _, category_id in next_categories[1])
+            next_categories = next(category_groups, None)
+        while next_credits and next_credits[0] <= movie_id:
+            if next_credits[0] == movie_id:
+                terms.update(f"{role}:{person_id}" for _, role, person_id in next_credits[1])
+            next_credits = next(credit_groups, None)
+        yield movie_id, terms
+
+
+def _kind(term):
+    return term.split(":", 1)[0]
+
+
+def _idf(df, total):
+    return math.log((1 + total) / (1 + df)) + 1
+
+
+def _shared(term, df, total):
+    """Whether a term in `df` of `total` movies can make two of them alike."""
+    return df >= 2 and not (_kind(term) == "word" and df > MAX_WORD_DF * total)
+
+
+def _vector(terms, df, total):
+    """{term: weight} of the shared terms, normalized over all of them."""
+    weights = {
+        term: (1 + math.log(count)) * _idf(df.get(term, 1), total) * TERM_WEIGHTS[_kind(term)]
+        for term, count in terms.items()
+    }
+    norm = math.sqrt(sum(weight * weight for weight in weights.values()))
+    return {
+        term: weight / norm
+        for term, weight in weights.items()
+        if _shared(term, df.get(term, 1), total)
+    }
+
+
+def _store_vector(movie_id, terms, total):
+    """Replace one movie's MovieTerm rows, with the others' document frequencies."""
+    others = dict(
+        MovieTerm.objects.filter(term__in=list(terms)).exclude(movie_id=movie_id)
+        .values_list("term").annotate(n=Count("pk")).order_by()
+    )
+    df = {term: others.get(term, 0) + 1 for term in terms}
+    vector = _vector(terms, df, total)
+    MovieTerm.objects.filter(movie_id=movie_id).delete()
+    MovieTerm.objects.bulk_create(
+        MovieTerm(movie_id=movie_id, term=term, weight=weight) for term, weight in vector.items()
+    )
+
+
+# --- Neighbours ---
+
+def _scores(movie_id, limit=None):
+    """
+    [(other movie id, cosine similarity)] best first, from the stored
+    vectors: one aggregate over the index entries of the movie's terms.
+    """
+    vector = dict(MovieTerm.objects.filter(movie_id=movie_id).values_list("term", "weight"))
+    if not vector:
+        return []
+    score = Sum(
+        F("weight") * Case(*(When(term=term, then=Value(weight)) for term, weight in vector.items())),
+        output_field=FloatField(),
+    )
+    scores = (
+        MovieTerm.objects.filter(term__in=list(vector)).exclude(movie_id=movie_id)
+        .values("movie_id").annotate(score=score).order_by("-score", "movie_id")
+        .values_list("movie_id", "score")
+    )
+    if limit is not None:
+        scores = scores[:limit]
+    return [(other, min(value, 1.0)) for other, value in scores if value > 0]
+
+
+def _write(neighbours, replace=True):
+    """Write {movie id: [(similar id, score), ...] best first} as SimilarMovie rows."""
+    ids = list(neighbours)
+    now = timezone.now()
+    with transaction.atomic():
+        for start in range(0, len(ids), 500):
+            if replace:
+                SimilarMovie.objects.filter(movie_id__in=ids[start:start + 500]).delete()
+            # Their detail pages list the neighbours (see http_cache.py);
+            # cards don't, so card versions stay
+            Movie.objects.filter(pk__in=ids[start:start + 500]).update(updated_at=now)
+        _insert(
+            SimilarMovie,
+            ("movie_id", "similar_id", "score", "rank"),
+            (
+                (movie_id, similar_id, score, rank)
+                for movie_id, best in neighbours.items()
+                for rank, (similar_id, score) in enumerate(best, 1)
+            ),
+        )
+    return sum(map(len, neighbours.values()))
+
+
+def _insert(model, columns, rows, batch_size=5000):
+    """
+    INSERT plain tuples. A rebuild writes hundreds of thousands of rows,
+    and building a model instance for each costs more than the insert.
+    """
+    sql = "INSERT INTO {} ({}) VALUES ({})".format(
+        connection.ops.quote_name(model._meta.db_table),
+        ", ".join(map(connection.ops.quote_name, columns)),
+        ", ".join(["%s"] * len(columns)),
+    )
+    batch = []
+    with connection.cursor() as cursor:
+        for row in rows:
+            batch.append(row)
+            if len(batch) == batch_size:
+                cursor.executemany(sql, batch)
+                batch.clear()
+        if batch:
+            cursor.executemany(sql, batch)
+
+
+def rebuild_similar_movies(k=None):
+    """Recompute every movie's vector and neighbours. Returns (movies, neighbour rows)."""
+    import numpy as np
+
+    k = _top_k() if k is None else k
+
+    # One flat (row, term, count) entry per term of each movie
+    movie_ids, vocabulary = [], {}
+    rows, columns, counts = array("i"), array("i"), array("f")
+    for row, (movie_id, terms) in enumerate(movie_terms()):
+        movie_ids.append(movie_id)
+        for term, count in terms.items():
+            rows.append(row)
+            columns.append(vocabulary.setdefault(term, len(vocabulary)))
+            counts.append(count)
+    total = len(movie_ids)
+    rows = np.frombuffer(rows, dtype=np.int32)
+    columns = np.frombuffer(columns, dtype=np.int32)
+    terms = list(vocabulary)
+    del vocabulary
+
+    df = np.bincount(columns, minlength=len(terms))
+    idf = np.log((1 + total) / (1 + df)) + 1
+    kind_weights = np.array([TERM_WEIGHTS[_kind(term)] for term in terms])
+    weights = (1 + np.log(np.frombuffer(counts, dtype=np.float32))) * (idf * kind_weights)[columns]
+    norms = np.sqrt(np.bincount(rows, weights=weights * weights, minlength=total))
+    weights = (weights / np.where(norms, norms, 1)[rows]).astype(np.float32)
+
+    shared = np.array([_shared(term, n, total) for term, n in zip(terms, df.tolist())], dtype=bool)
+    keep = shared[columns]
+    rows, columns, weights = rows[keep], columns[keep], weights[keep]
+
+    # Per movie: its slice of the entries (rows are already in order); per
+    # term: its movies and their weights
+    row_starts = np.searchsorted(rows, np.arange(total + 1)).tolist()
+    by_term = np.argsort(columns, kind="stable")
+    term_rows, term_weights = rows[by_term], weights[by_term]
+    term_starts = np.searchsorted(columns[by_term], np.arange(len(terms) + 1)).tolist()
+    entry_columns, entry_weights = columns.tolist(), weights.tolist()
+
+    with transaction.atomic():
+        MovieTerm.objects.all().delete()
+        _insert(
+            MovieTerm,
+            ("movie_id", "term", "weight"),
+            (
+                (movie_ids[row], terms[column], weight)
+                for row, column, weight in zip(rows.tolist(), entry_columns, entry_weights)
+            ),
+        )
+        SimilarMovie.objects.all().delete()
+        stored = 0
+        scores = np.zeros(total, dtype=np.float32)
+        for block in range(0, total, BLOCK_SIZE):
+            neighbours = {}
+            for row in range(block, min(block + BLOCK_SIZE, total)):
+                scores[:] = 0
+                for i in range(row_starts[row], row_starts[row + 1]):
+                    column = entry_columns[i]
+                    start, end = term_starts[column], term_starts[column + 1]
+                    scores[term_rows[start:end]] += entry_weights[i] * term_weights[start:end]
+                scores[row] = 0  # never your own neighbour
+                count = min(k, total - 1)
+                best = np.argpartition(-scores, count - 1)[:count] if count > 0 else []
+                neighbours[movie_ids[row]] = [
+                    (movie_ids[col], min(float(scores[col]), 1.0))
+                    for col in sorted(best, key=lambda col: (-scores[col], col))
+                    if scores[col] > 0
+                ]
+            stored += _write(neighbours, replace=False)
+    return total, stored
+
+
+def refresh_similar_movies(changed_ids, k=None):
+    """Recompute the changed movies' vectors, and the neighbour lists they can affect."""
+    k = _top_k() if k is None else k
+    if not MovieTerm.objects.exists():
+        # Nothing to score against until the first rebuild
+        rebuild_similar_movies(k)
+        return
+    total = Movie.objects.count()
+    changed = []
+    for movie_id, terms in movie_terms(changed_ids):
+        _store_vector(movie_id, terms, total)
+        changed.append(movie_id)
+
+    neighbours, challengers = {}, {}
+    for movie_id in changed:
+        scores = _scores(movie_id)
+        neighbours[movie_id] = scores[:k]
+        for other, score in scores:
+            challengers.setdefault(other, []).append((movie_id, score))
+
+    # Movies that listed a changed (or deleted) movie may need a replacement
+    # for it, so they're rescored in full
+    listed_by = set(
+        SimilarMovie.objects.filter(similar_id__in=changed_ids).values_list("movie_id", flat=True)
+    ) - set(neighbours)
+    for movie_id in listed_by:
+        neighbours[movie_id] = _scores(movie_id, limit=k)
+
+    # The rest only gain a changed movie, if it beats their weakest neighbour
+    candidates = [movie_id for movie_id in challengers if movie_id not in neighbours]
+    for start in range(0, len(candidates), 500):
+        current = {movie_id: [] for movie_id in candidates[start:start + 500]}
+        listed = SimilarMovie.objects.filter(movie_id__in=list(current)).order_by("movie_id", "rank")
+        for movie_id, similar_id, score in listed.values_list("movie_id", "similar_id", "score"):
+            current[movie_id].append((similar_id, score))
+        for movie_id, best in current.items():
+            merged = sorted(best + challengers[movie_id], key=lambda pair: (-pair[1], pair[0]))[:k]
+            if merged != best:
+                neighbours[movie_id] = merged
+
+    if neighbours:
+        _write(neighbours)
+
+
+# --- Change tracking ---
+
+_pending = set()
+_lock = threading.Lock()
+_refresh_scheduled = False
+
+
+def _drain():
+    global _refresh_scheduled
+    with _lock:
+        movie_ids = set(_pending)
+        _pending.clear()
+        _refresh_scheduled = False
+    if movie_ids:
+        refresh_similar_movies(movie_ids)
+
+
+def _enqueue(movie_ids):
+    global _refresh_scheduled
+    with _lock:
+        _pending.update(movie_ids)
+        if _refresh_scheduled:
+            return
+        _refresh_scheduled = True
+    run_in_background(_drain)
+
+
+def refresh_later(*movie_ids):
+    """Queue movies for a neighbour refresh after the current transaction commits."""
+    movie_ids = {i for i in movie_ids if i is not None}
+    if movie_ids:
+        transaction.on_commit(lambda: _enqueue(movie_ids))
+
+
+@receiver(models.signals.post_save, sender=Movie)
+def refresh_similar_on_save(sender, instance, raw=False, **kwargs):
+    if not raw:
+        refresh_later(instance.pk)
+
+
+@receiver(models.signals.pre_delete, sender=Movie)
+def refresh_similar_on_delete(sender, instance, **kwargs):
+    # The rows pointing at it cascade away; their movies need a replacement
+    refresh_later(*SimilarMovie.objects.filter(similar=instance).values_list("movie_id", flat=True))
+
+
+@receiver(models.signals.m2m_changed, sender=Movie.categories.through)
+def refresh_similar_on_category_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ("post_add", "post_remove", "post_clear"):
+            refresh_later(instance.pk)
+    elif action in ("post_add", "post_remove"):
+        refresh_later(*pk_set)
+    elif action == "pre_clear":
+        refresh_later(*instance.movies.values_list("pk", flat=True))
+
+
+@receiver(models.signals.pre_delete, sender=Category)
+def refresh_similar_on_category_delete(sender, instance, **kwargs):
+    refresh_later(*instance.movies.values_list("pk", flat=True))
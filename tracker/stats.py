@@ -0,0 +1,421 @@
+"""
+Club statistics, kept as running totals in StatRollup so the dashboard
+reads a few hundred rows however long the viewing history gets.
+
+Every viewing contributes to a handful of (metric, key) totals, once for
+its member and once club-wide: all viewings, its watched_on month, its
+rating, and its movie's categories, streaming services and recommender.
+Every movie contributes to the club's movie counts. The receivers below
+turn each change into deltas (the old contribution out, the new one in)
+and apply them in the change's transaction. Bulk writes skip the
+receivers: they pass the viewings they wrote to count_viewings, or
+rebuild_stats recomputes everything from scratch.
+"""
+from collections import defaultdict, namedtuple
+
+from django.contrib.auth.models import User
+from django.db import models, transaction
+from django.db.models import F
+from django.dispatch import receiver
+
+from .models import Category, Movie, StatRollup, StreamingService, Viewing
+
+Metric = StatRollup.Metric
+
+# What a viewing's totals need to know about its movie
+MovieAttrs = namedtuple("MovieAttrs", "recommended_by_id category_ids service_ids")
+
+M2M_METRICS = {
+    Movie.categories.through: ("category_id", Metric.CATEGORY, Metric.CATEGORY_MOVIES),
+    Movie.streaming_services.through: ("streamingservice_id", Metric.STREAMING, Metric.STREAMING_MOVIES),
+}
+
+# Totals per UPDATE, well inside SQLite's expression depth and variable limits
+APPLY_BATCH = 100
+
+
+# --- Terms ---
+
+def movie_attrs(movie_ids=None):
+    """{movie id: MovieAttrs} for `movie_ids` (every movie if None), in three queries."""
+    movies = Movie.objects.all()
+    if movie_ids is not None:
+        movies = movies.filter(pk__in=list(movie_ids))
+    recommenders = dict(movies.values_list("pk", "recommended_by_id").iterator(chunk_size=5000))
+    linked = {}
+    for through, (column, _, _) in M2M_METRICS.items():
+        rows = through.objects.values_list("movie_id", column)
+        if movie_ids is not None:
+            rows = rows.filter(movie_id__in=recommenders.keys())
+        linked[through] = defaultdict(list)
+        for movie_id, key_id in rows.iterator(chunk_size=5000):
+            linked[through][movie_id].append(key_id)
+    categories, services = (linked[through] for through in M2M_METRICS)
+    return {
+        movie_id: MovieAttrs(recommended_by_id, categories[movie_id], services[movie_id])
+        for movie_id, recommended_by_id in recommenders.items()
+    }
+
+
+def viewing_terms(user_id, watched_on, rating, attrs):
+    """Yield ((metric, key, user id), rating) for each total a viewing counts in."""
+    keys = [(Metric.VIEWINGS, "")]
+    if watched_on:
+        keys.append((Metric.MONTH, f"{watched_on:%Y-%m}"))
+    if rating is not None:
+        keys.append((Metric.RATING, f"{rating:.1f}"))
+    keys.extend((Metric.CATEGORY, str(i)) for i in attrs.category_ids)
+    keys.extend((Metric.STREAMING, str(i)) for i in attrs.service_ids)
+    if attrs.recommended_by_id:
+        keys.append((Metric.RECOMMENDER, str(attrs.recommended_by_id)))
+    rating = float(rating) if rating is not None else None
+    for metric, key in keys:
+        yield (metric, key, user_id), rating
+        yield (metric, key, None), rating
+
+
+def _link_terms(metric, key, user_id, rating):
+    # One viewing's share of a per-category/service/recommender total
+    rating = float(rating) if rating is not None else None
+    return [((metric, key, user_id), rating), ((metric, key, None), rating)]
+
+
+def movie_terms(attrs):
+    """Yield ((metric, key, None), None) for each club total a movie counts in."""
+    yield (Metric.MOVIES, "", None), None
+    if attrs.recommended_by_id:
+        yield (Metric.RECOMMENDED, str(attrs.recommended_by_id), None), None
+    for i in attrs.category_ids:
+        yield (Metric.CATEGORY_MOVIES, str(i), None), None
+    for i in attrs.service_ids:
+        yield (Metric.STREAMING_MOVIES, str(i), None), None
+
+
+def add_terms(deltas, terms, sign=1):
+    """Accumulate `terms` into {(metric, key, user id): [count, rating count, rating sum]}."""
+    for total, rating in terms:
+        delta = deltas[total]
+        delta[0] += sign
+        if rating is not None:
+            delta[1] += sign
+            delta[2] += sign * rating
+
+
+def _deltas():
+    return defaultdict(lambda: [0, 0, 0.0])
+
+
+def _matching(totals):
+    match = models.Q(pk__in=[])
+    for metric, key, user_id in totals:
+        match |= models.Q(metric=metric, key=key, user_id=user_id)
+    return match
+
+
+def apply_deltas(deltas):
+    """
+    Add `deltas` to the StatRollup rows, creating any that don't exist yet.
+    Totals that move by the same amounts (every total of one viewing,
+    usually) share an UPDATE.
+    """
+    groups = defaultdict(list)
+    for total, delta in deltas.items():
+        if any(delta):
+            groups[tuple(delta)].append(total)
+    with transaction.atomic():
+        for (count, rating_count, rating_sum), totals in groups.items():
+            for start in range(0, len(totals), APPLY_BATCH):
+                batch = totals[start:start + APPLY_BATCH]
+                rows = StatRollup.objects.filter(_matching(batch))
+                updated = rows.update(
+                    count=F("count") + count,
+                    rating_count=F("rating_count") + rating_count,
+                    rating_sum=F("rating_sum") + rating_sum,
+                )
+                # A negative delta for a missing row belongs to a row some
+                # delete receiver has already dropped
+                if updated == len(batch) or count <= 0:
+                    continue
+                existing = set(rows.values_list("metric", "key", "user_id"))
+                StatRollup.objects.bulk_create(
+                    StatRollup(
+                        metric=metric,
+                        key=key,
+                        user_id=user_id,
+                        count=count,
+                        rating_count=rating_count,
+                        rating_sum=rating_sum,
+                    )
+                    for metric, key, user_id in batch
+                    if (metric, key, user_id) not in existing
+                )
+
+
+def count_viewings(rows, sign=1):
+    """
+    Count (user id, movie id, watched_on, rating) rows into the totals, or
+    out of them with sign=-1, for bulk writes that skip the receivers.
+    """
+    rows = list(rows)
+    attrs = movie_attrs({movie_id for _, movie_id, _, _ in rows})
+    deltas = _deltas()
+    for user_id, movie_id, watched_on, rating in rows:
+        if movie_id in attrs:
+            add_terms(deltas, viewing_terms(user_id, watched_on, rating, attrs[movie_id]), sign)
+    apply_deltas(deltas)
+
+
+def rebuild_stats():
+    """Recompute every StatRollup row from Movie and Viewing. Returns the row count."""
+    attrs = movie_attrs()
+    deltas = _deltas()
+    for movie in attrs.values():
+        add_terms(deltas, movie_terms(movie))
+    viewings = Viewing.objects.values_list("user_id", "movie_id", "watched_on", "rating")
+    for user_id, movie_id, watched_on, rating in viewings.iterator(chunk_size=5000):
+        add_terms(deltas, viewing_terms(user_id, watched_on, rating, attrs[movie_id]))
+
+    rows = [
+        StatRollup(
+            metric=metric, key=key, user_id=user_id, count=count, rating_count=rating_count, rating_sum=rating_sum
+        )
+        for (metric, key, user_id), (count, rating_count, rating_sum) in deltas.items()
+        if count
+    ]
+    with transaction.atomic():
+        StatRollup.objects.all().delete()
+        StatRollup.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+# --- Reading ---
+
+def _rows(user):
+    rows = defaultdict(dict)
+    scope = StatRollup.objects.filter(user=user) if user else StatRollup.objects.filter(user__isnull=True)
+    for row in scope.filter(count__gt=0):
+        rows[row.metric][row.key] = row
+    return rows
+
+
+def _average(row):
+    average = row.average_rating if row else None
+    return round(average, 2) if average is not None else None
+
+
+def _breakdown(rows, model, viewing_metric, movie_metric=None, label="name"):
+    """Per-object viewings, ratings and (club-wide) movie counts, busiest first."""
+    viewings = rows.get(viewing_metric, {})
+    movies = rows.get(movie_metric, {}) if movie_metric else {}
+    names = dict(model.objects.filter(pk__in={int(k) for k in {*viewings, *movies}}).values_list("pk", label))
+    entries = []
+    for key in {*viewings, *movies}:
+        if int(key) not in names:
+            continue
+        row = viewings.get(key)
+        entry = {
+            "id": int(key),
+            "name": names[int(key)],
+            "viewings": row.count if row else 0,
+            "average_rating": _average(row),
+        }
+        if movie_metric:
+            entry["movies"] = movies[key].count if key in movies else 0
+        entries.append(entry)
+    entries.sort(key=lambda e: (-e.get("movies", 0), -e["viewings"], e["name"]))
+    return entries
+
+
+def stats_members():
+    """The members who have logged a viewing, from the rollups rather than Viewing."""
+    return User.objects.filter(
+        pk__in=StatRollup.objects.filter(metric=Metric.VIEWINGS, key="", user__isnull=False, count__gt=0).values("user_id")
+    ).order_by("username")
+
+
+def stats_for(user=None):
+    """
+    The dashboard's numbers, club-wide or for one member, read from a fixed
+    handful of rollup queries.
+    """
+    rows = _rows(user)
+    totals = rows.get(Metric.VIEWINGS, {}).get("")
+    stats = {
+        "member": user.username if user else None,
+        "viewings": totals.count if totals else 0,
+        "ratings": totals.rating_count if totals else 0,
+        "average_rating": _average(totals),
+        "per_month": [
+            {"month": key, "viewings": row.count}
+            for key, row in sorted(rows.get(Metric.MONTH, {}).items())
+        ],
+        "rating_distribution": [
+            {"rating": key, "count": row.count}
+            for key, row in sorted(rows.get(Metric.RATING, {}).items(), key=lambda item: float(item[0]))
+        ],
+        "categories": _breakdown(rows, Category, Metric.CATEGORY, None if user else Metric.CATEGORY_MOVIES),
+        "streaming_services": _breakdown(
+            rows, StreamingService, Metric.STREAMING, None if user else Metric.STREAMING_MOVIES
+        ),
+        "recommenders": _breakdown(
+            rows, User, Metric.RECOMMENDER, None if user else Metric.RECOMMENDED, label="first_name"
+        ),
+    }
+    if user is None:
+        movies = rows.get(Metric.MOVIES, {}).get("")
+        stats["movies"] = movies.count if movies else 0
+        members = StatRollup.objects.filter(
+            metric=Metric.VIEWINGS, key="", user__isnull=False, count__gt=0
+        ).select_related("user")
+        stats["members"] = sorted(
+            (
+                {
+                    "id": row.user_id,
+                    "username": row.user.username,
+                    "name": row.user.first_name or row.user.username,
+                    "viewings": row.count,
+                    "ratings": row.rating_count,
+                    "average_rating": _average(row),
+                }
+                for row in members
+            ),
+            key=lambda member: (-member["viewings"], member["username"]),
+        )
+    return stats
+
+
+# --- Change tracking ---
+
+@receiver(models.signals.pre_save, sender=Viewing)
+def remember_viewing_before_save(sender, instance, raw=False, **kwargs):
+    instance._stats_before = None
+    if raw or not instance.pk:
+        return
+    instance._stats_before = instance.loaded_values()
+    if instance._stats_before is None:
+        # Only for a viewing saved by pk without being loaded first
+        instance._stats_before = (
+            Viewing.objects.filter(pk=instance.pk).values_list(*Viewing.LOADED_FIELDS).first()
+        )
+
+
+@receiver(models.signals.post_save, sender=Viewing)
+def count_viewing_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    before = getattr(instance, "_stats_before", None)
+    attrs = movie_attrs({instance.movie_id} | ({before[1]} if before else set()))
+    deltas = _deltas()
+    if before:
+        user_id, movie_id, watched_on, rating = before
+        add_terms(deltas, viewing_terms(user_id, watched_on, rating, attrs[movie_id]), -1)
+    add_terms(deltas, viewing_terms(instance.user_id, instance.watched_on, instance.rating, attrs[instance.movie_id]))
+    apply_deltas(deltas)
+
+
+@receiver(models.signals.pre_delete, sender=Viewing)
+def uncount_viewing_on_delete(sender, instance, **kwargs):
+    # pre_delete, while the movie's categories etc. still exist in a cascade
+    attrs = movie_attrs([instance.movie_id])
+    if instance.movie_id not in attrs:
+        return
+    deltas = _deltas()
+    add_terms(deltas, viewing_terms(instance.user_id, instance.watched_on, instance.rating, attrs[instance.movie_id]), -1)
+    apply_deltas(deltas)
+
+
+@receiver(models.signals.pre_save, sender=Movie)
+def remember_recommender_before_save(sender, instance, raw=False, update_fields=None, **kwargs):
+    instance._stats_recommended_by = None
+    if raw or instance._state.adding or (update_fields is not None and "recommended_by" not in update_fields):
+        return
+    if hasattr(instance, "_loaded_recommended_by"):
+        instance._stats_recommended_by = instance._loaded_recommended_by
+        return
+    # Only for a movie saved by pk without being loaded first
+    instance._stats_recommended_by = (
+        Movie.objects.filter(pk=instance.pk).values_list("recommended_by_id", flat=True).first()
+    )
+
+
+@receiver(models.signals.post_save, sender=Movie)
+def count_movie_on_save(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    deltas = _deltas()
+    if created:
+        add_terms(deltas, movie_terms(MovieAttrs(instance.recommended_by_id, [], [])))
+    elif update_fields is None or "recommended_by" in update_fields:
+        old, new = instance._stats_recommended_by, instance.recommended_by_id
+        if old == new:
+            return
+        # Move the movie, and every viewing of it, to the new recommender
+        viewings = list(Viewing.objects.filter(movie=instance).values_list("user_id", "rating"))
+        for recommender, sign in ((old, -1), (new, 1)):
+            if recommender is not None:
+                key = str(recommender)
+                add_terms(deltas, [((Metric.RECOMMENDED, key, None), None)], sign)
+                for user_id, rating in viewings:
+                    add_terms(deltas, _link_terms(Metric.RECOMMENDER, key, user_id, rating), sign)
+    apply_deltas(deltas)
+
+
+@receiver(models.signals.pre_delete, sender=Movie)
+def uncount_movie_on_delete(sender, instance, **kwargs):
+    # Its viewings are uncounted by their own pre_delete in the cascade
+    deltas = _deltas()
+    for attrs in movie_attrs([instance.pk]).values():
+        add_terms(deltas, movie_terms(attrs), -1)
+    apply_deltas(deltas)
+
+
+def _count_links(through, pairs, sign):
+    """Count (or uncount) category / streaming service links, with their movies' viewings."""
+    if not pairs:
+        return
+    _, viewing_metric, movie_metric = M2M_METRICS[through]
+    viewings = defaultdict(list)
+    for movie_id, user_id, rating in Viewing.objects.filter(
+        movie_id__in={movie_id for movie_id, _ in pairs}
+    ).values_list("movie_id", "user_id", "rating"):
+        viewings[movie_id].append((user_id, rating))
+    deltas = _deltas()
+    for movie_id, key_id in pairs:
+        key = str(key_id)
+        add_terms(deltas, [((movie_metric, key, None), None)], sign)
+        for user_id, rating in viewings[movie_id]:
+            add_terms(deltas, _link_terms(viewing_metric, key, user_id, rating), sign)
+    apply_deltas(deltas)
+
+
+@receiver(models.signals.m2m_changed, sender=Movie.categories.through)
+@receiver(models.signals.m2m_changed, sender=Movie.streaming_services.through)
+def count_links_on_m2m_change(sender, instance, action, reverse, pk_set, **kwargs):
+    column = M2M_METRICS[sender][0]
+    if action == "post_add":
+        # pk_set holds only the links that were actually added
+        pairs = [(pk, instance.pk) for pk in pk_set] if reverse else [(instance.pk, pk) for pk in pk_set]
+        _count_links(sender, pairs, 1)
+    elif action in ("pre_remove", "pre_clear"):
+        # Ask the table which links exist; pk_set may name some that don't
+        links = sender.objects.filter(**{column if reverse else "movie_id": instance.pk})
+        if action == "pre_remove":
+            links = links.filter(**{"movie_id__in" if reverse else f"{column}__in": pk_set})
+        _count_links(sender, list(links.values_list("movie_id", column)), -1)
+
+
+@receiver(models.signals.pre_delete, sender=Category)
+def forget_category_on_delete(sender, instance, **kwargs):
+    StatRollup.objects.filter(metric__in=[Metric.CATEGORY, Metric.CATEGORY_MOVIES], key=str(instance.pk)).delete()
+
+
+@receiver(models.signals.pre_delete, sender=StreamingService)
+def forget_streaming_service_on_delete(sender, instance, **kwargs):
+    StatRollup.objects.filter(metric__in=[Metric.STREAMING, Metric.STREAMING_MOVIES], key=str(instance.pk)).delete()
+
+
+@receiver(models.signals.pre_delete, sender=User)
+def forget_recommender_on_delete(sender, instance, **kwargs):
+    # Their movies' recommended_by is set to NULL without any signal; their
+    # own rows go with them (and their viewings uncount themselves)
+    StatRollup.objects.filter(metric__in=[Metric.RECOMMENDER, Metric.RECOMMENDED], key=str(instance.pk)).delete()
@@ -0,0 +1,82 @@
+"""
+Random movie suggestions that never load the candidate rows.
+
+A uniform pick draws offsets below the candidates' count and fetches just
+those rows. A weighted pick gives every candidate a small integer weight,
+draws a point below the total weight and takes the movie whose running
+total (a window SUM in SQL) first passes it. Either way the database does
+the scanning and only the chosen movies come back.
+"""
+import random
+
+from django.db.models import Case, Exists, F, IntegerField, OuterRef, Q, Sum, When, Window
+from django.db.models.functions import Cast, Round
+
+from .models import Movie
+
+SUGGESTION_MODES = {
+    "uniform": "Any movie",
+    "rated": "Favour highly rated",
+    "recommended": "Favour recommended by others",
+    "streaming": "Favour my streaming services",
+}
+MAX_SUGGESTIONS = 5
+
+# How much likelier a favoured movie is than any other
+FAVOURED_WEIGHT = 4
+
+
+def suggestion_weight(mode, user=None, streaming_ids=()):
+    """
+    Integer weight expression for a SUGGESTION_MODES key, or None for a
+    uniform pick.
+    """
+    if mode == "rated":
+        # 1 for unrated up to 11 for a 5.0, in half-star steps, from the
+        # Bayesian score ratings.py keeps on Movie (the grid's "top rated")
+        return 1 + Cast(Round(F("rating_score") * 2), IntegerField())
+    if mode == "recommended":
+        others = Q(recommended_by__isnull=False)
+        if user is not None and user.is_authenticated:
+            others &= ~Q(recommended_by=user)
+        return Case(When(others, then=FAVOURED_WEIGHT), default=1, output_field=IntegerField())
+    if mode == "streaming" and streaming_ids:
+        on_selected = Exists(
+            Movie.streaming_services.through.objects.filter(
+                movie=OuterRef("pk"), streamingservice_id__in=streaming_ids
+            )
+        )
+        return Case(When(on_selected, then=FAVOURED_WEIGHT), default=1, output_field=IntegerField())
+    return None
+
+
+def pick_movies(queryset, count=1, weight=None):
+    """
+    Up to `count` different movies from `queryset`, picked uniformly or with
+    probability proportional to the `weight` expression.
+    """
+    queryset = queryset.order_by("pk")
+    if weight is None:
+        total = queryset.count()
+        picks = []
+        for offset in random.sample(range(total), min(count, total)):
+            # A movie deleted since the count just means one fewer pick
+            picks.extend(queryset[offset:offset + 1])
+        return picks
+
+    picks = []
+    for _ in range(count):
+        remaining = queryset.exclude(pk__in=[movie.pk for movie in picks])
+        total = remaining.aggregate(total=Sum(weight))["total"]
+        if not total:
+            break
+        target = random.randrange(total)
+        pick = (
+            remaining.annotate(running=Window(Sum(weight), order_by=F("pk").asc()))
+            .filter(running__gt=target)
+            .first()
+        )
+        if pick is None:
+            break
+        picks.append(pick)
+    return picks
@@ -0,0 +1,19 @@
+from django import template
+
+from tracker.thumbnails import picture_sources
+
+register = template.Library()
+
+@register.inclusion_tag("tracker/_poster.html")
+def poster(movie, sizes, css_class="", loading="lazy"):
+    """
+    Responsive <picture> for a movie poster: WebP with a JPEG fallback at
+    each thumbnail width, or the original file until thumbnails exist.
+    """
+    return {
+        "movie": movie,
+        "sources": picture_sources(movie),
+        "sizes": sizes,
+        "css_class": css_class,
+        "loading": loading,
+    }
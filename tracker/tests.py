@@ -1,3 +1,1963 @@
-from django.test import TestCase
+"""
+Query budgets for every view in tracker/urls.py.
 
-# Create your tests here.
+Each view gets a fixed number of queries. The same budgets are asserted
+against a small and a larger synthetic catalogue (generate_synthetic_data),
+so a view whose query count grows with the number of movies, viewings or
+people (an N+1 in a template, say) fails here. Timing is left to the
+benchmark_views command, which compares against a recorded baseline.
+"""
+import json
+import math
+import os
+import re
+import tempfile
+from datetime import date
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.exceptions import BadRequest
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from PIL import Image
+
+from movie_club import instrumentation, settings_production, static_assets
+
+from . import (
+    admin as tracker_admin,
+    async_views,
+    cards,
+    checks,
+    cleanup,
+    facet_index,
+    facets,
+    ratings,
+    recommender,
+    search,
+    similarity,
+    suggest,
+    thumbnails,
+    urls as tracker_urls,
+    views,
+)
+from .forms import MovieForm
+from .management.commands.benchmark_views import _scenarios
+from .models import (
+    Category,
+    FacetChange,
+    Movie,
+    MovieCredit,
+    MovieFactors,
+    MovieTerm,
+    Person,
+    Recommendation,
+    SimilarMovie,
+    StatRollup,
+    StreamingService,
+    UserFactors,
+    Viewing,
+)
+from .pagination import keyset_page, ranked_page
+from .replicas import STICKY_COOKIE, refresh_replica
+from .seen import set_seen
+from .stats import rebuild_stats, stats_for
+
+# {scenario: queries}. Every request includes the session and user lookups
+# when logged in.
+QUERY_BUDGETS = {
+    "movie_list": 13,
+    "movie_list:not_modified": 1,
+    "movie_list:member": 15,
+    "movie_list:filtered": 15,
+    "movie_list:search": 18,
+    "movie_list:ajax": 9,
+    "movie_grid": 9,
+    "movie_ids": 4,
+    "movie_cards": 8,
+    "export_movies": 6,
+    "export_viewings": 4,
+    "toggle_seen:seen": 20,
+    "toggle_seen:unseen": 16,
+    "toggle_seen_batch:seen": 18,
+    "toggle_seen_batch:unseen": 19,
+    "movie_suggest": 9,
+    "movie_suggest:post": 15,
+    "movie_recommendations": 3,
+    "club_stats": 8,
+    "club_stats:member": 8,
+    "club_stats_data": 5,
+    "add_movie": 4,
+    "add_movie:post": 56,
+    "movie_detail": 8,
+    "movie_detail:anonymous": 6,
+    "movie_detail:not_modified": 3,
+    "movie_detail:similar": 8,
+    "movie_detail:post": 24,
+    "movie_edit": 7,
+    "movie_edit:post": 31,
+    "movie_delete": 3,
+    "movie_delete:post": 47,
+}
+
+
+class QueryBudgetMixin:
+    """The budget tests; subclasses pick the catalogue size."""
+
+    catalogue = {}
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command("generate_synthetic_data", seed=1, stdout=StringIO(), **cls.catalogue)
+        cls.member = User.objects.create_user("member", password="x", first_name="Member")
+        cls.other = User.objects.create_user("other", password="x", first_name="Other")
+        cls.categories = list(Category.objects.order_by("pk")[:2])
+        cls.service = StreamingService.objects.order_by("pk").first()
+
+        # The movie the write views act on has the same shape in every
+        # catalogue, since what they touch depends on its links and viewings
+        cls.movie = Movie.objects.create(
+            title="Budget Movie",
+            year=2001,
+            description="A movie for counting queries",
+            starring="Ada Abbott, Ben Baker",
+            director="Carl Carter",
+            recommended_by=cls.other,
+        )
+        cls.movie.categories.set(cls.categories)
+        cls.movie.streaming_services.set([cls.service])
+        Viewing.objects.create(user=cls.member, movie=cls.movie, rating=4)
+        Viewing.objects.create(user=cls.other, movie=cls.movie, rating=3, comment="Fine")
+        cls.unseen = Movie.objects.create(title="Unseen Budget Movie", year=2003, recommended_by=cls.other)
+        cls.unseen.categories.set(cls.categories)
+        cls.unseen.streaming_services.set([cls.service])
+
+    def setUp(self):
+        # Start every test with empty caches and a freshly built facet index,
+        # so cached pages don't hide queries and counts don't depend on order
+        for alias in settings.CACHES:
+            caches[alias].clear()
+        facet_index.index.invalidate()
+        facet_index.index.rebuild()
+        self.client.force_login(self.member)
+
+    def assertBudget(self, scenario, method, url, data=None, **extra):
+        with self.assertNumQueries(QUERY_BUDGETS[scenario]):
+            response = getattr(self.client, method)(url, data or {}, **extra)
+            if response.streaming:
+                b"".join(response.streaming_content)
+        self.assertLess(response.status_code, 400, scenario)
+        return response
+
+    # --- Grid ---
+
+    def test_movie_list(self):
+        self.client.logout()
+        self.assertBudget("movie_list", "get", reverse("movie_list"))
+
+    def test_movie_list_not_modified(self):
+        self.client.logout()
+        etag = self.client.get(reverse("movie_list"))["ETag"]
+        response = self.assertBudget("movie_list:not_modified", "get", reverse("movie_list"), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_movie_list_member(self):
+        self.assertBudget("movie_list:member", "get", reverse("movie_list"), {"seen": "0"})
+
+    def test_movie_list_filtered(self):
+        self.assertBudget(
+            "movie_list:filtered",
+            "get",
+            reverse("movie_list"),
+            {"categories": [c.pk for c in self.categories], "streaming": self.service.pk, "sort": "top_rated"},
+        )
+
+    def test_movie_list_search(self):
+        self.assertBudget("movie_list:search", "get", reverse("movie_list"), {"q": "snow"})
+
+    def test_movie_list_ajax(self):
+        self.assertBudget(
+            "movie_list:ajax", "get", reverse("movie_list"), {"sort": "recent"}, HTTP_X_REQUESTED_WITH="XMLHttpRequest"
+        )
+
+    def test_movie_grid(self):
+        self.assertBudget("movie_grid", "get", reverse("movie_grid"), {"sort": "most_watched"})
+
+    def test_movie_ids(self):
+        self.assertBudget("movie_ids", "get", reverse("movie_ids"), {"sort": "year_desc"})
+
+    def test_movie_cards(self):
+        ids = list(Movie.objects.order_by("pk").values_list("pk", flat=True)[:24])
+        self.assertBudget("movie_cards", "get", reverse("movie_cards"), {"ids": ",".join(map(str, ids))})
+
+    def test_export_movies(self):
+        self.assertBudget(
+            "export_movies", "get", reverse("export_movies", args=["csv"]), {"categories": self.categories[0].pk}
+        )
+
+    def test_export_viewings(self):
+        self.assertBudget("export_viewings", "get", reverse("export_viewings", args=["jsonl"]))
+
+    def test_toggle_seen(self):
+        url = reverse("toggle_seen", args=[self.unseen.pk])
+        self.assertBudget("toggle_seen:seen", "post", url, HTTP_X_REQUESTED_WITH="XMLHttpRequest")
+        self.assertBudget("toggle_seen:unseen", "post", url, HTTP_X_REQUESTED_WITH="XMLHttpRequest")
+
+    def test_toggle_seen_batch(self):
+        url = reverse("toggle_seen_batch")
+        ids = f"{self.unseen.pk},{self.movie.pk}"
+        self.assertBudget("toggle_seen_batch:seen", "post", url, {"ids": ids, "seen": "1"})
+        self.assertBudget("toggle_seen_batch:unseen", "post", url, {"ids": ids, "seen": "0"})
+
+    # --- Suggestions and stats ---
+
+    def test_movie_suggest(self):
+        self.assertBudget("movie_suggest", "get", reverse("movie_suggest"))
+
+    def test_movie_suggest_post(self):
+        self.assertBudget(
+            "movie_suggest:post",
+            "post",
+            reverse("movie_suggest"),
+            # The member has only seen the budget movie, so the pick is fixed
+            {"seen_filter": "seen", "mode": "rated", "count": 2, "categories": [self.categories[0].pk]},
+        )
+
+    def test_movie_recommendations(self):
+        self.assertBudget("movie_recommendations", "get", reverse("movie_recommendations"))
+
+    def test_club_stats(self):
+        self.assertBudget("club_stats", "get", reverse("club_stats"))
+
+    def test_club_stats_member(self):
+        self.assertBudget("club_stats:member", "get", reverse("club_stats"), {"member": self.member.username})
+
+    def test_club_stats_data(self):
+        self.assertBudget("club_stats_data", "get", reverse("club_stats_data"))
+
+    # --- Movie pages ---
+
+    def test_add_movie(self):
+        self.assertBudget("add_movie", "get", reverse("add_movie"))
+
+    def test_add_movie_post(self):
+        response = self.assertBudget("add_movie:post", "post", reverse("add_movie"), {
+            "title": "Added Movie",
+            "year": 1999,
+            "starring": "Ada Abbott, Dana Diaz",
+            "director": "Carl Carter",
+            "categories": [c.pk for c in self.categories],
+            "streaming_services": [self.service.pk],
+        })
+        self.assertEqual(response.status_code, 302)
+
+    def test_movie_detail(self):
+        self.assertBudget("movie_detail", "get", reverse("movie_detail", args=[self.movie.pk]))
+
+    def test_movie_detail_similar(self):
+        similarity.rebuild_similar_movies()
+        self.assertTrue(SimilarMovie.objects.filter(movie=self.movie).exists())
+        response = self.assertBudget("movie_detail:similar", "get", reverse("movie_detail", args=[self.movie.pk]))
+        self.assertContains(response, "Similar Movies")
+
+    def test_movie_detail_anonymous(self):
+        self.client.logout()
+        self.assertBudget("movie_detail:anonymous", "get", reverse("movie_detail", args=[self.movie.pk]))
+
+    def test_movie_detail_not_modified(self):
+        url = reverse("movie_detail", args=[self.movie.pk])
+        etag = self.client.get(url)["ETag"]
+        response = self.assertBudget("movie_detail:not_modified", "get", url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_movie_detail_post(self):
+        response = self.assertBudget(
+            "movie_detail:post",
+            "post",
+            reverse("movie_detail", args=[self.movie.pk]),
+            {"rating": "4.5", "watched_on": "1990-12-24", "comment": "Again"},
+        )
+        self.assertEqual(response.status_code, 302)
+
+    def test_movie_edit(self):
+        self.assertBudget("movie_edit", "get", reverse("movie_edit", args=[self.movie.pk]))
+
+    def test_movie_edit_post(self):
+        response = self.assertBudget("movie_edit:post", "post", reverse("movie_edit", args=[self.movie.pk]), {
+            "title": "Budget Movie",
+            "year": 2002,
+            "starring": "Ada Abbott",
+            "director": "Carl Carter",
+            "categories": [self.categories[0].pk],
+            "streaming_services": [self.service.pk],
+        })
+        self.assertEqual(response.status_code, 302)
+
+    def test_movie_delete(self):
+        self.assertBudget("movie_delete", "get", reverse("movie_delete", args=[self.movie.pk]))
+
+    def test_movie_delete_post(self):
+        response = self.assertBudget("movie_delete:post", "post", reverse("movie_delete", args=[self.movie.pk]))
+        self.assertEqual(response.status_code, 302)
+
+
+class SmallCatalogueQueryBudgetTests(QueryBudgetMixin, TestCase):
+    catalogue = {"movies": 12, "users": 3, "viewings": 20, "categories": 4, "services": 3}
+
+
+class LargerCatalogueQueryBudgetTests(QueryBudgetMixin, TestCase):
+    catalogue = {"movies": 150, "users": 12, "viewings": 600, "categories": 8, "services": 5}
+
+
+@override_settings(
+    DATABASE_ROUTERS=["tracker.replicas.ReplicaRouter"],
+    TRACKER_READ_REPLICAS=["test_replica"],
+    MIDDLEWARE=[*settings.MIDDLEWARE, "tracker.replicas.ReplicaMiddleware"],
+)
+class ReplicaRoutingTests(TransactionTestCase):
+    """
+    Reads, writes and the sticky window against a SQLite replica. A
+    TransactionTestCase, as the replica is copied from committed data; the
+    writes here use bulk_create and the like so no background work starts.
+    """
+
+    # Resolved in setUpClass, once the replica alias exists
+    databases = "__all__"
+
+    @classmethod
+    def setUpClass(cls):
+        # A replica file of our own (not the profile's mirror), filled in by
+        # refresh_replica()
+        cls.replica_dir = tempfile.TemporaryDirectory()
+        connections.settings["test_replica"] = {
+            **connections.settings[DEFAULT_DB_ALIAS],
+            "NAME": str(Path(cls.replica_dir.name) / "replica.sqlite3"),
+        }
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        connections["test_replica"].close()
+        del connections["test_replica"]
+        del connections.settings["test_replica"]
+        cls.replica_dir.cleanup()
+        super().tearDownClass()
+
+    def setUp(self):
+        for alias in settings.CACHES:
+            caches[alias].clear()
+        facet_index.index.invalidate()
+        self.member = User.objects.create_user("member", password="x")
+        self.movie = Movie.objects.bulk_create([Movie(title="Replicated", year=2001)])[0]
+        refresh_replica("test_replica")
+
+    def test_pages_read_from_the_replica(self):
+        late = Movie.objects.bulk_create([Movie(title="Not Replicated Yet", year=2002)])[0]
+        self.assertEqual(self.client.get(reverse("movie_detail", args=[late.pk])).status_code, 404)
+        self.assertNotContains(self.client.get(reverse("movie_list")), "Not Replicated Yet")
+
+        refresh_replica("test_replica")
+        self.assertContains(self.client.get(reverse("movie_detail", args=[late.pk])), "Not Replicated Yet")
+        self.assertContains(self.client.get(reverse("movie_list")), "Not Replicated Yet")
+
+    def test_writes_keep_the_client_on_the_primary(self):
+        response = self.client.post(reverse("login"), {"username": "member", "password": "x"})
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(STICKY_COOKIE, response.cookies)
+
+        Viewing.objects.bulk_create([Viewing(user=self.member, movie=self.movie, rating=5)])
+        response = self.client.get(reverse("movie_detail", args=[self.movie.pk]))
+        self.assertIsNotNone(response.context["current_user_viewing"])
+
+        del self.client.cookies[STICKY_COOKIE]
+        response = self.client.get(reverse("movie_detail", args=[self.movie.pk]))
+        self.assertIsNone(response.context["current_user_viewing"])
+
+    def test_search_reads_from_the_replica(self):
+        search.index_movies([self.movie.pk])
+        refresh_replica("test_replica")
+        # Dropped from the primary's index only
+        with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+            cursor.execute(f"DELETE FROM {search.SEARCH_TABLE} WHERE rowid = %s", [self.movie.pk])
+        self.assertEqual(search.matching_ids("replicated"), [])
+        response = self.client.get(reverse("movie_list"), {"q": "replicated"})
+        self.assertEqual([m.pk for m in response.context["movies"]], [self.movie.pk])
+        self.assertContains(response, "<mark>Replicated</mark>")
+
+    def test_saves_go_to_the_primary(self):
+        Category.objects.bulk_create([Category(name="Drama")])
+        refresh_replica("test_replica")
+        category = Category.objects.using("test_replica").get(name="Drama")
+        category.name = "Melodrama"
+        category.save()
+        self.assertTrue(Category.objects.filter(name="Melodrama").exists())
+        self.assertFalse(Category.objects.using("test_replica").filter(name="Melodrama").exists())
+
+
+class PaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # Few distinct years, some missing, so pages split runs of ties and NULLs
+        Movie.objects.bulk_create([
+            Movie(title=f"Movie {i % 4}", year=None if i % 3 == 0 else 2000 + i % 2)
+            for i in range(23)
+        ])
+
+    def walk(self, ordering, page_size=5):
+        seen, cursor = [], None
+        while True:
+            page, cursor = keyset_page(Movie.objects.all(), ordering, cursor, page_size)
+            self.assertLessEqual(len(page), page_size)
+            seen.extend(page)
+            if cursor is None:
+                return seen
+
+    def test_keyset_pages_cover_every_row_once(self):
+        for ordering in ["year", "-year", "title", "-title", "-created_at", "rating_score", "-rating_score"]:
+            with self.subTest(ordering=ordering):
+                movies = self.walk(ordering)
+                self.assertEqual(len(movies), 23)
+                self.assertEqual(len({m.pk for m in movies}), 23)
+
+    def test_keyset_order_puts_nulls_first_ascending_last_descending(self):
+        years = [m.year for m in self.walk("year")]
+        self.assertEqual(years, sorted(years, key=lambda y: (y is not None, y)))
+        years = [m.year for m in self.walk("-year")]
+        self.assertEqual(years, sorted(years, key=lambda y: (y is None, -(y or 0))))
+        # Ties are broken by pk in the sort's direction
+        movies = self.walk("-year")
+        for a, b in zip(movies, movies[1:]):
+            if a.year == b.year:
+                self.assertGreater(a.pk, b.pk)
+
+    def test_bad_cursor_is_a_bad_request(self):
+        for cursor in ["nonsense", "W10", "WyJ4IiwxXQ"]:  # not JSON, [], ["x", 1]
+            with self.subTest(cursor=cursor), self.assertRaises(BadRequest):
+                keyset_page(Movie.objects.all(), "year", cursor)
+
+    def test_ranked_pages(self):
+        ids = list(Movie.objects.order_by("?").values_list("pk", flat=True))
+        Movie.objects.filter(pk=ids[7]).delete()
+        seen, cursor = [], None
+        while True:
+            page, cursor = ranked_page(Movie.objects.all(), ids, cursor, page_size=5)
+            seen.extend(m.pk for m in page)
+            if cursor is None:
+                break
+        self.assertEqual(seen, ids[:7] + ids[8:])
+
+    def test_bad_ranked_cursor_is_a_bad_request(self):
+        ids = list(Movie.objects.values_list("pk", flat=True))
+        # Not JSON, {"pos": -5}, {"pos": "x"}, {"at": 5}
+        for cursor in ["nonsense", "eyJwb3MiOi01fQ", "eyJwb3MiOiJ4In0", "eyJhdCI6NX0"]:
+            with self.subTest(cursor=cursor), self.assertRaises(BadRequest):
+                ranked_page(Movie.objects.all(), ids, cursor)
+
+
+class PeopleTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.elf = Movie.objects.create(
+            title="Elf", director="Jon Favreau", starring="Will Ferrell, James Caan, Will Ferrell", writer="David Berenbaum"
+        )
+        cls.chef = Movie.objects.create(title="Chef", director="Jon Favreau", starring="Jon Favreau")
+        cls.other = Movie.objects.create(title="Favreau's Cousin", director="Jon Favreau Jr")
+
+    def credits(self, movie):
+        return list(movie.credits.values_list("role", "person__name", "order"))
+
+    def test_credits_follow_the_strings(self):
+        self.assertEqual(self.credits(self.elf), [
+            ("director", "Jon Favreau", 0),
+            ("starring", "Will Ferrell", 0),
+            ("starring", "James Caan", 1),
+            ("writer", "David Berenbaum", 0),
+        ])
+        self.assertEqual(Person.objects.filter(name="Jon Favreau").count(), 1)
+        self.elf.starring = "James Caan"
+        self.elf.save()
+        self.assertEqual(
+            [name for role, name, _ in self.credits(self.elf) if role == "starring"], ["James Caan"]
+        )
+
+    def test_unrelated_saves_leave_credits_alone(self):
+        movie = Movie.objects.get(pk=self.elf.pk)
+        movie.title = "Elf (2003)"
+        with mock.patch.object(Movie, "sync_credits") as sync:
+            movie.save()
+        sync.assert_not_called()
+
+    def test_filter_is_exact_person_and_role(self):
+        def grid(**params):
+            return {movie_id for movie_id, _ in self.client.get(reverse("movie_ids"), params).json()["movies"]}
+
+        self.assertEqual(grid(director="Jon Favreau"), {self.elf.pk, self.chef.pk})
+        self.assertEqual(grid(starring="Jon Favreau"), {self.chef.pk})
+        self.assertEqual(grid(director="Jon Favreau", starring="James Caan"), {self.elf.pk})
+        self.assertEqual(grid(director="Favreau"), set())
+
+    def test_form_reuses_existing_spelling(self):
+        form = MovieForm(data={"title": "Zathura", "director": " jon favreau ,, JON FAVREAU", "starring": "new person, New Person"})
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertEqual(form.cleaned_data["director"], "Jon Favreau")
+        self.assertEqual(form.cleaned_data["starring"], "new person")
+
+
+class FacetOptionsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.ann = User.objects.create_user("ann", first_name="Ann")
+        cls.drama = Category.objects.create(name="Drama")
+        cls.movie = Movie.objects.create(title="Heat", director="Michael Mann", recommended_by=cls.ann)
+
+    def setUp(self):
+        facets._cache().clear()
+
+    def options(self):
+        options = facets.get_facet_options()
+        return {
+            "categories": [c.name for c in options["categories"]],
+            "recommenders": [u.first_name for u in options["recommenders"]],
+            "directors": options["directors"],
+        }
+
+    def commit(self, change):
+        # Just the invalidation; the other callbacks start background threads
+        with self.captureOnCommitCallbacks() as callbacks:
+            change()
+        for callback in callbacks:
+            if callback is facets.invalidate_facet_options:
+                callback()
+
+    def assertRefreshed(self, change, **expected):
+        self.options()
+        self.commit(change)
+        options = self.options()
+        for name, value in expected.items():
+            self.assertEqual(options[name], value, name)
+
+    def test_cached_until_something_changes(self):
+        self.options()
+        with self.assertNumQueries(0):
+            self.options()
+        version = facets.facet_options_version()
+        self.ann.save(update_fields=["last_login"])
+        User.objects.create_user("bob")
+        self.assertEqual(facets.facet_options_version(), version)
+
+    def test_movie_changes(self):
+        self.assertRefreshed(
+            lambda: Movie.objects.create(title="Ronin", director="John Frankenheimer"),
+            directors=["John Frankenheimer", "Michael Mann"],
+        )
+        self.assertRefreshed(lambda: self.movie.delete(), directors=["John Frankenheimer"], recommenders=[])
+
+    def test_category_changes(self):
+        self.drama.name = "Crime"
+        self.assertRefreshed(self.drama.save, categories=["Crime"])
+        self.assertRefreshed(self.drama.delete, categories=[])
+
+    def test_person_and_user_renames(self):
+        person = Person.objects.get(name="Michael Mann")
+        person.name = "Michael K. Mann"
+        self.assertRefreshed(person.save, directors=["Michael K. Mann"])
+        self.ann.first_name = "Annie"
+        self.assertRefreshed(self.ann.save, recommenders=["Annie"])
+
+    def test_evicted_version_never_reuses_old_options(self):
+        self.options()
+        facets._cache().delete(facets.VERSION_KEY)
+        self.commit(lambda: Category.objects.create(name="Comedy"))
+        self.assertEqual(self.options()["categories"], ["Comedy", "Drama"])
+
+
+class GridApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.movies = Movie.objects.bulk_create([Movie(title=f"Movie {i:02}", year=2000 + i % 3) for i in range(30)])
+
+    def get_ids(self, url=None, **headers):
+        return self.client.get(url or reverse("movie_ids"), {} if url else {"sort": "year_asc"}, **headers)
+
+    def test_pages_follow_next_url(self):
+        seen, url = [], None
+        while True:
+            body = self.get_ids(url).json()
+            seen.extend(movie_id for movie_id, _ in body["movies"])
+            if not (url := body["next_url"]):
+                break
+        self.assertEqual(sorted(seen), sorted(m.pk for m in self.movies))
+
+    def test_unchanged_result_is_not_modified(self):
+        response = self.get_ids()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get_ids(HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 304)
+        self.assertIn("no-cache", response["Cache-Control"])
+
+    def test_edit_changes_the_etag_and_the_token(self):
+        response = self.get_ids()
+        before = dict(response.json()["movies"])
+        movie = Movie.objects.get(pk=next(iter(before)))
+        movie.title = "Movie 00 (director's cut)"
+        movie.save()
+        changed = self.get_ids(HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(changed.status_code, 200)
+        after = dict(changed.json()["movies"])
+        self.assertEqual({pk for pk in before if before[pk] != after[pk]}, {movie.pk})
+
+    def test_cards(self):
+        ids = [self.movies[1].pk, self.movies[0].pk, self.movies[1].pk, 0, "x"]
+        response = self.client.get(reverse("movie_cards"), {"ids": ",".join(map(str, ids))})
+        cards = response.json()["cards"]
+        self.assertEqual([card["id"] for card in cards], [self.movies[1].pk, self.movies[0].pk])
+        self.assertIn("Movie 01", cards[0]["html"])
+        self.assertEqual(cards[0]["version"], str(Movie.objects.get(pk=self.movies[1].pk).card_version))
+
+    def test_cards_are_limited_per_request(self):
+        ids = ",".join(str(i) for i in range(1, views.MAX_CARDS_PER_REQUEST + 2))
+        self.assertEqual(self.client.get(reverse("movie_cards"), {"ids": ids}).status_code, 400)
+
+
+@override_settings(TRACKER_RATING_PRIOR=3.0, TRACKER_RATING_PRIOR_WEIGHT=2)
+class RatingAggregateTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [User.objects.create_user(name) for name in ("ann", "bob", "cat")]
+        cls.heat = Movie.objects.create(title="Heat")
+        cls.ronin = Movie.objects.create(title="Ronin")
+
+    def aggregates(self, movie):
+        return Movie.objects.filter(pk=movie.pk).values_list(*ratings.AGGREGATE_FIELDS).get()
+
+    def test_unrated(self):
+        self.assertEqual(self.aggregates(self.heat), (0, 0, None, 0.0))
+        Viewing.objects.create(user=self.users[0], movie=self.heat)
+        self.assertEqual(self.aggregates(self.heat), (1, 0, None, 0.0))
+
+    def test_edits_and_deletes(self):
+        ann = Viewing.objects.create(user=self.users[0], movie=self.heat, rating=5)
+        Viewing.objects.create(user=self.users[1], movie=self.heat, rating=3)
+        Viewing.objects.create(user=self.users[2], movie=self.heat)
+        # (3.0 * 2 + 5 + 3) / (2 + 2)
+        self.assertEqual(self.aggregates(self.heat), (3, 2, 4.0, 3.5))
+        ann.rating = 4
+        ann.save()
+        self.assertEqual(self.aggregates(self.heat), (3, 2, 3.5, 3.25))
+        ann.rating = None
+        ann.save()
+        self.assertEqual(self.aggregates(self.heat), (3, 1, 3.0, 3.0))
+        ann.delete()
+        self.assertEqual(self.aggregates(self.heat), (2, 1, 3.0, 3.0))
+        Viewing.objects.filter(movie=self.heat).delete()
+        self.assertEqual(self.aggregates(self.heat), (0, 0, None, 0.0))
+
+    def test_moving_a_viewing_updates_both_movies(self):
+        Viewing.objects.create(user=self.users[0], movie=self.heat, rating=5)
+        viewing = Viewing.objects.get(user=self.users[0])
+        viewing.movie = self.ronin
+        viewing.save()
+        self.assertEqual(self.aggregates(self.heat), (0, 0, None, 0.0))
+        self.assertEqual(self.aggregates(self.ronin), (1, 1, 5.0, 11 / 3))
+        self.assertEqual(search.matching_ids("ronin"), [self.ronin.pk])
+        matches, _ = facet_index.index.search(seen_user_id=self.users[0].pk, seen="1")
+        self.assertEqual(facet_index.bitmap_ids(matches), [self.ronin.pk])
+
+    def test_bayesian_score_orders_the_grid(self):
+        # One 5 against three 4.5s: the three win
+        Viewing.objects.create(user=self.users[0], movie=self.heat, rating=5)
+        for user in self.users:
+            Viewing.objects.create(user=user, movie=self.ronin, rating=4.5)
+        response = self.client.get(reverse("movie_ids"), {"sort": "top_rated"})
+        self.assertEqual([movie_id for movie_id, _ in response.json()["movies"]], [self.ronin.pk, self.heat.pk])
+
+    def test_repair_matches_the_receivers(self):
+        Viewing.objects.create(user=self.users[0], movie=self.heat, rating=2)
+        Viewing.objects.create(user=self.users[1], movie=self.ronin, rating=4)
+        expected = [self.aggregates(self.heat), self.aggregates(self.ronin)]
+        Movie.objects.update(viewing_count=9, rating_count=9, rating_mean=1.0, rating_score=1.0)
+        call_command("repair_rating_aggregates", stdout=StringIO())
+        self.assertEqual([self.aggregates(self.heat), self.aggregates(self.ronin)], expected)
+
+
+class AdminChangelistTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin_user = User.objects.create_superuser("admin", password="pw")
+        cls.drama = Category.objects.create(name="Drama")
+        cls.crime = Category.objects.create(name="Crime")
+        cls.netflix = StreamingService.objects.create(name="Netflix")
+        cls.movies = [Movie.objects.create(title=f"Movie {i}") for i in range(5)]
+        for movie in cls.movies[:3]:
+            movie.categories.add(cls.drama)
+        cls.movies[0].streaming_services.add(cls.netflix)
+
+    def setUp(self):
+        self.client.force_login(self.admin_user)
+
+    def paginator(self, queryset):
+        return tracker_admin.EstimatedCountPaginator(queryset, 100)
+
+    def test_small_and_filtered_lists_count_exactly(self):
+        Movie.objects.filter(pk=self.movies[-1].pk).delete()
+        self.assertEqual(self.paginator(Movie.objects.all()).count, 4)
+        with self.settings(TRACKER_ADMIN_EXACT_COUNT_BELOW=1):
+            self.assertEqual(self.paginator(Movie.objects.filter(categories=self.drama)).count, 3)
+
+    def test_large_unfiltered_lists_are_estimated(self):
+        Movie.objects.filter(pk=self.movies[0].pk).delete()
+        with self.settings(TRACKER_ADMIN_EXACT_COUNT_BELOW=1), self.assertNumQueries(1):
+            # The highest id, so the deleted row is still counted
+            self.assertEqual(self.paginator(Movie.objects.all()).count, self.movies[-1].pk)
+
+    def edit_links(self, query="", selected=(), select_across=False, **changes):
+        data = {
+            "action": "edit_links",
+            "apply": "Apply",
+            "select_across": "1" if select_across else "0",
+            "_selected_action": [m.pk for m in selected] or [self.movies[0].pk],
+            **{name: [obj.pk for obj in objects] for name, objects in changes.items()},
+        }
+        return self.client.post(f"{reverse('admin:tracker_movie_changelist')}{query}", data)
+
+    def categories(self):
+        return {m.title: sorted(c.name for c in m.categories.all()) for m in Movie.objects.prefetch_related("categories")}
+
+    def test_changelists_render(self):
+        Viewing.objects.create(user=self.admin_user, movie=self.movies[1], comment="Tense")
+        for url, params in [
+            (reverse("admin:tracker_movie_changelist"), {"q": "movie"}),
+            (reverse("admin:tracker_movie_changelist"), {"recommended_by__id__exact": self.admin_user.pk}),
+            (reverse("admin:tracker_viewing_changelist"), {"movie__id__exact": self.movies[1].pk}),
+        ]:
+            with self.subTest(url=url, params=params):
+                self.assertEqual(self.client.get(url, params).status_code, 200)
+
+    def test_intermediate_page(self):
+        response = self.client.post(reverse("admin:tracker_movie_changelist"), {
+            "action": "edit_links", "_selected_action": [self.movies[1].pk, self.movies[2].pk],
+        })
+        self.assertContains(response, "These changes apply to 2 movies")
+        self.assertContains(response, 'name="apply"')
+
+    def test_selected_movies(self):
+        self.edit_links(selected=self.movies[3:], add_categories=[self.crime], add_streaming_services=[self.netflix])
+        self.assertEqual(self.categories()["Movie 3"], ["Crime"])
+        self.assertEqual(self.categories()["Movie 2"], ["Drama"])
+        self.assertEqual(set(self.netflix.movies.all()), {self.movies[0], *self.movies[3:]})
+
+    def test_select_across_a_filtered_changelist(self):
+        response = self.edit_links(
+            query=f"?categories__id__exact={self.drama.pk}",
+            select_across=True,
+            add_categories=[self.crime],
+            remove_categories=[self.drama],
+            remove_streaming_services=[self.netflix],
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.categories(), {
+            **{f"Movie {i}": ["Crime"] for i in range(3)},
+            "Movie 3": [],
+            "Movie 4": [],
+        })
+        self.assertFalse(self.netflix.movies.exists())
+
+
+@override_settings(INSTRUMENTATION_ENABLED=True, INSTRUMENTATION_SLOW_REQUEST_MS=60_000)
+class InstrumentationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user("staff", is_staff=True)
+        Movie.objects.create(title="Heat")
+
+    def setUp(self):
+        instrumentation.reset()
+
+    def test_server_timing(self):
+        with CaptureQueriesContext(connections[DEFAULT_DB_ALIAS]) as queries:
+            response = self.client.get(reverse("movie_list"))
+        header = response["Server-Timing"]
+        self.assertEqual(re.findall(r"(\w+);dur=[\d.]+", header), ["sql", "tpl", "app", "total"])
+        self.assertIn(f'desc="{len(queries)} queries, 0 duplicates"', header)
+
+    def test_duplicates_are_counted_by_fingerprint(self):
+        stats = instrumentation.RequestStats()
+        execute = mock.Mock()
+        ids = json.dumps(list(range(100_000)))
+        for params in [(ids,), (ids,), ("[1]",), [ids]]:
+            stats(execute, "SELECT 1 WHERE id IN (SELECT value FROM json_each(%s))", params, False, {})
+        self.assertEqual((stats.queries, stats.duplicates), (4, 2))
+        self.assertTrue(all(isinstance(key, int) for key in stats._seen))
+        stats(execute, "SELECT %(a)s", {"a": 1}, False, {})
+        stats(execute, "SELECT %(a)s", {"a": 1}, False, {})
+        self.assertEqual(stats.duplicates, 3)
+
+    def test_slow_requests_are_logged(self):
+        with self.settings(INSTRUMENTATION_SLOW_REQUEST_MS=0):
+            self.client = self.client_class()
+            with self.assertLogs("movie_club.instrumentation", "WARNING") as logs:
+                self.client.get(reverse("movie_list"))
+        self.assertIn("Slow request GET /movies/ (movie_list)", logs.output[0])
+        self.assertIn(" ms over 1x: SELECT", logs.output[0])
+
+    def test_histograms(self):
+        self.client.get(reverse("movie_list"))
+        self.client.get(reverse("movie_list"))
+        self.assertEqual(self.client.get(reverse("instrumentation_data")).status_code, 302)
+        self.client.force_login(self.staff)
+        views = self.client.get(reverse("instrumentation_data")).json()["views"]
+        self.assertEqual(views["movie_list"]["requests"], 2)
+        self.assertEqual(sum(views["movie_list"]["total_ms"]["buckets"].values()), 2)
+        self.client.post(reverse("instrumentation_data"), {"reset": "1"})
+        self.assertNotIn("movie_list", instrumentation.snapshot())
+
+    @override_settings(INSTRUMENTATION_ENABLED=False)
+    def test_disabled(self):
+        self.client = self.client_class()
+        self.assertNotIn("Server-Timing", self.client.get(reverse("movie_list")))
+
+
+@override_settings(TRACKER_RATING_PRIOR=3.0, TRACKER_RATING_PRIOR_WEIGHT=2)
+class SuggestTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [User.objects.create_user(name) for name in ("ann", "bob")]
+        cls.unrated = Movie.objects.create(title="Unrated")
+        cls.liked = Movie.objects.create(title="Liked")
+        cls.loved = Movie.objects.create(title="Loved")
+        for user in cls.users:
+            Viewing.objects.create(user=user, movie=cls.liked, rating=4)
+            Viewing.objects.create(user=user, movie=cls.loved, rating=5)
+
+    def test_rated_weight_uses_the_stored_score(self):
+        weights = dict(
+            Movie.objects.annotate(weight=suggest.suggestion_weight("rated")).values_list("title", "weight")
+        )
+        # Scores 0, (6 + 8) / 4 = 3.5 and (6 + 10) / 4 = 4.0
+        self.assertEqual(weights, {"Unrated": 1, "Liked": 8, "Loved": 9})
+
+    def test_weighted_picks_are_distinct(self):
+        weight = suggest.suggestion_weight("rated")
+        for _ in range(5):
+            picks = suggest.pick_movies(Movie.objects.all(), count=5, weight=weight)
+            self.assertEqual(sorted(m.title for m in picks), ["Liked", "Loved", "Unrated"])
+
+    def test_weighted_pick_follows_the_running_total(self):
+        weight = suggest.suggestion_weight("rated")
+        # Running totals in pk order: 1, 9, 18
+        for target, title in [(0, "Unrated"), (1, "Liked"), (8, "Liked"), (9, "Loved"), (17, "Loved")]:
+            with self.subTest(target=target), mock.patch("random.randrange", return_value=target):
+                self.assertEqual(suggest.pick_movies(Movie.objects.all(), weight=weight)[0].title, title)
+
+
+class MovieWriteAtomicityTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("ann")
+        cls.movie = Movie.objects.create(title="Heat")
+        Viewing.objects.create(user=cls.user, movie=cls.movie, rating=4)
+
+    def test_failed_receiver_rolls_back_the_save(self):
+        changes = FacetChange.objects.count()
+        movie = Movie.objects.get(pk=self.movie.pk)
+        movie.title = "Ronin"
+        with mock.patch("tracker.search.index_movie", side_effect=RuntimeError), self.assertRaises(RuntimeError):
+            movie.save()
+        self.assertEqual(Movie.objects.get(pk=self.movie.pk).title, "Heat")
+        self.assertEqual(FacetChange.objects.count(), changes)
+
+    def test_failed_receiver_rolls_back_the_delete(self):
+        rollups = list(StatRollup.objects.order_by("pk").values_list("pk", "count"))
+        movie = Movie.objects.get(pk=self.movie.pk)
+        with mock.patch("tracker.search.index_movie", side_effect=RuntimeError), self.assertRaises(RuntimeError):
+            movie.delete()
+        self.assertTrue(Movie.objects.filter(pk=self.movie.pk).exists())
+        self.assertTrue(Viewing.objects.filter(movie_id=self.movie.pk).exists())
+        self.assertEqual(list(StatRollup.objects.order_by("pk").values_list("pk", "count")), rollups)
+
+
+@override_settings(TRACKER_SIMILAR_MOVIES=2)
+class SimilarMoviesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        crime, space, comedy = (Category.objects.create(name=name) for name in ("Crime", "Space", "Comedy"))
+        cls.movies = {}
+        for title, description, category, people in [
+            ("Heat", "A professional thief plans one last heist while detectives close in.", crime,
+             {"director": "Michael Mann", "starring": "Al Pacino, Robert De Niro"}),
+            ("Thief", "A safecracker plans one last heist before leaving the business.", crime,
+             {"director": "Michael Mann", "starring": "James Caan"}),
+            ("Ronin", "Mercenaries plan a heist of a mysterious briefcase across France.", crime,
+             {"director": "John Frankenheimer", "starring": "Robert De Niro"}),
+            ("Alien", "The crew of a space freighter is stalked by a creature.", space,
+             {"director": "Ridley Scott", "starring": "Sigourney Weaver"}),
+            ("Aliens", "Marines return to the creature's planet in deep space.", space,
+             {"director": "James Cameron", "starring": "Sigourney Weaver"}),
+            ("Airplane", "A former pilot must land a plane after the crew gets food poisoning.", comedy,
+             {"director": "Jim Abrahams"}),
+            ("Top Secret", "A rock star is caught up in a plot by spies in East Germany.", comedy,
+             {"director": "Jim Abrahams", "starring": "Val Kilmer"}),
+        ]:
+            movie = Movie.objects.create(title=title, description=description, **people)
+            movie.categories.add(category)
+            cls.movies[title] = movie
+
+    def setUp(self):
+        similarity.rebuild_similar_movies()
+
+    def neighbours(self):
+        rows = SimilarMovie.objects.order_by("movie_id", "rank").values_list("movie_id", "similar_id", "score")
+        lists = {}
+        for movie_id, similar_id, score in rows:
+            lists.setdefault(movie_id, []).append((similar_id, score))
+        return lists
+
+    def brute_force(self, k=2):
+        """Every pair's cosine over the full TF-IDF vectors, ranked the same way."""
+        terms = dict(similarity.movie_terms())
+        df = {}
+        for counts in terms.values():
+            for term in counts:
+                df[term] = df.get(term, 0) + 1
+        vectors = {movie_id: similarity._vector(counts, df, len(terms)) for movie_id, counts in terms.items()}
+        expected = {}
+        for movie_id, vector in vectors.items():
+            scores = [
+                (other, sum(weight * vectors[other].get(term, 0) for term, weight in vector.items()))
+                for other in vectors
+                if other != movie_id
+            ]
+            best = sorted((pair for pair in scores if pair[1] > 0), key=lambda pair: (-pair[1], pair[0]))[:k]
+            if best:
+                expected[movie_id] = best
+        return expected
+
+    def assertNeighbours(self, actual, expected):
+        self.assertEqual(actual.keys(), expected.keys())
+        for movie_id, best in expected.items():
+            self.assertEqual([other for other, _ in actual[movie_id]], [other for other, _ in best], movie_id)
+            for (_, score), (_, expected_score) in zip(actual[movie_id], best):
+                self.assertAlmostEqual(score, expected_score, places=5)
+
+    def run_refresh(self, change):
+        # Just the similarity callbacks, run in this thread
+        with self.captureOnCommitCallbacks() as callbacks:
+            change()
+        with mock.patch("tracker.similarity.run_in_background", side_effect=lambda fn: fn()):
+            for callback in callbacks:
+                if callback.__module__ == similarity.__name__:
+                    callback()
+
+    def test_rebuild_matches_brute_force(self):
+        self.assertNeighbours(self.neighbours(), self.brute_force())
+        heat, thief, ronin = (self.movies[title].pk for title in ("Heat", "Thief", "Ronin"))
+        self.assertEqual({other for other, _ in self.neighbours()[heat]}, {thief, ronin})
+
+    def test_edit_rescores_only_that_movie(self):
+        airplane, ronin = self.movies["Airplane"], self.movies["Ronin"]
+        others = list(
+            MovieTerm.objects.exclude(movie=airplane).order_by("movie_id", "term").values_list("movie_id", "term", "weight")
+        )
+        before = self.neighbours()
+        ronin_updated_at = Movie.objects.get(pk=ronin.pk).updated_at
+
+        airplane = Movie.objects.get(pk=airplane.pk)
+        airplane.description = "A space crew meets a creature in deep space, far out in space."
+        with mock.patch("tracker.similarity.movie_terms", wraps=similarity.movie_terms) as terms:
+            self.run_refresh(airplane.save)
+        terms.assert_called_once_with({airplane.pk})
+
+        # The other movies keep their vectors...
+        self.assertEqual(
+            list(
+                MovieTerm.objects.exclude(movie=airplane).order_by("movie_id", "term")
+                .values_list("movie_id", "term", "weight")
+            ),
+            others,
+        )
+        # ...while the movie and the space movies now find each other
+        neighbours = self.neighbours()
+        space = {self.movies["Alien"].pk, self.movies["Aliens"].pk}
+        self.assertTrue(space & {other for other, _ in neighbours[airplane.pk]})
+        self.assertTrue(any(airplane.pk in [other for other, _ in neighbours[pk]] for pk in space))
+        self.assertNotEqual(neighbours[airplane.pk], before[airplane.pk])
+        # A movie it was never alike is left alone
+        self.assertEqual(neighbours[ronin.pk], before[ronin.pk])
+        self.assertEqual(Movie.objects.get(pk=ronin.pk).updated_at, ronin_updated_at)
+
+    def test_delete_removes_the_movie_from_other_lists(self):
+        heat = self.movies["Heat"]
+        listed_by = set(SimilarMovie.objects.filter(similar=heat).values_list("movie_id", flat=True))
+        self.assertTrue(listed_by)
+        self.run_refresh(Movie.objects.get(pk=heat.pk).delete)
+        self.assertFalse(SimilarMovie.objects.filter(similar_id=heat.pk).exists())
+        neighbours = self.neighbours()
+        for movie_id in listed_by:
+            # Rescored in full against the remaining movies
+            self.assertEqual(neighbours.get(movie_id, []), similarity._scores(movie_id, limit=2))
+
+
+class AsyncViewsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.member = User.objects.create_user("member")
+        cls.crime = Category.objects.create(name="Crime")
+        cls.heat = Movie.objects.create(title="Heat", description="A heist in Los Angeles")
+        cls.heat.categories.add(cls.crime)
+        cls.ronin = Movie.objects.create(title="Ronin")
+        Viewing.objects.create(user=cls.member, movie=cls.heat, rating=4)
+
+    def setUp(self):
+        # Route the read views to async_views.py, as TRACKER_ASYNC_VIEWS does
+        # when the URLconf is imported
+        for pattern in tracker_urls.urlpatterns:
+            if pattern.name in ("movie_list", "movie_detail", "movie_suggest"):
+                patcher = mock.patch.object(pattern, "callback", getattr(async_views, pattern.name))
+                patcher.start()
+                self.addCleanup(patcher.stop)
+        for alias in settings.CACHES:
+            caches[alias].clear()
+
+    def template_names(self, response):
+        return [template.name for template in response.templates]
+
+    async def test_full_page(self):
+        await self.async_client.aforce_login(self.member)
+        response = await self.async_client.get(reverse("movie_list"), {"categories": self.crime.pk})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("tracker/movie_list.html", self.template_names(response))
+        self.assertEqual([m.pk for m in response.context["movies"]], [self.heat.pk])
+        self.assertIn(self.crime, response.context["categories"])
+        self.assertEqual(response.context["selected_categories"], [str(self.crime.pk)])
+        self.assertContains(response, "Heat")
+        # The signed-in grid revalidates through movie_ids instead
+        self.assertNotIn("ETag", response)
+
+    async def test_ajax_fragment(self):
+        response = await self.async_client.get(
+            reverse("movie_list"), {"sort": "title"}, headers={"x-requested-with": "XMLHttpRequest"}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("tracker/_movie_grid.html", self.template_names(response))
+        self.assertNotIn("tracker/movie_list.html", self.template_names(response))
+        self.assertEqual([m.pk for m in response.context["movies"]], [self.heat.pk, self.ronin.pk])
+
+    async def test_not_modified(self):
+        for url in (reverse("movie_list"), reverse("movie_detail", args=[self.heat.pk])):
+            etag = (await self.async_client.get(url))["ETag"]
+            response = await self.async_client.get(url, headers={"if-none-match": etag})
+            self.assertEqual(response.status_code, 304, url)
+            self.assertEqual(response.content, b"")
+
+    async def test_detail_and_suggest(self):
+        await self.async_client.aforce_login(self.member)
+        response = await self.async_client.get(reverse("movie_detail", args=[self.heat.pk]))
+        self.assertEqual(response.context["movie"], self.heat)
+        self.assertEqual(response.context["current_user_viewing"].rating, 4)
+        response = await self.async_client.get(reverse("movie_detail", args=[0]))
+        self.assertEqual(response.status_code, 404)
+        response = await self.async_client.get(reverse("movie_suggest"))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("tracker/movie_suggest.html", self.template_names(response))
+
+
+@override_settings(TRACKER_SHARED_CACHE_SECONDS=120)
+class HttpCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.member = User.objects.create_user("member")
+        cls.movie = Movie.objects.create(title="Heat")
+        cls.viewing = Viewing.objects.create(user=cls.member, movie=cls.movie, rating=4)
+
+    def setUp(self):
+        for alias in settings.CACHES:
+            caches[alias].clear()
+        self.detail = reverse("movie_detail", args=[self.movie.pk])
+
+    def cache_control(self, response):
+        return {part.strip() for part in response["Cache-Control"].split(",")}
+
+    def vary(self, response):
+        return {part.strip() for part in response["Vary"].split(",")}
+
+    def test_anonymous_pages_are_shared(self):
+        for url in (self.detail, reverse("movie_list")):
+            response = self.client.get(url)
+            self.assertEqual(self.cache_control(response), {"public", "max-age=0", "s-maxage=120"}, url)
+            self.assertIn("Cookie", self.vary(response))
+            self.assertIn("Last-Modified", response)
+            self.assertIn("ETag", response)
+        self.assertIn("X-Requested-With", self.vary(self.client.get(reverse("movie_list"))))
+
+    def test_member_pages_are_private(self):
+        self.client.force_login(self.member)
+        response = self.client.get(self.detail)
+        self.assertEqual(self.cache_control(response), {"private", "no-cache"})
+        self.assertIn("Cookie", self.vary(response))
+        self.assertNotIn("Last-Modified", response)
+        self.assertIn("ETag", response)
+        # Revalidated with the member's own ETag, never a Last-Modified date
+        response = self.client.get(self.detail, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.cache_control(response), {"private", "no-cache"})
+
+    def test_etag_changes_when_a_viewing_is_edited(self):
+        first = self.client.get(self.detail)
+        self.assertEqual(self.client.get(self.detail, HTTP_IF_NONE_MATCH=first["ETag"]).status_code, 304)
+        viewing = Viewing.objects.get(pk=self.viewing.pk)
+        viewing.comment = "Better the second time"
+        viewing.save()
+        second = self.client.get(self.detail, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(second.status_code, 200)
+        self.assertNotEqual(second["ETag"], first["ETag"])
+        self.assertContains(second, "Better the second time")
+
+
+class ToggleSeenBatchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.member = User.objects.create_user("member")
+        cls.crime = Category.objects.create(name="Crime")
+        cls.heat = Movie.objects.create(title="Heat")
+        cls.ronin = Movie.objects.create(title="Ronin")
+        cls.elf = Movie.objects.create(title="Elf")
+        cls.heat.categories.add(cls.crime)
+        cls.ronin.categories.add(cls.crime)
+        Viewing.objects.create(user=cls.member, movie=cls.elf, rating=4)
+
+    def setUp(self):
+        for alias in settings.CACHES:
+            caches[alias].clear()
+        facet_index.index.invalidate()
+        facet_index.index.rebuild()
+        self.client.force_login(self.member)
+
+    def post(self, ids, seen):
+        return self.client.post(reverse("toggle_seen_batch"), {"ids": ",".join(map(str, ids)), "seen": seen})
+
+    def seen_ids(self):
+        return set(Viewing.objects.filter(user=self.member).values_list("movie_id", flat=True))
+
+    def test_states(self):
+        response = self.post([self.heat.pk, self.ronin.pk, self.elf.pk], "1")
+        self.assertEqual(
+            response.json(),
+            {"movies": {str(self.heat.pk): "seen", str(self.ronin.pk): "seen", str(self.elf.pk): "seen"}},
+        )
+        self.assertEqual(self.seen_ids(), {self.heat.pk, self.ronin.pk, self.elf.pk})
+        # The existing viewing is kept as it was
+        self.assertEqual(Viewing.objects.get(user=self.member, movie=self.elf).rating, 4)
+
+        response = self.post([self.heat.pk, self.elf.pk], "0")
+        self.assertEqual(response.json(), {"movies": {str(self.heat.pk): "unseen", str(self.elf.pk): "unseen"}})
+        self.assertEqual(self.seen_ids(), {self.ronin.pk})
+
+    def test_unknown_ids_are_ignored(self):
+        missing = Movie.objects.order_by("-pk").first().pk + 1
+        response = self.client.post(
+            reverse("toggle_seen_batch"), {"ids": f"{self.heat.pk},{missing},x,", "seen": "1"}
+        )
+        self.assertEqual(response.json(), {"movies": {str(self.heat.pk): "seen"}})
+        self.assertEqual(self.seen_ids(), {self.heat.pk, self.elf.pk})
+
+    def test_too_many_ids(self):
+        response = self.post(range(1, views.MAX_SEEN_BATCH + 2), "1")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.seen_ids(), {self.elf.pk})
+        self.assertEqual(self.post(range(1, views.MAX_SEEN_BATCH + 1), "1").status_code, 200)
+
+    def test_seen_must_be_0_or_1(self):
+        for value in ("", "2", "true", "yes"):
+            self.assertEqual(self.post([self.heat.pk], value).status_code, 400, value)
+        self.assertEqual(self.seen_ids(), {self.elf.pk})
+
+    def test_grid_and_stats_follow_the_batch(self):
+        # Warm the card cache, which the batch has to invalidate without signals
+        cards_url = reverse("movie_cards")
+        ids = f"{self.heat.pk},{self.ronin.pk}"
+        before = {card["id"]: card for card in self.client.get(cards_url, {"ids": ids}).json()["cards"]}
+        self.assertTrue(all("❌" in card["html"] for card in before.values()))
+        rebuild_stats()
+
+        self.post([self.heat.pk, self.ronin.pk], "1")
+        self.post([self.elf.pk], "0")
+
+        after = {card["id"]: card for card in self.client.get(cards_url, {"ids": ids}).json()["cards"]}
+        for movie_id, card in after.items():
+            self.assertNotEqual(card["version"], before[movie_id]["version"])
+            self.assertIn("✅", card["html"])
+        response = self.client.get(reverse("movie_ids"), {"seen": "1", "sort": "title"})
+        self.assertEqual([i for i, _ in response.json()["movies"]], [self.heat.pk, self.ronin.pk])
+
+        member_stats = stats_for(self.member)
+        self.assertEqual((member_stats["viewings"], member_stats["ratings"]), (2, 0))
+        self.assertEqual([(c["name"], c["viewings"]) for c in member_stats["categories"]], [("Crime", 2)])
+        self.assertEqual(Movie.objects.get(pk=self.elf.pk).viewing_count, 0)
+        self.assertEqual(Movie.objects.get(pk=self.heat.pk).viewing_count, 1)
+        totals = StatRollup.objects.filter(count__gt=0).values_list("metric", "key", "user_id", "count", "rating_count")
+        incremental = set(totals)
+        rebuild_stats()
+        self.assertEqual(set(totals), incremental)
+
+
+class ExplainViewsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        call_command("generate_synthetic_data", seed=1, stdout=StringIO(), movies=12, users=3, viewings=20)
+
+    def test_prints_plans_for_every_view(self):
+        out = StringIO()
+        call_command("explain_views", stdout=out)
+        output = out.getvalue()
+        movie = Movie.objects.order_by("-viewing_count", "pk").first()
+        category = Category.objects.order_by("pk").first()
+        for name, method, url, _, _ in _scenarios(movie, category, User.objects.first()):
+            self.assertIn(f"{name} ({method.upper()} {url})", output)
+        self.assertRegex(output, r"\n {6}(SEARCH|SCAN) ")
+        self.assertRegex(output, r"\d+ queries with a full scan or a temporary sort\.\n$")
+        # Rolled back
+        self.assertEqual(Movie.objects.order_by("-viewing_count", "pk").first(), movie)
+
+    def test_warnings_only(self):
+        everything, warnings = StringIO(), StringIO()
+        call_command("explain_views", stdout=everything)
+        call_command("explain_views", "--warnings", stdout=warnings)
+        *queries, summary = warnings.getvalue().split("\n\n")
+        self.assertTrue(queries)
+        for query in queries:
+            self.assertIn("\n  !   ", query)
+        self.assertLess(len(queries), len(everything.getvalue().split("\n\n")) - 1)
+        self.assertEqual(summary, everything.getvalue().split("\n\n")[-1])
+
+
+class SqlitePragmaTests(TestCase):
+    def test_production_pragmas_apply_to_new_connections(self):
+        directory = self.enterContext(tempfile.TemporaryDirectory())
+        options = settings_production.DATABASES["default"]["OPTIONS"]
+        default = connections[DEFAULT_DB_ALIAS]
+        wrapper = default.__class__(
+            {**default.settings_dict, "NAME": str(Path(directory) / "db.sqlite3"), "OPTIONS": options}, alias="pragmas"
+        )
+        self.addCleanup(wrapper.close)
+        with wrapper.cursor() as cursor:
+            pragmas = {}
+            for name in ("journal_mode", "synchronous", "busy_timeout", "cache_size", "temp_store"):
+                cursor.execute(f"PRAGMA {name}")
+                pragmas[name] = cursor.fetchone()[0]
+        self.assertEqual(pragmas["journal_mode"], "wal")
+        self.assertEqual(pragmas["synchronous"], 1)  # NORMAL
+        self.assertEqual(pragmas["busy_timeout"], settings_production.SQLITE_BUSY_TIMEOUT * 1000)
+        self.assertEqual(pragmas["cache_size"], settings_production.SQLITE_PRAGMAS["cache_size"])
+        self.assertEqual(pragmas["temp_store"], 2)  # MEMORY
+        self.assertEqual(options["transaction_mode"], "IMMEDIATE")
+
+
+class FacetIndexTests(TestCase):
+    """
+    The facet index against the database. A second FacetIndex stands in for
+    another worker process, which only hears about changes through the log.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.member = User.objects.create_user("member")
+        cls.drama, cls.comedy = Category.objects.bulk_create([Category(name="Drama"), Category(name="Comedy")])
+        cls.movies = [
+            Movie.objects.create(title=f"Movie {i}", director="Ann Able" if i % 2 else "Bob Best")
+            for i in range(6)
+        ]
+
+    def setUp(self):
+        self.worker = facet_index.FacetIndex()
+        self.worker.rebuild()
+
+    def search(self, **filters):
+        matches, _ = self.worker.search(**filters)
+        return facet_index.bitmap_ids(matches)
+
+    def test_changes_are_replayed_without_a_rebuild(self):
+        movie = self.movies[0]
+        with mock.patch.object(self.worker, "rebuild", side_effect=AssertionError("rebuilt")):
+            movie.categories.add(self.drama)
+            Viewing.objects.create(user=self.member, movie=movie)
+            self.assertEqual(self.search(category_ids=[self.drama.pk]), [movie.pk])
+            self.assertEqual(self.search(seen_user_id=self.member.pk, seen="1"), [movie.pk])
+
+            Viewing.objects.filter(movie=movie).delete()
+            self.drama.movies.remove(movie)
+            self.assertEqual(self.search(seen_user_id=self.member.pk, seen="1"), [])
+            self.assertEqual(self.search(category_ids=[self.drama.pk]), [])
+        self.assertEqual(self.worker.check_against_orm(), [])
+
+    def test_person_rename(self):
+        ann = Person.objects.get(name="Ann Able")
+        ann.name = "Ann Abel"
+        ann.save()
+        directed = [m.pk for m in self.movies if m.director == "Ann Able"]
+        self.assertEqual(self.search(people={MovieCredit.Role.DIRECTOR: "Ann Abel"}), directed)
+        self.assertEqual(self.search(people={MovieCredit.Role.DIRECTOR: "Ann Able"}), [])
+
+    def test_rebuilds_when_its_last_change_is_gone(self):
+        self.movies[0].categories.add(self.drama)
+        self.search()
+        FacetChange.objects.all().delete()
+        self.movies[1].categories.add(self.comedy)
+        with mock.patch.object(self.worker, "rebuild", wraps=self.worker.rebuild) as rebuild:
+            self.assertEqual(self.search(category_ids=[self.comedy.pk]), [self.movies[1].pk])
+        rebuild.assert_called_once()
+
+    def test_invalidate_reaches_other_processes(self):
+        Movie.objects.bulk_create([Movie(title="Imported")])
+        facet_index.FacetIndex().invalidate()
+        self.assertEqual(len(self.search()), len(self.movies) + 1)
+
+    def test_bitmap_ids(self):
+        for ids in ([], [0], [3, 64, 65], list(range(0, 5000, 7)), list(range(200))):
+            self.assertEqual(facet_index.bitmap_ids(facet_index.ids_bitmap(ids)), ids)
+
+    @mock.patch.object(facet_index, "MAX_ID_LIST", 1)
+    def test_large_results_are_filtered_in_sql(self):
+        for movie in self.movies[:3]:
+            movie.categories.add(self.drama)
+        matches, _ = self.worker.search(category_ids=[self.drama.pk])
+        in_sql = mock.Mock(side_effect=lambda movies: movies.filter(categories=self.drama))
+        movies = self.worker.restrict_queryset(Movie.objects.all(), matches, in_sql)
+        in_sql.assert_called_once()
+        self.assertEqual(sorted(m.pk for m in movies), [m.pk for m in self.movies[:3]])
+
+        response = self.client.get(reverse("movie_ids"), {"categories": self.drama.pk, "sort": "year_asc"})
+        self.assertEqual(sorted(i for i, _ in response.json()["movies"]), [m.pk for m in self.movies[:3]])
+
+
+class ThumbnailTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        self.media = Path(media.name)
+
+    def poster(self, name, size=(400, 600)):
+        path = self.media / "posters" / name
+        path.parent.mkdir(exist_ok=True)
+        Image.new("RGB", size, "red").save(path)
+        return f"posters/{name}"
+
+    def files(self):
+        return sorted(p.name for p in (self.media / "posters").iterdir())
+
+    def test_same_stem_different_extension(self):
+        jpg = thumbnails.render_variants(self.poster("Elf.jpg"))
+        png = thumbnails.render_variants(self.poster("Elf.png"))
+        self.assertFalse(set(thumbnails.variant_names(jpg)) & set(thumbnails.variant_names(png)))
+        self.assertIn("Elf.jpg.w192.webp", self.files())
+        self.assertIn("Elf.png.w192.webp", self.files())
+
+    def test_regenerating_replaces_files_in_place(self):
+        source = self.poster("Elf.jpg")
+        thumbnails.render_variants(source)
+        before = self.files()
+        thumbnails.render_variants(source)
+        self.assertEqual(self.files(), before)
+
+    def test_old_names_are_regenerated_then_removed(self):
+        source = self.poster("Elf.jpg")
+        legacy = {"source": source, "width": 400, "height": 600, "widths": [192], "formats": ["webp", "jpeg"]}
+        for name in thumbnails.variant_names(legacy):
+            (self.media / name).write_bytes(b"old")
+        movie = Movie.objects.create(title="Elf", poster=source)
+        Movie.objects.filter(pk=movie.pk).update(poster_thumbnails=legacy)
+        movie.refresh_from_db()
+        self.assertTrue(thumbnails.needs_refresh(movie))
+        self.assertIsNone(thumbnails.picture_sources(movie))
+
+        thumbnails.refresh_thumbnails(movie.pk)
+        movie.refresh_from_db()
+        self.assertFalse(thumbnails.needs_refresh(movie))
+        self.assertEqual(
+            self.files(), sorted(["Elf.jpg", *(Path(n).name for n in thumbnails.variant_names(movie.poster_thumbnails))])
+        )
+
+
+class PosterCleanupTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        self.media = Path(media.name)
+        (self.media / "posters").mkdir()
+
+    def poster(self, name, age_minutes=0):
+        path = self.media / "posters" / name
+        Image.new("RGB", (40, 60), "red").save(path)
+        if age_minutes:
+            then = path.stat().st_mtime - age_minutes * 60
+            os.utime(path, (then, then))
+        return f"posters/{name}"
+
+    def exists(self, name):
+        return (self.media / name).exists()
+
+    def run_cleanup(self, callbacks):
+        # Just the deletions, run in this thread
+        with mock.patch("tracker.cleanup.run_in_background", side_effect=lambda fn: fn()):
+            for callback in callbacks:
+                if callback.__module__ == cleanup.__name__:
+                    callback()
+
+    def test_old_poster_deleted_after_commit(self):
+        old, new = self.poster("Elf.jpg"), self.poster("Elf-2.jpg")
+        movie = Movie.objects.create(title="Elf", poster=old)
+        movie = Movie.objects.get(pk=movie.pk)
+        with self.captureOnCommitCallbacks() as callbacks:
+            movie.poster = new
+            movie.save()
+            self.assertTrue(self.exists(old))
+        self.assertTrue(self.exists(old))
+        self.run_cleanup(callbacks)
+        self.assertFalse(self.exists(old))
+        self.assertTrue(self.exists(new))
+
+    def test_rollback_keeps_the_file(self):
+        old, new = self.poster("Elf.jpg"), self.poster("Elf-2.jpg")
+        movie = Movie.objects.create(title="Elf", poster=old)
+        movie = Movie.objects.get(pk=movie.pk)
+        with self.captureOnCommitCallbacks() as callbacks:
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                movie.poster = new
+                movie.save()
+                raise RuntimeError
+        self.assertFalse([callback for callback in callbacks if callback.__module__ == cleanup.__name__])
+        self.run_cleanup(callbacks)
+        self.assertTrue(self.exists(old))
+        self.assertEqual(Movie.objects.get(pk=movie.pk).poster.name, old)
+
+    def sweep(self, *args):
+        out, err = StringIO(), StringIO()
+        call_command("sweep_posters", *args, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def test_sweep_posters(self):
+        kept = self.poster("Elf.jpg", age_minutes=120)
+        record = thumbnails.render_variants(kept)
+        for name in thumbnails.variant_names(record):
+            then = (self.media / name).stat().st_mtime - 120 * 60
+            os.utime(self.media / name, (then, then))
+        movie = Movie.objects.create(title="Elf", poster=kept)
+        Movie.objects.filter(pk=movie.pk).update(poster_thumbnails=record)
+        Movie.objects.create(title="Heat", poster="posters/Heat.jpg")
+        stale = self.poster("Gone.jpg", age_minutes=120)
+        fresh = self.poster("Upload.jpg")
+        referenced = [kept, *thumbnails.variant_names(record)]
+
+        out, err = self.sweep("--dry-run")
+        self.assertIn(f"Would delete {stale}", out)
+        self.assertNotIn(fresh, out)
+        self.assertIn("Missing file: posters/Heat.jpg", err)
+        self.assertTrue(all(self.exists(name) for name in [*referenced, stale, fresh]))
+
+        out, _ = self.sweep()
+        self.assertIn("Deleted 1 orphaned file(s).", out)
+        self.assertFalse(self.exists(stale))
+        self.assertTrue(self.exists(fresh))
+
+        self.sweep("--min-age", "0")
+        self.assertFalse(self.exists(fresh))
+        self.assertTrue(all(self.exists(name) for name in referenced))
+
+
+class ImportMoviesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.member = User.objects.create_user("member")
+        drama = Category.objects.create(name="Drama")
+        service = StreamingService.objects.create(name="Stream")
+        cls.elf = Movie.objects.create(
+            title="Elf", year=2003, description="Buddy", starring="Will Ferrell", director="Jon Favreau",
+            recommended_by=cls.member,
+        )
+        cls.elf.categories.add(drama)
+        cls.elf.streaming_services.add(service)
+        Viewing.objects.create(user=cls.member, movie=cls.elf, rating=4, watched_on=date(2024, 12, 24), comment="Again")
+        Movie.objects.create(title="Heat", year=1995)
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+
+    def write(self, name, *lines):
+        path = self.directory / name
+        path.write_text("".join(f"{line}\n" for line in lines), encoding="utf-8")
+        return str(path)
+
+    def run_import(self, path, *args):
+        out, err = StringIO(), StringIO()
+        call_command("import_movies", path, *args, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def export(self, fmt="jsonl"):
+        path = self.directory / f"export.{fmt}"
+        call_command("export_movies", "--type", "all" if fmt == "jsonl" else "movie", "-o", str(path), stdout=StringIO())
+        return path
+
+    def round_trip(self, fmt):
+        exported = self.export(fmt).read_text(encoding="utf-8")
+        Movie.objects.all().delete()
+        self.run_import(str(self.directory / f"export.{fmt}"))
+        self.assertEqual(self.export(fmt).read_text(encoding="utf-8"), exported)
+
+    def test_export_takes_the_grid_filters(self):
+        out = StringIO()
+        call_command("export_movies", "--query", "seen=0&sort=year_desc", "--user", "member", stdout=out)
+        self.assertEqual([json.loads(line)["title"] for line in out.getvalue().splitlines()], ["Heat"])
+        out = StringIO()
+        call_command("export_movies", "--query", "q=buddy", "--type", "viewing", stdout=out)
+        self.assertEqual([json.loads(line)["comment"] for line in out.getvalue().splitlines()], ["Again"])
+
+    def test_export_import_round_trip(self):
+        self.round_trip("jsonl")
+        elf = Movie.objects.get(title="Elf")
+        self.assertEqual(sorted(p.name for p in elf.people.all()), ["Jon Favreau", "Will Ferrell"])
+        self.assertEqual((elf.viewing_count, elf.rating_count, elf.rating_mean), (1, 1, 4.0))
+
+    def test_csv_round_trip(self):
+        self.round_trip("csv")
+
+    def test_reimport_updates_rather_than_duplicates(self):
+        path = self.write("movies.jsonl", json.dumps({"title": "Elf", "year": 2003, "description": "Changed"}))
+        for _ in range(2):
+            out, _ = self.run_import(path)
+        self.assertIn("movies updated: 1", out)
+        self.assertEqual(Movie.objects.filter(title="Elf").count(), 1)
+        elf = Movie.objects.get(title="Elf")
+        self.assertEqual(elf.description, "Changed")
+        # Fields the record leaves out are kept
+        self.assertEqual(elf.director, "Jon Favreau")
+        self.assertEqual(list(elf.categories.values_list("name", flat=True)), ["Drama"])
+
+    def test_dry_run_rolls_back(self):
+        path = self.write(
+            "movies.jsonl",
+            json.dumps({"title": "New", "year": 2020, "categories": ["Brand New"]}),
+            json.dumps({"title": "Elf", "year": 2003, "description": "Changed"}),
+        )
+        out, _ = self.run_import(path, "--dry-run")
+        self.assertIn("movies created: 1", out)
+        self.assertIn("Dry run", out)
+        self.assertFalse(Movie.objects.filter(title="New").exists())
+        self.assertFalse(Category.objects.filter(name="Brand New").exists())
+        self.assertEqual(Movie.objects.get(title="Elf").description, "Buddy")
+
+    def test_bad_records_are_reported_and_skipped(self):
+        path = self.write(
+            "movies.jsonl",
+            json.dumps({"title": "Good", "year": 2001, "starring": "New Person"}),
+            "{not json",
+            json.dumps({"title": "Unknown Category", "categories": ["Nope"]}),
+            json.dumps({"title": "Unknown Recommender", "recommended_by": "nobody"}),
+            json.dumps({"type": "viewing", "title": "Heat", "year": 1995, "user": "nobody"}),
+            json.dumps({"title": "Bad Year", "year": "soon"}),
+            json.dumps({"type": "viewing", "title": "Heat", "year": 1995, "user": "member", "rating": 5}),
+        )
+        out, err = self.run_import(path, "--no-create", "--batch-size", "3")
+        self.assertIn("errors: 5", out)
+        for line, message in ((2, "invalid JSON"), (3, "unknown categories: Nope"), (4, "recommended_by: no user 'nobody'"),
+                              (5, "user: no user 'nobody'"), (6, "year must be a whole number")):
+            self.assertIn(f"line {line}: {message}", err)
+        self.assertTrue(Movie.objects.filter(title="Good", people__name="New Person").exists())
+        self.assertFalse(Movie.objects.filter(title__in=["Unknown Category", "Unknown Recommender", "Bad Year"]).exists())
+        self.assertTrue(Viewing.objects.filter(movie__title="Heat", user=self.member, rating=5).exists())
+
+
+class StatRollupTests(TestCase):
+    """The running totals after a run of edits equal a rebuild from scratch."""
+
+    def totals(self):
+        return sorted(
+            # Club-wide rows (no user) sort as user 0
+            (row.metric, row.key, row.user_id or 0, row.count, row.rating_count, round(row.rating_sum, 6))
+            for row in StatRollup.objects.all()
+            # Totals that dropped to zero may linger; rebuild_stats leaves them out
+            if row.count
+        )
+
+    def test_incremental_totals_match_rebuild(self):
+        ann, bob = User.objects.create_user("ann"), User.objects.create_user("bob")
+        drama, comedy = Category.objects.create(name="Drama"), Category.objects.create(name="Comedy")
+        stream, rent = StreamingService.objects.create(name="Stream"), StreamingService.objects.create(name="Rent")
+        elf = Movie.objects.create(title="Elf", recommended_by=ann)
+        heat = Movie.objects.create(title="Heat")
+        up = Movie.objects.create(title="Up", recommended_by=bob)
+
+        # Viewings: create, edit, move to another movie, delete
+        elf.categories.add(drama)
+        first = Viewing.objects.create(user=ann, movie=elf, rating=4, watched_on=date(2024, 1, 5))
+        Viewing.objects.create(user=bob, movie=elf, rating=2)
+        second = Viewing.objects.create(user=bob, movie=heat, watched_on=date(2024, 2, 1))
+        first.rating, first.watched_on = 5, date(2024, 3, 1)
+        first.save()
+        second.movie, second.rating = up, 3
+        second.save()
+        Viewing.objects.create(user=ann, movie=up, rating=1).delete()
+
+        # Categories and services, from both sides
+        elf.categories.add(comedy)
+        comedy.movies.add(heat, up)
+        elf.categories.remove(drama)
+        up.streaming_services.set([stream, rent])
+        rent.movies.clear()
+        heat.categories.clear()
+
+        # Recommenders: change, clear, and an update_fields save that skips it
+        elf.recommended_by = bob
+        elf.save()
+        up.recommended_by = None
+        up.save()
+        heat.title = "Heat (1995)"
+        heat.save(update_fields=["title"])
+
+        # Batches, and deletes that cascade
+        set_seen(ann, [heat.pk, up.pk], True)
+        set_seen(ann, [up.pk], False)
+        Movie.objects.create(title="Gone", recommended_by=ann).delete()
+        drama.delete()
+
+        incremental = self.totals()
+        self.assertIn((StatRollup.Metric.RECOMMENDER, str(bob.pk), 0, 2, 2, 7.0), incremental)
+        rebuild_stats()
+        self.assertEqual(incremental, self.totals())
+
+
+class RecommenderTests(TestCase):
+    # Two members with opposite tastes, and a third who only half agrees
+    RATINGS = {
+        "ann": {"A": 5, "B": 5, "C": 1, "D": 1},
+        "bob": {"A": 1, "B": 1, "C": 5, "D": 5, "E": 4},
+        "cat": {"A": 4, "C": 2, "E": 2},
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = {name: User.objects.create_user(name) for name in cls.RATINGS}
+        cls.movies = {title: Movie.objects.create(title=title) for title in "ABCDEF"}
+        Viewing.objects.bulk_create([
+            Viewing(user=cls.users[name], movie=cls.movies[title], rating=rating)
+            for name, ratings in cls.RATINGS.items()
+            for title, rating in ratings.items()
+        ])
+
+    def factors(self, model, **filters):
+        return {row.pk: (row.bias, bytes(row.vector)) for row in model.objects.filter(**filters)}
+
+    def recommendations(self, **filters):
+        return list(Recommendation.objects.filter(**filters).values_list("user_id", "movie_id", "rank", "score"))
+
+    def test_train_stores_factors_of_the_right_shape(self):
+        counts = recommender.train(factors=3, iterations=5)
+        self.assertEqual(counts["ratings"], 12)
+        self.assertEqual(MovieFactors.objects.count(), 5)  # F has no ratings
+        self.assertEqual(UserFactors.objects.count(), 3)
+        for row in [*MovieFactors.objects.all(), *UserFactors.objects.all()]:
+            self.assertEqual(len(recommender._unpack(row.vector)), 3)
+        # Only unseen movies with factors: ann has seen A-D, and F was never rated
+        recommended = Recommendation.objects.filter(user=self.users["ann"]).values_list("movie__title", flat=True)
+        self.assertEqual(list(recommended), ["E"])
+
+    def test_refresh_user_only_touches_that_member(self):
+        recommender.train(factors=3, iterations=5)
+        cat = self.users["cat"]
+        others = {"user_factors": self.factors(UserFactors, pk__in=[self.users["ann"].pk, self.users["bob"].pk])}
+        others["movie_factors"] = self.factors(MovieFactors)
+        others["recommendations"] = self.recommendations(user__in=[self.users["ann"], self.users["bob"]])
+        before = self.factors(UserFactors, pk=cat.pk), self.recommendations(user=cat)
+
+        Viewing.objects.create(user=cat, movie=self.movies["D"], rating=1)
+        recommender.refresh_user(cat.pk, self.movies["D"].pk)
+
+        self.assertNotEqual((self.factors(UserFactors, pk=cat.pk), self.recommendations(user=cat)), before)
+        self.assertNotIn(self.movies["D"].pk, [movie_id for _, movie_id, _, _ in self.recommendations(user=cat)])
+        self.assertEqual(
+            others,
+            {
+                "user_factors": self.factors(UserFactors, pk__in=[self.users["ann"].pk, self.users["bob"].pk]),
+                "movie_factors": self.factors(MovieFactors),
+                "recommendations": self.recommendations(user__in=[self.users["ann"], self.users["bob"]]),
+            },
+        )
+
+    def test_refresh_user_reloads_factors_after_training(self):
+        recommender.train(factors=3, iterations=5)
+        ann = self.users["ann"]
+        recommender.refresh_user(ann.pk)
+        recommender.train(factors=2, iterations=5)
+        recommender.refresh_user(ann.pk)
+        self.assertEqual(len(recommender._unpack(UserFactors.objects.get(pk=ann.pk).vector)), 2)
+
+    def test_evaluate(self):
+        results = recommender.evaluate(test_fraction=0.3, k=2, seed=1, factors=2, iterations=5)
+        self.assertEqual(results["train_ratings"] + results["test_ratings"], 12)
+        self.assertTrue(math.isfinite(results["rmse"]))
+        self.assertTrue(math.isfinite(results["baseline_rmse"]))
+
+
+class CardCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.ann = User.objects.create_user("ann", first_name="Ann")
+        cls.bob = User.objects.create_user("bob", first_name="Bob")
+        cls.drama = Category.objects.create(name="Drama")
+        cls.movie = Movie.objects.create(title="Heat", recommended_by=cls.ann)
+        cls.movie.categories.add(cls.drama)
+
+    def keys(self):
+        movie = Movie.objects.get(pk=self.movie.pk)
+        return {part: cards.card_key(movie, part) for part in cards.CARD_PARTS}
+
+    def assertKeysChange(self, change):
+        before = self.keys()
+        change()
+        after = self.keys()
+        for part in cards.CARD_PARTS:
+            self.assertNotEqual(before[part], after[part], part)
+
+    def test_viewing_changes(self):
+        self.assertKeysChange(lambda: Viewing.objects.create(user=self.bob, movie=self.movie, rating=4))
+        viewing = Viewing.objects.get(user=self.bob, movie=self.movie)
+        viewing.rating = 2
+        self.assertKeysChange(viewing.save)
+        self.assertKeysChange(viewing.delete)
+
+    def test_category_changes(self):
+        self.drama.name = "Crime drama"
+        self.assertKeysChange(self.drama.save)
+        self.assertKeysChange(lambda: self.movie.categories.remove(self.drama))
+
+    def test_person_changes(self):
+        self.ann.first_name = "Annie"
+        self.assertKeysChange(self.ann.save)
+        Viewing.objects.create(user=self.bob, movie=self.movie)
+        self.bob.first_name = "Robert"
+        self.assertKeysChange(self.bob.save)
+
+    def test_logins_keep_the_keys(self):
+        before = self.keys()
+        self.ann.save(update_fields=["last_login"])
+        self.assertEqual(before, self.keys())
+
+    def test_unrelated_changes_keep_the_keys(self):
+        before = self.keys()
+        Category.objects.create(name="Comedy").save()
+        Movie.objects.create(title="Ronin")
+        self.assertEqual(before, self.keys())
+
+    @override_settings(
+        TRACKER_WORKER_PROCESSES=2,
+        TRACKER_FACET_CACHE="shared",
+        CACHES={
+            "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+            "shared": {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": "unused"},
+        },
+    )
+    def test_several_workers_need_a_shared_card_cache(self):
+        with self.settings(TRACKER_CARD_CACHE="default"):
+            errors = checks.check_shared_caches(None)
+        self.assertEqual([(e.id, e.msg.split()[0]) for e in errors], [("tracker.E001", "TRACKER_CARD_CACHE")])
+        with self.settings(TRACKER_CARD_CACHE="shared"):
+            self.assertEqual(checks.check_shared_caches(None), [])
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.member = User.objects.create_user("ann")
+        cls.ghosts = [
+            Movie.objects.create(title="Ghostbusters", year=1984),
+            Movie.objects.create(title="Ghost", year=1990, description="A ghost story"),
+            Movie.objects.create(title="Heat", year=1995, director="Ghostly Mann"),
+        ]
+        Movie.objects.create(title="Ronin", year=1998)
+
+    def ids(self, text):
+        return set(search.matching_ids(text))
+
+    def test_prefix_matching(self):
+        self.assertEqual(self.ids("ghost"), {m.pk for m in self.ghosts})
+        self.assertEqual(self.ids("gho stor"), {self.ghosts[1].pk})
+        self.assertEqual(self.ids("busters"), set())
+        self.assertEqual(self.ids("ghosts"), set())
+        # Operators are just words
+        self.assertEqual(self.ids('" OR NEAR('), set())
+        self.assertEqual(search.search_movies("!!"), [])
+
+    def test_ranked_by_relevance(self):
+        # Titles outweigh descriptions, which outweigh people
+        self.assertEqual(search.search_movies("ghost")[-1], self.ghosts[2].pk)
+        self.assertEqual(len(search.search_movies("ghost", limit=2)), 2)
+
+    def test_index_follows_movies_and_viewings(self):
+        movie = Movie.objects.get(title="Ronin")
+        movie.description = "Spectral heist"
+        movie.save()
+        self.assertEqual(self.ids("spectr"), {movie.pk})
+        viewing = Viewing.objects.create(user=self.member, movie=movie, comment="Wonderfully haunted")
+        self.assertEqual(self.ids("haunt"), {movie.pk})
+        viewing.delete()
+        self.assertEqual(self.ids("haunt"), set())
+        movie.delete()
+        self.assertEqual(self.ids("spectr"), set())
+
+    def test_snippets(self):
+        # Only for the movies asked about
+        self.assertEqual(search.search_snippets("story", [self.ghosts[0].pk, self.ghosts[2].pk]), {})
+        snippets = search.search_snippets("story", [m.pk for m in self.ghosts])
+        self.assertEqual(list(snippets), [self.ghosts[1].pk])
+        self.assertIn("<mark>story</mark>", snippets[self.ghosts[1].pk])
+        Movie.objects.filter(pk=self.ghosts[1].pk).update(description="<i>story</i>")
+        search.index_movie(self.ghosts[1].pk)
+        snippet = search.search_snippets("story", [self.ghosts[1].pk])[self.ghosts[1].pk]
+        self.assertIn("&lt;i&gt;<mark>story</mark>&lt;/i&gt;", snippet)
+
+    def grid_ids(self, **params):
+        return [movie_id for movie_id, _ in self.client.get(reverse("movie_ids"), params).json()["movies"]]
+
+    def test_only_relevance_is_capped(self):
+        capped = lambda text: search.search_movies(text, limit=1)  # noqa: E731
+        with mock.patch("tracker.filters.search_movies", capped):
+            self.assertEqual(len(self.grid_ids(q="ghost", sort="relevance")), 1)
+            self.assertEqual(len(self.grid_ids(q="ghost", sort="year_desc")), 3)
+            response = self.client.get(reverse("export_movies", args=["jsonl"]), {"q": "ghost", "sort": "relevance"})
+            exported = [json.loads(line)["title"] for line in b"".join(response.streaming_content).splitlines()]
+        # The one ranked hit first, then the rest in title order
+        self.assertEqual(len(exported), 3)
+        self.assertEqual(sorted(exported[1:]), exported[1:])
+
+    def test_admin_search(self):
+        model_admin = admin.site._registry[Movie]
+        request = RequestFactory().get("/")
+        found, may_have_duplicates = model_admin.get_search_results(request, Movie.objects.all(), "gho")
+        self.assertEqual(set(found), set(self.ghosts))
+        self.assertFalse(may_have_duplicates)
+        # Nothing FTS can search for falls back to the admin's own search
+        found, _ = model_admin.get_search_results(request, Movie.objects.all(), "")
+        self.assertEqual(found.count(), 4)
+
+
+class PruneCssTests(TestCase):
+    CSS = """
+/*! tailwindcss v4 | MIT License */
+@layer theme {
+  :root {
+    --color-red-600: oklch(57.7% 0.245 27.325);
+    --color-unused: #123;
+    --font-sans: var(--default-font);
+    --default-font: ui-sans-serif;
+    --spacing: 0.25rem;
+  }
+}
+@property --tw-unused-shadow { syntax: "*"; inherits: false; }
+@layer utilities {
+  .bg-red-600 { background-color: var(--color-red-600); }
+  .never-used-anywhere { color: var(--color-unused); }
+  .focus\\:border-indigo-500:focus { border-color: indigo; }
+  @media (width >= 40rem) {
+    .sm\\:flex { display: flex; }
+    .sm\\:never-used-anywhere { display: grid; }
+  }
+  body { font-family: var(--font-sans); }
+  .content-\\[\\'a\;b\\'\\] { content: 'a;b /* not a comment */'; }
+}
+"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.candidates = static_assets.class_candidates([
+            Path(settings.BASE_DIR) / "tracker" / "templates",
+            Path(settings.BASE_DIR) / "tracker" / "forms.py",
+        ])
+        # Not in the templates; stands in for a class written out in one
+        cls.candidates |= {"sm:flex", "content-['a;b']"}
+        cls.pruned = static_assets.prune_css(cls.CSS, cls.candidates)
+
+    def test_keeps_classes_used_in_templates_and_forms(self):
+        self.assertIn(".bg-red-600{background-color:var(--color-red-600);}", self.pruned)
+        self.assertIn(".focus\\:border-indigo-500:focus{border-color:indigo;}", self.pruned)
+        self.assertNotIn("never-used-anywhere", self.pruned)
+
+    def test_keeps_used_rules_inside_media_and_layer(self):
+        self.assertIn("@layer utilities{", self.pruned)
+        self.assertIn("@media (width >= 40rem){.sm\\:flex{display:flex;}}", self.pruned)
+        self.assertIn("body{font-family:var(--font-sans);}", self.pruned)
+
+    def test_drops_unused_custom_properties_only(self):
+        self.assertNotIn("--color-unused", self.pruned)
+        self.assertNotIn("--spacing", self.pruned)
+        self.assertNotIn("--tw-unused-shadow", self.pruned)
+        # --default-font is only read through --font-sans
+        self.assertIn("--font-sans:var(--default-font);", self.pruned)
+        self.assertIn("--default-font:ui-sans-serif;", self.pruned)
+
+    def test_keeps_licence_comments_and_strings(self):
+        self.assertTrue(self.pruned.startswith("/*! tailwindcss v4 | MIT License */"))
+        self.assertIn("content:'a;b /* not a comment */';", self.pruned)
+
+    def test_accepted_encodings(self):
+        self.assertEqual(static_assets._accepted_encodings("gzip, zstd;q=0.5"), {"gzip", "zstd"})
+        self.assertEqual(static_assets._accepted_encodings("gzip;q=0, zstd"), {"zstd"})
+        self.assertEqual(static_assets._accepted_encodings("*;q=0"), set())
+        self.assertEqual(static_assets._accepted_encodings(None), set())
+
+
+class StaticFilesMiddlewareTests(TestCase):
+    def setUp(self):
+        base = Path(self.enterContext(tempfile.TemporaryDirectory()))
+        (base / "secret.txt").write_text("secret")
+        root = base / "static"
+        (root / "css").mkdir(parents=True)
+        (root / "css" / "site.0123456789ab.css").write_text("body{color:red}")
+        (root / "css" / "site.0123456789ab.css.gz").write_bytes(b"gz")
+        (root / "robots.txt").write_text("User-agent: *")
+        self.enterContext(override_settings(STATIC_ROOT=str(root), STATIC_URL="/static/"))
+        storage = mock.Mock(hashed_files={"css/site.css": "css/site.0123456789ab.css"})
+        self.enterContext(mock.patch.object(static_assets, "staticfiles_storage", storage))
+        self.django = mock.Mock(return_value=[b"from django"])
+        self.middleware = static_assets.StaticFilesMiddleware(self.django)
+
+    def get(self, path, **headers):
+        environ = {"REQUEST_METHOD": "GET", "PATH_INFO": path, **headers}
+        started = []
+        body = b"".join(self.middleware(environ, lambda status, headers: started.append((status, dict(headers)))))
+        return (*started[0], body) if started else (None, {}, body)
+
+    def test_hashed_names_are_immutable(self):
+        status, headers, body = self.get("/static/css/site.0123456789ab.css", HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(status, "200 OK")
+        self.assertEqual(headers["Cache-Control"], static_assets.IMMUTABLE)
+        self.assertEqual(headers["Content-Encoding"], "gzip")
+        self.assertEqual(headers["Vary"], "Accept-Encoding")
+        self.assertEqual(body, b"gz")
+        status, headers, body = self.get("/static/css/site.0123456789ab.css", HTTP_ACCEPT_ENCODING="gzip;q=0")
+        self.assertNotIn("Content-Encoding", headers)
+        self.assertEqual(body, b"body{color:red}")
+
+    def test_if_modified_since(self):
+        status, headers, _ = self.get("/static/robots.txt")
+        self.assertEqual((status, headers["Cache-Control"]), ("200 OK", static_assets.REVALIDATE))
+        status, _, body = self.get("/static/robots.txt", HTTP_IF_MODIFIED_SINCE=headers["Last-Modified"])
+        self.assertEqual((status, body), ("304 Not Modified", b""))
+
+    def test_misses_fall_through_to_django(self):
+        for path in ["/static/css/missing.css", "/static/css", "/movies/"]:
+            with self.subTest(path=path):
+                self.assertEqual(self.get(path)[2], b"from django")
+
+    def test_rejects_traversal(self):
+        for path in ["/static/../secret.txt", "/static/css/../../secret.txt", "/static/%2e%2e/secret.txt"]:
+            with self.subTest(path=path):
+                self.assertEqual(self.get(path)[2], b"from django")
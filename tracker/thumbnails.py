@@ -0,0 +1,202 @@
+"""
+Poster thumbnails for responsive <picture> markup.
+
+When a movie's poster changes, fixed-width WebP and JPEG variants are written
+next to the original (posters/Elf.jpg -> posters/Elf.jpg.w384.webp, ...) on a
+background thread once the transaction commits. What exists is recorded on
+Movie.poster_thumbnails, so templates never touch the disk:
+
+    {"source": "posters/Elf.jpg", "width": 1000, "height": 1500,
+     "widths": [192, 384, 768], "formats": ["webp", "jpeg"], "naming": 2}
+
+Until the record matches the current poster, templates fall back to the
+original file. Variants are written to a temporary file and renamed over
+the old one, so regenerating never leaves a page pointing at a missing
+file; the previous poster's variants go once the new record is stored.
+"""
+import io
+import os
+import tempfile
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import models, transaction
+from django.db.models import Q
+from django.dispatch import receiver
+
+from .background import run_in_background
+from .cleanup import delete_file_later
+from .models import Movie, touched_fields
+
+# w-48 cards are 192px wide; 2x and the detail page's column width on top
+THUMBNAIL_WIDTHS = (192, 384, 768)
+
+THUMBNAIL_FORMATS = {
+    # format: (extension, Pillow save options)
+    "webp": ("webp", {"format": "WEBP", "quality": 80, "method": 6}),
+    "jpeg": ("jpg", {"format": "JPEG", "quality": 82, "optimize": True, "progressive": True}),
+}
+
+# Records without "naming" dropped the source's extension (Elf.w384.webp),
+# so Elf.jpg and Elf.png wrote over each other's variants
+THUMBNAIL_NAMING = 2
+
+
+def variant_name(source, width, fmt, naming=THUMBNAIL_NAMING):
+    if naming < 2:
+        source, _ = os.path.splitext(source)
+    return f"{source}.w{width}.{THUMBNAIL_FORMATS[fmt][0]}"
+
+
+def variant_names(record):
+    """Every file a poster_thumbnails record says exists."""
+    return [
+        variant_name(record["source"], width, fmt, record.get("naming", 1))
+        for width in record.get("widths", ())
+        for fmt in record.get("formats", ())
+    ]
+
+
+def _write_over(storage, name, data):
+    """Save `data` as `name`, replacing any file already there."""
+    try:
+        path = storage.path(name)
+    except NotImplementedError:
+        # Not a local filesystem; without the delete, save() would pick
+        # a new name rather than replace the file
+        if storage.exists(name):
+            storage.delete(name)
+        storage.save(name, ContentFile(data))
+        return
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, temporary = tempfile.mkstemp(dir=directory, prefix=".thumbnail-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.chmod(temporary, storage.file_permissions_mode or 0o644)
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+
+def render_variants(source, storage=default_storage):
+    """
+    Write every thumbnail for the poster at `source` and return its record.
+    Touches only the storage, never the database, so it can run in a
+    worker process.
+    """
+    from PIL import Image, ImageOps
+
+    with storage.open(source, "rb") as f:
+        image = ImageOps.exif_transpose(Image.open(f))
+        image.load()
+
+    width, height = image.size
+    widths = [w for w in THUMBNAIL_WIDTHS if w < width] or [width]
+
+    for target_width in widths:
+        target_height = max(1, round(height * target_width / width))
+        resized = image.resize((target_width, target_height), Image.Resampling.LANCZOS)
+        for fmt, (_, options) in THUMBNAIL_FORMATS.items():
+            frame = resized
+            if fmt == "jpeg" and frame.mode != "RGB":
+                frame = frame.convert("RGB")
+            elif fmt == "webp" and frame.mode not in ("RGB", "RGBA"):
+                frame = frame.convert("RGBA" if "A" in frame.getbands() else "RGB")
+            buffer = io.BytesIO()
+            frame.save(buffer, **options)
+            _write_over(storage, variant_name(source, target_width, fmt), buffer.getvalue())
+
+    return {
+        "source": source,
+        "width": width,
+        "height": height,
+        "widths": widths,
+        "formats": list(THUMBNAIL_FORMATS),
+        "naming": THUMBNAIL_NAMING,
+    }
+
+
+def delete_variants(record, storage=default_storage, keep=()):
+    """Delete the files `record` lists, except any named in `keep`."""
+    for name in variant_names(record) if record else ():
+        if name not in keep and storage.exists(name):
+            storage.delete(name)
+
+
+def replace_variants(old_record, new_record, storage=default_storage):
+    """Delete what `old_record` listed once `new_record` is stored in its place."""
+    delete_variants(old_record, storage, keep=set(variant_names(new_record)) if new_record else ())
+
+
+def needs_refresh(movie):
+    current = movie.poster.name if movie.poster else None
+    record = movie.poster_thumbnails or {}
+    if record.get("source") != current:
+        return True
+    return bool(current) and record.get("naming", 1) != THUMBNAIL_NAMING
+
+
+def refresh_thumbnails(movie_id):
+    """
+    Bring one movie's thumbnails in line with its current poster: render the
+    new variants, then drop the ones they replace.
+    """
+    movie = Movie.objects.filter(pk=movie_id).only("poster", "poster_thumbnails").first()
+    if movie is None or not needs_refresh(movie):
+        return
+
+    old_record = movie.poster_thumbnails or {}
+    source = movie.poster.name if movie.poster else None
+    record = render_variants(source) if source else {}
+    # Only store it if nobody swapped the poster again meanwhile
+    unchanged = Movie.objects.filter(pk=movie_id)
+    if source:
+        unchanged = unchanged.filter(poster=source)
+    else:
+        unchanged = unchanged.filter(Q(poster="") | Q(poster__isnull=True))
+    if unchanged.update(poster_thumbnails=record, **touched_fields()):
+        replace_variants(old_record, record)
+
+
+def schedule_thumbnails(movie_id):
+    """Refresh a movie's thumbnails on a background thread after commit."""
+    transaction.on_commit(lambda: run_in_background(refresh_thumbnails, movie_id))
+
+
+def picture_sources(movie):
+    """
+    srcset data for a movie's poster, or None while thumbnails aren't ready.
+    Returns {"webp": srcset, "jpeg": srcset, "src": url, "width", "height"}.
+    """
+    record = movie.poster_thumbnails or {}
+    if not movie.poster or needs_refresh(movie):
+        return None
+
+    srcsets = {}
+    for fmt in record["formats"]:
+        srcsets[fmt] = ", ".join(
+            f"{default_storage.url(variant_name(record['source'], w, fmt))} {w}w"
+            for w in record["widths"]
+        )
+    largest = max(record["widths"])
+    return {
+        **srcsets,
+        "src": default_storage.url(variant_name(record["source"], largest, "jpeg")),
+        "width": largest,
+        "height": round(record["height"] * largest / record["width"]),
+    }
+
+
+@receiver(models.signals.post_save, sender=Movie)
+def schedule_thumbnails_on_save(sender, instance, **kwargs):
+    if needs_refresh(instance):
+        schedule_thumbnails(instance.pk)
+
+
+@receiver(models.signals.post_delete, sender=Movie)
+def delete_thumbnails_on_delete(sender, instance, **kwargs):
+    if instance.poster_thumbnails:
+        delete_file_later(*variant_names(instance.poster_thumbnails))
@@ -1,12 +1,25 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
+
+# The ASGI profile serves the read-heavy pages from async_views.py
+read_views = async_views if getattr(settings, "TRACKER_ASYNC_VIEWS", False) else views
 
 urlpatterns = [
-    path("movies/", views.movie_list, name="movie_list"),
+    path("movies/", read_views.movie_list, name="movie_list"),
+    path("movies/grid/", views.movie_grid, name="movie_grid"),
+    path("movies/ids/", views.movie_ids, name="movie_ids"),
+    path("movies/cards/", views.movie_cards, name="movie_cards"),
+    path("movies/export.<str:fmt>", views.export_movies, name="export_movies"),
+    path("movies/export/viewings.<str:fmt>", views.export_viewings, name="export_viewings"),
     path("movies/toggle/<int:movie_id>/", views.toggle_seen, name="toggle_seen"),
-    path("suggest/", views.movie_suggest, name="movie_suggest"),
+    path("movies/seen/", views.toggle_seen_batch, name="toggle_seen_batch"),
+    path("suggest/", read_views.movie_suggest, name="movie_suggest"),
+    path("recommendations/", views.movie_recommendations, name="movie_recommendations"),
+    path("stats/", views.club_stats, name="club_stats"),
+    path("stats/data/", views.club_stats_data, name="club_stats_data"),
     path("add/", views.add_movie, name="add_movie"),
-    path('movies/<int:movie_id>/', views.movie_detail, name='movie_detail'),
+    path('movies/<int:movie_id>/', read_views.movie_detail, name='movie_detail'),
     path('movies/<int:movie_id>/edit/', views.movie_edit, name='movie_edit'),
     path('movies/<int:movie_id>/delete/', views.movie_delete, name='movie_delete'),
 ]
@@ -1,179 +1,262 @@
-import random
-from django.http import JsonResponse
+import hashlib
+import json
+from django.core.exceptions import BadRequest
+from django.http import Http404, HttpResponse, JsonResponse
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from django.shortcuts import render, redirect, get_object_or_404
-from django.db.models import Prefetch
 from django.contrib.auth.models import User
+from django.shortcuts import render, redirect, get_object_or_404
+from django.template.loader import get_template
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.views.decorators.http import require_POST
+from django.db.models import Prefetch, prefetch_related_objects
+from .cards import card_token, render_cards
+from .export import (
+    EXPORT_FORMATS,
+    MOVIE_COLUMNS,
+    VIEWING_COLUMNS,
+    encode_lines,
+    movie_record,
+    movies_in_order,
+    streaming_export,
+    viewing_record,
+    viewings_in_order,
+)
+from .facets import get_facet_options
+from .filters import filter_by_person, filter_movies, int_or_none
 from .forms import MovieForm, ViewingForm
-from .models import Movie, Viewing, Category, StreamingService
+from .http_cache import conditional_response, detail_validators, grid_validators, patch_response
+from .models import Movie, MovieCredit, Recommendation, SimilarMovie, Viewing
+from .pagination import keyset_page, ranked_page
+from .search import search_snippets
+from .seen import set_seen
+from .stats import stats_for, stats_members
+from .suggest import MAX_SUGGESTIONS, SUGGESTION_MODES, pick_movies, suggestion_weight
 
-SORT_OPTIONS = {
-    "title_asc": "title",
-    "title_desc": "-title",
-    "year_asc": "year",
-    "year_desc": "-year",
-    "recent": "-created_at",
-}
 
-def movie_list(request):
-    # Base queryset
-    movies = Movie.objects.prefetch_related(
-        "categories",
-        "streaming_services",
-    ).all()
+def _grid_page(request, grid):
+    """One page of the filtered movies: (movies, next_cursor)."""
+    cursor = request.GET.get("cursor", "")
+    if grid["ranked_ids"] is not None:
+        # Already filtered; skip the filters' subqueries for one page of ids
+        return ranked_page(Movie.objects.all(), grid["ranked_ids"], cursor)
+    return keyset_page(grid["movies"], grid["ordering"], cursor)
 
-    # --- Sorting ---
-    sort_key = request.GET.get("sort", "title_asc")
-    ordering = SORT_OPTIONS.get(sort_key, "title")
-    movies = movies.order_by(ordering)
 
-    # --- Filters ---
-    # Seen/Unseen
-    seen_filter = ""
-    if request.user.is_authenticated:
-        seen_filter = request.GET.get("seen")
-        if seen_filter == "1":
-            movies = movies.filter(viewing__user=request.user)
-        elif seen_filter == "0":
-            movies = movies.exclude(viewing__user=request.user)
-
-    # Categories (multi-choice)
-    category_ids = request.GET.getlist("categories")
-    if category_ids:
-        movies = movies.filter(categories__id__in=category_ids).distinct()
-
-    # Director / Writer / Starring filters
-    director_filter = request.GET.get("director", "")
-    if director_filter:
-        movies = movies.filter(director__icontains=director_filter)
-
-    writer_filter = request.GET.get("writer", "")
-    if writer_filter:
-        movies = movies.filter(writer__icontains=writer_filter)
-
-    starring_filter = request.GET.get("starring", "")
-    if starring_filter:
-        movies = movies.filter(starring__icontains=starring_filter)
-
-    # Recommender / Streaming filters
-    recommender_id = request.GET.get("recommended_by", "")
-    if recommender_id:
-        movies = movies.filter(recommended_by__id=recommender_id)
-
-    streaming_id = request.GET.get("streaming", "")
-    if streaming_id:
-        movies = movies.filter(streaming_services__id=streaming_id)
-
-    # --- Viewings mapping ---
-    current_user_viewings = {}
-    viewing_map = {}
-    viewings = Viewing.objects.select_related("user", "movie")
+def _next_page_url(request, next_cursor):
+    # The grid's script fetches later pages through movie_ids
+    if not next_cursor:
+        return None
+    params = request.GET.copy()
+    params["cursor"] = next_cursor
+    return f"{reverse('movie_ids')}?{params.urlencode()}"
 
-    if request.user.is_authenticated:
-        for v in viewings:
-            if v.user_id == request.user.id:
-                current_user_viewings[v.movie_id] = v
-            else:
-                viewing_map.setdefault(v.movie_id, []).append(v)
-    else:
-        for v in viewings:
-            viewing_map.setdefault(v.movie_id, []).append(v)
-
-    # --- Filter data for dropdowns ---
-    categories = Category.objects.all().order_by("name")
-    streaming_services = StreamingService.objects.all()
-    recommenders = User.objects.filter(recommended_movies__isnull=False).distinct()
-    writers = sorted({
-        a.strip()
-        for s in Movie.objects.exclude(writer="").values_list("writer", flat=True)
-        for a in s.split(",")
-    })
-    directors = sorted({
-        a.strip()
-        for s in Movie.objects.exclude(director="").values_list("director", flat=True)
-        for a in s.split(",")
-    })
-    starring_list = sorted({
-        a.strip()
-        for s in Movie.objects.exclude(starring="").values_list("starring", flat=True)
-        for a in s.split(",")
-    })
 
-    context = {
-        "movies": movies,
-        "current_user_viewings": current_user_viewings,
-        "viewing_map": viewing_map,
-        "categories": categories,
-        "streaming_services": streaming_services,
-        "recommenders": recommenders,
-        "sort": sort_key,
-        "selected_seen": seen_filter,
-        "selected_categories": category_ids,
-        "selected_director": director_filter,
-        "selected_writer": writer_filter,
-        "selected_starring": starring_filter,
-        "selected_recommender": recommender_id,
-        "selected_streaming": streaming_id,
-        "writers": writers,
-        "directors": directors,
-        "starring_list": starring_list,
+def _page_snippets(q, page):
+    """Search snippets for just the movies on `page`."""
+    return search_snippets(q, [m.id for m in page]) if q and page else {}
+
+
+def _render_page_cards(request, page, snippets):
+    """Cards for `page` (see cards.py), with the current user's viewings."""
+    current_user_viewings = {}
+    if request.user.is_authenticated:
+        current_user_viewings = {
+            v.movie_id: v
+            for v in Viewing.objects.filter(
+                user=request.user, movie_id__in=[m.id for m in page]
+            )
+        }
+    return render_cards(page, request.user.id, current_user_viewings, snippets)
+
+
+def _grid_page_context(request, grid):
+    """
+    Fetch one page of the filtered movies and render its cards, with the
+    current user's viewings for just that page.
+    """
+    page, next_cursor = _grid_page(request, grid)
+    return {
+        "movies": page,
+        "cards": _render_page_cards(request, page, _page_snippets(grid["selected"]["q"], page)),
+        "is_first_page": not request.GET.get("cursor"),
+        "next_page_url": _next_page_url(request, next_cursor),
     }
 
+
+# The grid's live filtering asks for just the fragment
+GRID_VARY = ["X-Requested-With"]
+
+def movie_list(request):
+    # --- Conditional GET for anonymous visitors (see http_cache.py) ---
+    validators = grid_validators(request)
+    response = conditional_response(request, validators, GRID_VARY)
+    if response is not None:
+        return response
+
+    grid = filter_movies(request.GET, request.user)
+    context = _grid_page_context(request, grid)
+    context["facet_counts"] = grid["facet_counts"]
+
     # --- AJAX response for live filtering ---
     if request.headers.get("x-requested-with") == "XMLHttpRequest":
-        return render(request, "tracker/_movie_grid.html", context)
+        response = render(request, "tracker/_movie_grid.html", context)
+        return patch_response(request, response, validators, GRID_VARY)
+
+    # --- Filter data for dropdowns (cached, see facets.py) ---
+    context.update(grid["selected"])
+    context.update(get_facet_options())
 
     # --- Full page render ---
-    return render(request, "tracker/movie_list.html", context)
+    response = render(request, "tracker/movie_list.html", context)
+    return patch_response(request, response, validators, GRID_VARY)
+
+def movie_grid(request):
+    """
+    Bare `_movie_grid.html` fragment for one page of results.
+    Used by the grid's infinite scroll to fetch the page after `cursor`.
+    """
+    context = _grid_page_context(request, filter_movies(request.GET, request.user))
+    return render(request, "tracker/_movie_grid.html", context)
+
+def movie_ids(request):
+    """
+    JSON for one page of the grid: the movie ids in order, each with its
+    card_token, plus the next page's URL and the facet counts. The grid's
+    script fetches cards (movie_cards) only for id/version pairs it hasn't
+    rendered yet. Carries an ETag, so an unchanged result is a 304.
+    """
+    grid = filter_movies(request.GET, request.user)
+    page, next_cursor = _grid_page(request, grid)
+    snippets = _page_snippets(grid["selected"]["q"], page)
+    body = json.dumps({
+        "movies": [[m.id, card_token(m, snippets.get(m.id))] for m in page],
+        "next_url": _next_page_url(request, next_cursor),
+        "facet_counts": grid["facet_counts"],
+    }, separators=(",", ":")).encode()
+
+    etag = f'"{hashlib.md5(body, usedforsecurity=False).hexdigest()}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(body, content_type="application/json")
+    response["ETag"] = etag
+    # Depends on who's asking (seen filter, seen controls); always revalidate
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ["Cookie"])
+    return response
+
+MAX_CARDS_PER_REQUEST = 100
+
+def movie_cards(request):
+    """
+    Rendered cards for `ids` (comma-separated), as
+    {"cards": [{"id", "version", "html"}]}. Takes the grid's query string
+    too, so search snippets match the results they were listed in.
+    """
+    ids = [i for i in map(int_or_none, request.GET.get("ids", "").split(",")) if i is not None]
+    if len(ids) > MAX_CARDS_PER_REQUEST:
+        raise BadRequest(f"At most {MAX_CARDS_PER_REQUEST} cards per request.")
+
+    by_id = Movie.objects.in_bulk(ids)
+    page = [by_id[i] for i in dict.fromkeys(ids) if i in by_id]
+    q = request.GET.get("q", "").strip()
+    snippets = _page_snippets(q, page)
+
+    template = get_template("tracker/_movie_card.html")
+    cards = [
+        {
+            "id": card["movie"].id,
+            "version": card["version"],
+            "html": template.render({
+                "card": card,
+                "movie": card["movie"],
+                "viewing": card["viewing"],
+                "snippet": card["snippet"],
+            }, request),
+        }
+        for card in _render_page_cards(request, page, snippets)
+    ]
+    return JsonResponse({"cards": cards})
+
+def _check_export_format(fmt):
+    if fmt not in EXPORT_FORMATS:
+        raise Http404(f"No {fmt!r} export; try one of {', '.join(EXPORT_FORMATS)}.")
+
+def export_movies(request, fmt):
+    """
+    Every movie matching the grid's query string (not just one page),
+    streamed as CSV or JSON Lines in the grid's order. See export.py.
+    """
+    _check_export_format(fmt)
+    grid = filter_movies(request.GET, request.user)
+    movies = movies_in_order(grid["movies"], grid["ordering"], grid["ranked_ids"])
+    return streaming_export(encode_lines(map(movie_record, movies), fmt, MOVIE_COLUMNS), fmt, "movies")
 
-def movie_detail(request, movie_id):
-    movie = get_object_or_404(
-        Movie.objects.prefetch_related(
-            "categories",
-            "streaming_services",
-            "viewing_set__user",
-        ),
-        pk=movie_id,
+@login_required
+def export_viewings(request, fmt):
+    """The current member's viewings of the movies matching the grid's query string."""
+    _check_export_format(fmt)
+    movies = filter_movies(request.GET, request.user)["movies"]
+    viewings = viewings_in_order(Viewing.objects.filter(user=request.user, movie__in=movies))
+    return streaming_export(encode_lines(map(viewing_record, viewings), fmt, VIEWING_COLUMNS), fmt, "viewings")
+
+def _detail_movies():
+    return Movie.objects.select_related("recommended_by").prefetch_related(
+        "categories",
+        "streaming_services",
+        Prefetch("viewing_set", queryset=Viewing.objects.select_related("user")),
     )
 
-    current_user_viewing = None
-    form = None
+def _similar_to(movie_id):
+    # Precomputed neighbours (see similarity.py), one indexed query
+    return SimilarMovie.objects.filter(movie_id=movie_id).select_related("similar")
 
+def _detail_context(request, movie, similar_movies, form=None):
+    # Split the prefetched viewings rather than querying them again
+    viewings = movie.viewing_set.all()
+    current_user_viewing = None
     if request.user.is_authenticated:
-        try:
-            current_user_viewing = Viewing.objects.get(
-                user=request.user,
-                movie=movie,
-            )
-        except Viewing.DoesNotExist:
-            current_user_viewing = None
-
-        if request.method == "POST":
-            form = ViewingForm(request.POST, instance=current_user_viewing)
-            if form.is_valid():
-                viewing = form.save(commit=False)
-                viewing.user = request.user
-                viewing.movie = movie
-                viewing.save()
-                return redirect("movie_detail", movie_id=movie.id)
-        else:
+        current_user_viewing = next((v for v in viewings if v.user_id == request.user.id), None)
+        if form is None:
             form = ViewingForm(instance=current_user_viewing)
+    return {
+        "movie": movie,
+        "current_user_viewing": current_user_viewing,
+        "other_viewings": [v for v in viewings if v.user_id != request.user.id],
+        "similar_movies": similar_movies,
+        "form": form,
+    }
 
-    other_viewings = movie.viewing_set.exclude(
-        user=request.user
-    ) if request.user.is_authenticated else movie.viewing_set.all()
+def movie_detail(request, movie_id):
+    # Unchanged since the client's copy: a 304 from one query (see http_cache.py)
+    validators = detail_validators(request, movie_id)
+    response = conditional_response(request, validators)
+    if response is not None:
+        return response
 
-    return render(
+    movie = get_object_or_404(_detail_movies(), pk=movie_id)
+
+    form = None
+    if request.user.is_authenticated and request.method == "POST":
+        current_user_viewing = next(
+            (v for v in movie.viewing_set.all() if v.user_id == request.user.id), None
+        )
+        form = ViewingForm(request.POST, instance=current_user_viewing)
+        if form.is_valid():
+            viewing = form.save(commit=False)
+            viewing.user = request.user
+            viewing.movie = movie
+            viewing.save()
+            return redirect("movie_detail", movie_id=movie.id)
+
+    similar_movies = [s.similar for s in _similar_to(movie.id)]
+    response = render(
         request,
         "tracker/movie_detail.html",
-        {
-            "movie": movie,
-            "current_user_viewing": current_user_viewing,
-            "other_viewings": other_viewings,
-            "form": form,
-        },
+        _detail_context(request, movie, similar_movies, form),
     )
+    return patch_response(request, response, validators)
 
 @login_required
 def add_movie(request):
@@ -263,60 +346,161 @@ def toggle_seen(request, movie_id):
 
     return redirect("movie_list")
 
-def movie_suggest(request):
-    categories = Category.objects.all().order_by("name")
+MAX_SEEN_BATCH = 500
 
-    writers = Movie.objects.exclude(writer__exact="").values_list(
-        "writer", flat=True
-    ).distinct().order_by("writer")
+@login_required
+@require_POST
+def toggle_seen_batch(request):
+    """
+    Mark the comma-separated `ids` seen (seen=1) or unseen (seen=0) in one
+    transaction (see seen.py). Returns {"movies": {id: "seen" or "unseen"}}
+    for the ids that name movies.
+    """
+    ids = [i for i in map(int_or_none, request.POST.get("ids", "").split(",")) if i is not None]
+    if len(ids) > MAX_SEEN_BATCH:
+        raise BadRequest(f"At most {MAX_SEEN_BATCH} movies per request.")
+    if request.POST.get("seen") not in ("0", "1"):
+        raise BadRequest("seen must be 0 or 1.")
+
+    states = set_seen(request.user, ids, request.POST["seen"] == "1")
+    return JsonResponse({
+        "movies": {movie_id: "seen" if seen else "unseen" for movie_id, seen in states.items()}
+    })
 
-    directors = Movie.objects.exclude(director__exact="").values_list(
-        "director", flat=True
-    ).distinct().order_by("director")
+RECOMMENDATIONS_ON_SUGGEST = 5
 
-    starring_set = set()
-    for s in Movie.objects.exclude(starring__exact="").values_list("starring", flat=True):
-        starring_set.update(a.strip() for a in s.split(","))
+def _recommendations_for(user):
+    # Precomputed by recommender.py; skip anything seen since the last refresh
+    return (
+        Recommendation.objects.filter(user=user)
+        .exclude(movie__viewing__user=user)
+        .select_related("movie")
+    )
 
-    suggested_movie = None
+@login_required
+def movie_recommendations(request):
+    """The current member's top predicted unseen movies, as JSON."""
+    return JsonResponse({
+        "recommendations": [
+            {
+                "id": r.movie.id,
+                "title": r.movie.title,
+                "year": r.movie.year,
+                "score": round(r.score, 2),
+                "url": reverse("movie_detail", args=[r.movie.id]),
+            }
+            for r in _recommendations_for(request.user)
+        ]
+    })
 
-    if request.method == "POST":
-        movies = Movie.objects.all()
-
-        if request.user.is_authenticated:
-            viewed_ids = Viewing.objects.filter(
-                user=request.user
-            ).values_list("movie_id", flat=True)
-
-            seen_filter = request.POST.get("seen_filter", "unseen")
-            if seen_filter == "unseen":
-                movies = movies.exclude(id__in=viewed_ids)
-            elif seen_filter == "seen":
-                movies = movies.filter(id__in=viewed_ids)
-
-        selected_categories = request.POST.getlist("categories")
-        if selected_categories:
-            movies = movies.filter(categories__id__in=selected_categories).distinct()
-
-        if request.POST.get("writer"):
-            movies = movies.filter(writer=request.POST["writer"])
-        if request.POST.get("director"):
-            movies = movies.filter(director=request.POST["director"])
-        if request.POST.get("starring"):
-            movies = movies.filter(starring__icontains=request.POST["starring"])
-
-        movies = list(movies)
-        if movies:
-            suggested_movie = random.choice(movies)
+def _pick_suggestions(request):
+    """The suggest form's picks for a POST: (suggestions, form values)."""
+    form_values = {"seen_filter": "unseen", "mode": "uniform", "count": 1}
+    if request.method != "POST":
+        return [], form_values
+
+    movies = Movie.objects.all()
+
+    if request.user.is_authenticated:
+        viewed_ids = Viewing.objects.filter(
+            user=request.user
+        ).values_list("movie_id", flat=True)
+
+        seen_filter = request.POST.get("seen_filter", "unseen")
+        if seen_filter == "unseen":
+            movies = movies.exclude(id__in=viewed_ids)
+        elif seen_filter == "seen":
+            movies = movies.filter(id__in=viewed_ids)
+        form_values["seen_filter"] = seen_filter
+
+    selected_categories = [
+        i for i in map(int_or_none, request.POST.getlist("categories")) if i is not None
+    ]
+    if selected_categories:
+        # A subquery rather than a join, so no .distinct() is needed
+        movies = movies.filter(id__in=Movie.categories.through.objects.filter(
+            category_id__in=selected_categories
+        ).values("movie_id"))
+
+    if request.POST.get("writer"):
+        movies = filter_by_person(movies, MovieCredit.Role.WRITER, request.POST["writer"])
+    if request.POST.get("director"):
+        movies = filter_by_person(movies, MovieCredit.Role.DIRECTOR, request.POST["director"])
+    if request.POST.get("starring"):
+        movies = filter_by_person(movies, MovieCredit.Role.STARRING, request.POST["starring"])
+
+    # --- Pick (see suggest.py) ---
+    mode = request.POST.get("mode", "uniform")
+    if mode not in SUGGESTION_MODES:
+        mode = "uniform"
+    count = min(max(int_or_none(request.POST.get("count")) or 1, 1), MAX_SUGGESTIONS)
+    streaming_ids = [
+        i for i in map(int_or_none, request.POST.getlist("streaming_services")) if i is not None
+    ]
+    weight = suggestion_weight(mode, request.user, streaming_ids)
+
+    suggestions = pick_movies(movies, count, weight)
+    prefetch_related_objects(suggestions, "recommended_by", "categories", "streaming_services")
+
+    form_values.update({
+        "selected_categories": selected_categories,
+        "writer_filter": request.POST.get("writer", ""),
+        "director_filter": request.POST.get("director", ""),
+        "starring_filter": request.POST.get("starring", ""),
+        "mode": mode,
+        "count": count,
+        "selected_streaming_services": streaming_ids,
+    })
+    return suggestions, form_values
+
+def _suggest_context(facet_options, suggestions, form_values, recommendations):
+    return {
+        "categories": facet_options["categories"],
+        "writers": facet_options["writers"],
+        "directors": facet_options["directors"],
+        "starring_list": facet_options["starring_list"],
+        "streaming_services": facet_options["streaming_services"],
+        "modes": SUGGESTION_MODES,
+        "max_suggestions": MAX_SUGGESTIONS,
+        "suggestions": suggestions,
+        "recommendations": recommendations,
+        **form_values,
+    }
 
+def movie_suggest(request):
+    facet_options = get_facet_options()
+    suggestions, form_values = _pick_suggestions(request)
+    recommendations = (
+        _recommendations_for(request.user)[:RECOMMENDATIONS_ON_SUGGEST]
+        if request.user.is_authenticated else []
+    )
     return render(
         request,
         "tracker/movie_suggest.html",
-        {
-            "categories": categories,
-            "writers": writers,
-            "directors": directors,
-            "starring_list": sorted(starring_set),
-            "suggested_movie": suggested_movie,
-        },
+        _suggest_context(facet_options, suggestions, form_values, recommendations),
     )
+
+def _stats_member(request):
+    # ?member=<username> for one member's numbers, else the whole club's
+    username = request.GET.get("member", "")
+    return get_object_or_404(User, username=username) if username else None
+
+def club_stats(request):
+    """
+    The stats dashboard. Every number comes from the StatRollup totals
+    (see stats.py), so the page costs the same however long the history.
+    """
+    member = _stats_member(request)
+    stats = stats_for(member)
+    return render(request, "tracker/stats.html", {
+        "stats": stats,
+        "member": member,
+        "members": stats_members(),
+        # Bar lengths are relative to the busiest month / commonest rating
+        "busiest_month": max((m["viewings"] for m in stats["per_month"]), default=0),
+        "commonest_rating": max((r["count"] for r in stats["rating_distribution"]), default=0),
+    })
+
+def club_stats_data(request):
+    """The dashboard's numbers as JSON, for the club or ?member=<username>."""
+    return JsonResponse(stats_for(_stats_member(request)))